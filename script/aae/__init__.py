@@ -0,0 +1,19 @@
+'''
+Adversarial autoencoders (basic, supervised and semi-supervised) on MNIST.
+
+Importing the package has no side effects: the submodules, and torch or
+matplotlib with them, are only imported on first attribute access, e.g.
+aae.semisupervised.generate_model(...).
+'''
+import importlib
+
+__all__ = ['autotune', 'basic', 'checkpoint', 'cli', 'config', 'data', 'distill', 'equivalence', 'evaluation',
+           'export', 'generate', 'latent_cache', 'latent_index', 'memory', 'metrics', 'networks', 'online',
+           'sampler', 'schedule', 'scoring', 'semisupervised', 'shards', 'style', 'supervised',
+           'utils', 'viz', 'weights']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,239 @@
+'''
+Thread-count and batch-size autotuner.
+
+Every (intra-op threads, inter-op threads) pair is benchmarked in a fresh
+interpreter, because torch only accepts the inter-op thread count before
+any parallel work has run. Each of them times the real training epoch of
+the chosen mode on synthetic batches, plus a Q and P forward pass, for
+every batch size. The DataLoader worker count is timed on the real
+datasets. The fastest configuration is saved to a per-host profile that
+the aae entry points apply at startup (the training batch size only on
+request, see cli._tuned_params).
+'''
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+DEFAULT_PROFILE = os.path.join(os.path.expanduser('~'), '.cache', 'aae', 'profile.json')
+
+# Divisors of the 3000 labeled and 47000 unlabeled samples, see train()
+TRAIN_BATCH_SIZES = (50, 100, 200, 500, 1000)
+INFERENCE_BATCH_SIZES = (100, 1000, 10000)
+LOADER_WORKERS = (0, 1, 2, 4)
+
+
+def profile_path():
+    return os.environ.get('AAE_PROFILE', DEFAULT_PROFILE)
+
+
+def host_key():
+    '''
+    Profiles are only valid on the host, and torch build, they were tuned on
+    '''
+    import torch
+    return '{}-{}cpu-torch{}'.format(platform.node(), multiprocessing.cpu_count(), torch.__version__)
+
+
+####################
+# Profile
+####################
+def load_profile(path=None):
+    '''
+    return: the profile of this host, or None when it was never tuned
+    '''
+    path = path or profile_path()
+    try:
+        with open(path) as f:
+            return json.load(f).get(host_key())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_profile(profile, path=None):
+    path = path or profile_path()
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = json.load(f)
+    profiles[host_key()] = profile
+    if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        json.dump(profiles, f, indent=2, sort_keys=True)
+
+
+def apply_profile(profile, section):
+    '''
+    Sets the torch thread counts of the 'train' or 'inference' section of
+    profile. The inter-op count is skipped when torch already started its
+    inter-op pool.
+    return: the section, or an empty dict without a profile
+    '''
+    import torch
+    if not profile or section not in profile:
+        return {}
+    config = profile[section]
+    torch.set_num_threads(config['num_threads'])
+    try:
+        torch.set_num_interop_threads(config['num_interop_threads'])
+    except RuntimeError:
+        pass
+    return config
+
+
+####################
+# Benchmarks
+####################
+def _synthetic_loaders(params, batch_size, steps):
+    import torch
+    X = torch.rand(batch_size * steps, 1, 28, 28)
+    labels = torch.randint(0, params['n_classes'], (batch_size * steps,))
+    labeled = torch.utils.data.TensorDataset(X, labels)
+    unlabeled = torch.utils.data.TensorDataset(X, torch.full_like(labels, -1))
+    labeled_loader = torch.utils.data.DataLoader(labeled, batch_size=batch_size)
+    unlabeled_loader = torch.utils.data.DataLoader(unlabeled, batch_size=batch_size)
+    return labeled_loader, unlabeled_loader, labeled_loader
+
+
+def benchmark_train(mode, params, batch_size, steps=20):
+    '''
+    return: training samples per second of train_epoch
+    '''
+    from .cli import MODES
+    module = importlib.import_module('.' + MODES[mode], __package__)
+    params = dict(params, train_batch_size=batch_size, valid_batch_size=batch_size)
+    nets = module.create_networks(params)
+    solvers = module.create_solvers(nets)
+
+    loaders = _synthetic_loaders(params, batch_size, 2)
+    module.train_epoch(nets, solvers, *loaders, params=params)
+    loaders = _synthetic_loaders(params, batch_size, steps)
+    metrics = module.train_epoch(nets, solvers, *loaders, params=params)
+    return metrics.summary(0)['samples_per_sec']
+
+
+def benchmark_inference(mode, params, batch_size, steps=10):
+    '''
+    return: samples per second of a Q and P forward pass
+    '''
+    import torch
+    from .cli import MODES
+    from .generate import inference_mode
+    module = importlib.import_module('.' + MODES[mode], __package__)
+    nets = module.create_networks(params)
+    Q, P = nets['Q'].eval(), nets['P'].eval()
+    X = torch.rand(batch_size, params['X_dim'])
+    if params['cuda']:
+        X = X.cuda()
+
+    with inference_mode():
+        for step in range(steps + 1):
+            if step == 1:
+                start = time.time()
+            z = Q(X)
+            if isinstance(z, tuple):
+                z = torch.cat(z, 1)
+            elif P.lin1.in_features > z.size(1):
+                z = torch.cat((torch.zeros(batch_size, P.lin1.in_features - z.size(1), device=z.device), z), 1)
+            P(z).sum().item()
+    return batch_size * steps / (time.time() - start)
+
+
+def benchmark_loader(dataset, batch_size, num_workers, max_batches=100):
+    '''
+    return: samples per second served by a DataLoader over dataset
+    '''
+    import torch
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=True,
+                                         num_workers=num_workers)
+    n = 0
+    start = time.time()
+    for i, (X, _) in enumerate(loader):
+        n += len(X)
+        if i + 1 == max_batches:
+            break
+    return n / (time.time() - start)
+
+
+def _thread_worker(config):
+    '''
+    Runs in a fresh interpreter: python -m aae.autotune '<json config>'
+    '''
+    import torch
+    torch.set_num_interop_threads(config['num_interop_threads'])
+    torch.set_num_threads(config['num_threads'])
+    from .config import default_params
+    params = default_params()
+
+    result = {'train': {}, 'inference': {}}
+    for batch_size in config['train_batch_sizes']:
+        result['train'][batch_size] = benchmark_train(config['mode'], params, batch_size, config['steps'])
+    for batch_size in config['inference_batch_sizes']:
+        result['inference'][batch_size] = benchmark_inference(config['mode'], params, batch_size)
+    print(json.dumps(result))
+
+
+def _thread_counts(n):
+    counts, i = [], 1
+    while i < n:
+        counts.append(i)
+        i *= 2
+    return counts + [n]
+
+
+def autotune(mode='semi', data_path='../data/', steps=20, path=None,
+             train_batch_sizes=TRAIN_BATCH_SIZES, inference_batch_sizes=INFERENCE_BATCH_SIZES):
+    '''
+    Benchmarks the thread, batch-size and loader-worker combinations on this
+    host and saves the fastest ones to the profile.
+    return: the profile
+    '''
+    cpus = multiprocessing.cpu_count()
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    best = {'train': (0., None), 'inference': (0., None)}
+    for num_threads in _thread_counts(cpus):
+        for num_interop_threads in sorted(set([1, max(1, cpus // num_threads)])):
+            config = {'mode': mode, 'steps': steps,
+                      'num_threads': num_threads, 'num_interop_threads': num_interop_threads,
+                      'train_batch_sizes': list(train_batch_sizes),
+                      'inference_batch_sizes': list(inference_batch_sizes)}
+            out = subprocess.check_output([sys.executable, '-m', 'aae.autotune', json.dumps(config)],
+                                          cwd=package_dir)
+            result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+            for section in ('train', 'inference'):
+                for batch_size, speed in result[section].items():
+                    print('{:<9} threads={:<3} interop={:<3} batch={:<6} {:>10.1f} samples/s'.format(
+                        section, num_threads, num_interop_threads, batch_size, speed))
+                    if speed > best[section][0]:
+                        best[section] = (speed, {'num_threads': num_threads,
+                                                 'num_interop_threads': num_interop_threads,
+                                                 'batch_size': int(batch_size),
+                                                 'samples_per_sec': speed})
+
+    profile = {'mode': mode, 'train': best['train'][1], 'inference': best['inference'][1]}
+
+    # DataLoader workers, on the real data when it is available
+    labeled_file = os.path.join(data_path, 'train_labeled.p')
+    if os.path.exists(labeled_file):
+        import pickle
+        with open(labeled_file, 'rb') as f:
+            dataset = pickle.load(f)
+        speeds = dict((w, benchmark_loader(dataset, profile['train']['batch_size'], w))
+                      for w in LOADER_WORKERS)
+        for num_workers, speed in sorted(speeds.items()):
+            print('loader    workers={:<3} {:>10.1f} samples/s'.format(num_workers, speed))
+        profile['num_workers'] = max(speeds, key=speeds.get)
+
+    save_profile(profile, path)
+    print('Saved profile to {}'.format(path or profile_path()))
+    return profile
+
+
+if __name__ == '__main__':
+    _thread_worker(json.loads(sys.argv[1]))
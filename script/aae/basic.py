@@ -0,0 +1,282 @@
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.autograd import Variable
+
+from .checkpoint import Checkpointer
+from .metrics import EpochMetrics, MetricLogger, track_phase
+from .networks import D_net_gauss, build_decoder, build_encoder
+from .sampler import PrioritizedSampler
+from .schedule import AdversarialSchedule
+from .utils import save_networks, zero_grad
+
+TINY = 1e-15
+# Standard deviation of the Gaussian prior imposed on the latent code
+PRIOR_STD = 5.
+
+
+def create_networks(params):
+    '''
+    return: dict with the encoder Q, decoder P and discriminator D_gauss
+    '''
+    nets = {'Q': build_encoder(params),
+            'P': build_decoder(params),
+            'D_gauss': D_net_gauss(params['z_dim'], params['N'])}
+    if params['cuda']:
+        for net in nets.values():
+            net.cuda()
+    return nets
+
+
+def create_solvers(nets):
+    '''
+    return: dict with the optimizers of the networks of create_networks
+    '''
+    Q, P, D_gauss = nets['Q'], nets['P'], nets['D_gauss']
+
+    # Set learning rates
+    gen_lr = 0.0001
+    reg_lr = 0.00005
+
+    # Set optimizators
+    return {'P_decoder': optim.Adam(P.parameters(), lr=gen_lr),
+            'Q_encoder': optim.Adam(Q.parameters(), lr=gen_lr),
+            'Q_generator': optim.Adam(Q.parameters(), lr=reg_lr),
+            'D_gauss_solver': optim.Adam(D_gauss.parameters(), lr=reg_lr)}
+
+
+def report_loss(record):
+    '''
+    Print the epoch means of the losses and the numbers of regularization updates
+    '''
+    nan = float('nan')
+    print('Epoch-{}; D_loss_gauss: {:.4}; G_loss: {:.4}; recon_loss: {:.4}; '
+          'D/G steps: {}/{}; {:.1f} samples/s'.format(record['epoch'],
+                                                      record.get('D_loss_gauss', nan),
+                                                      record.get('G_loss', nan),
+                                                      record['recon_loss'],
+                                                      record.get('D_steps', 0),
+                                                      record.get('G_steps', 0),
+                                                      record['samples_per_sec']))
+
+
+####################
+# Train procedure
+####################
+def reconstruction_phase(P, Q, X, P_decoder, Q_encoder):
+    z_sample = Q(X)
+    X_sample = P(z_sample)
+    recon_loss = F.binary_cross_entropy(X_sample + TINY, X + TINY)
+
+    recon_loss.backward()
+    P_decoder.step()
+    Q_encoder.step()
+    return recon_loss
+
+
+def weighted_reconstruction_phase(P, Q, X, weights, P_decoder, Q_encoder):
+    '''
+    Reconstruction phase with per-sample importance weights
+    return: the weighted loss and the unweighted loss of every sample
+    '''
+    z_sample = Q(X)
+    X_sample = P(z_sample)
+
+    sample_loss = F.binary_cross_entropy(X_sample + TINY, X + TINY, reduction='none').mean(1)
+    recon_loss = (sample_loss * weights).mean()
+    recon_loss.backward()
+    P_decoder.step()
+    Q_encoder.step()
+    return recon_loss, sample_loss
+
+
+def discriminator_phase(Q, D_gauss, X, D_gauss_solver, params):
+    Q.eval()
+    z_real_gauss = Variable(torch.randn(X.size(0), params['z_dim']) * PRIOR_STD)
+    if params['cuda']:
+        z_real_gauss = z_real_gauss.cuda()
+
+    z_fake_gauss = Q(X)
+
+    D_real_gauss = D_gauss(z_real_gauss)
+    D_fake_gauss = D_gauss(z_fake_gauss)
+
+    D_loss = -torch.mean(torch.log(D_real_gauss + TINY) + torch.log(1 - D_fake_gauss + TINY))
+
+    D_loss.backward()
+    D_gauss_solver.step()
+    return D_loss
+
+
+def generator_phase(Q, D_gauss, X, Q_generator):
+    Q.train()
+    z_fake_gauss = Q(X)
+
+    D_fake_gauss = D_gauss(z_fake_gauss)
+    G_loss = -torch.mean(torch.log(D_fake_gauss + TINY))
+
+    G_loss.backward()
+    Q_generator.step()
+    return G_loss
+
+
+def regularization_phase(Q, D_gauss, X, Q_generator, D_gauss_solver, params, schedule, metrics=None):
+    '''
+    The discriminator and generator updates the schedule asks for
+    return: dict with the last loss of every phase that ran
+    '''
+    d_steps, g_steps = schedule.next_batch()
+    losses = {}
+    for _ in range(d_steps):
+        losses['D_loss_gauss'] = discriminator_phase(Q, D_gauss, X, D_gauss_solver, params)
+        schedule.observe(losses['D_loss_gauss'])
+        zero_grad(Q, D_gauss)
+    for _ in range(g_steps):
+        losses['G_loss'] = generator_phase(Q, D_gauss, X, Q_generator)
+        zero_grad(Q, D_gauss)
+    # The discriminator phase leaves the encoder in eval mode
+    Q.train()
+    if metrics is not None:
+        metrics.count(D_steps=d_steps, G_steps=g_steps)
+    return losses
+
+
+def train(P, Q, D_gauss, P_decoder, Q_encoder, Q_generator, D_gauss_solver, data_loader, params, metrics=None,
+          schedule=None):
+    '''
+    Train procedure for one epoch. schedule is the AdversarialSchedule of
+    the regularization phase (default: built from params['schedule']).
+    return: the EpochMetrics accumulated over every batch
+    '''
+    if metrics is None:
+        metrics = EpochMetrics(params.get('track_memory', False))
+    if schedule is None:
+        schedule = AdversarialSchedule.from_params(params)
+    train_batch_size = params['train_batch_size']
+    # Set the networks in train mode (apply dropout when needed)
+    Q.train()
+    P.train()
+    D_gauss.train()
+    sampler = data_loader.batch_sampler
+    prioritized = isinstance(sampler, PrioritizedSampler)
+
+    # The batch size has to be a divisor of the size of the dataset or it will return
+    # invalid samples
+    for X, target in data_loader:
+
+        # Load batch and normalize samples to be between 0 and 1
+        X = X * 0.3081 + 0.1307
+        X.resize_(train_batch_size, params['X_dim'])
+        X, target = Variable(X), Variable(target)
+        if params['cuda']:
+            X, target = X.cuda(), target.cuda()
+
+        # Init gradients
+        zero_grad(P, Q, D_gauss)
+
+        #######################
+        # Reconstruction phase
+        #######################
+        with metrics.phase('reconstruction'):
+            if prioritized:
+                indices, weights = sampler.pop()
+                if params['cuda']:
+                    weights = weights.cuda()
+                recon_loss, sample_loss = weighted_reconstruction_phase(P, Q, X, weights, P_decoder, Q_encoder)
+                sampler.update(indices, sample_loss)
+            else:
+                recon_loss = reconstruction_phase(P, Q, X, P_decoder, Q_encoder)
+        zero_grad(P, Q, D_gauss)
+
+        #######################
+        # Regularization phase
+        #######################
+        with metrics.phase('regularization'):
+            losses = regularization_phase(Q, D_gauss, X, Q_generator, D_gauss_solver, params, schedule, metrics)
+
+        metrics.update(batch_size=train_batch_size, recon_loss=recon_loss, **losses)
+
+        zero_grad(P, Q, D_gauss)
+
+    return metrics
+
+
+def train_epoch(nets, solvers, train_labeled_loader, train_unlabeled_loader, valid_loader, params, metrics=None,
+                schedule=None):
+    '''
+    train() with the networks of create_networks and the optimizers of
+    create_solvers, on the unlabeled loader
+    '''
+    return train(nets['P'], nets['Q'], nets['D_gauss'],
+                 solvers['P_decoder'], solvers['Q_encoder'], solvers['Q_generator'], solvers['D_gauss_solver'],
+                 train_unlabeled_loader, params, metrics, schedule)
+
+
+def train_step(nets, solvers, X, target, params, metrics=None, schedule=None):
+    '''
+    One training step outside of an epoch, e.g. for online training.
+    X: (batch, X_dim) samples between 0 and 1, target: their labels
+    schedule: the AdversarialSchedule to keep across steps (default: one
+    update of each adversarial phase)
+    return: dict with the losses of the step
+    '''
+    P, Q, D_gauss = nets['P'], nets['Q'], nets['D_gauss']
+    Q.train()
+    P.train()
+    D_gauss.train()
+
+    zero_grad(P, Q, D_gauss)
+    with track_phase(metrics, 'reconstruction'):
+        recon_loss = reconstruction_phase(P, Q, X, solvers['P_decoder'], solvers['Q_encoder'])
+    zero_grad(P, Q, D_gauss)
+    if schedule is None:
+        schedule = AdversarialSchedule()
+    with track_phase(metrics, 'regularization'):
+        losses = regularization_phase(Q, D_gauss, X, solvers['Q_generator'], solvers['D_gauss_solver'],
+                                      params, schedule, metrics)
+    zero_grad(P, Q, D_gauss)
+
+    losses['recon_loss'] = recon_loss
+    if metrics is not None:
+        metrics.update(batch_size=X.size(0), **losses)
+    return losses
+
+
+def generate_model(train_labeled_loader, train_unlabeled_loader, valid_loader, params,
+                   log_file=None, tensorboard_dir=None, save_dir=None, mmap_weights=False,
+                   resume=False, checkpoint_every=None):
+    '''
+    Trains the networks for params['epochs'] epochs. With save_dir a
+    checkpoint is kept in save_dir/checkpoint (see checkpoint.py), every
+    checkpoint_every batches too, and resume starts from it.
+    '''
+    torch.manual_seed(10)
+
+    nets = create_networks(params)
+    solvers = create_solvers(nets)
+
+    schedule = AdversarialSchedule.from_params(params)
+    logger = MetricLogger(log_file, tensorboard_dir)
+    checkpointer = Checkpointer(save_dir, nets, solvers, [train_labeled_loader, train_unlabeled_loader, valid_loader],
+                                {'schedule': schedule}, every=checkpoint_every)
+    first_epoch = checkpointer.restore() if resume else 0
+
+    try:
+        with checkpointer:
+            for epoch in range(first_epoch, params['epochs']):
+                checkpointer.epoch = epoch
+                # Trains on the unlabeled loader
+                metrics = train_epoch(nets, solvers, train_labeled_loader, checkpointer.watch(train_unlabeled_loader),
+                                      valid_loader, params, schedule=schedule)
+                record = metrics.summary(epoch)
+                if epoch % 10 == 0:
+                    report_loss(record)
+                logger.write(record)
+                checkpointer.save(epoch + 1, finished=True)
+    finally:
+        logger.close()
+
+    if save_dir is not None:
+        save_networks(nets, save_dir, mmap=mmap_weights)
+
+    return nets['Q'], nets['P']
@@ -0,0 +1,168 @@
+'''
+Training checkpoints that resume an interrupted run where it stopped.
+
+save_dir/checkpoint/ holds the networks, the optimizers, the random
+generators, the state of the AdversarialSchedule (and of any other object
+with state_dict/load_state_dict, e.g. the EarlyStopping), the epoch and the
+state of every loader that has one (ShardedLoader). It is written at the
+end of every epoch and, between two batches, every `every` batches and when
+the process receives SIGINT or SIGTERM, after which training stops with
+KeyboardInterrupt.
+
+Resuming restores all of them. The sharded loaders then skip the batches
+of the epoch already trained on; the loaders over the pickled datasets have
+no state, so a run interrupted in the middle of an epoch restarts that
+epoch with the trained networks.
+'''
+import json
+import os
+import shutil
+import signal
+
+import numpy as np
+import torch
+
+from .utils import existing_dir, replace_dir
+
+CHECKPOINT_DIR = 'checkpoint'
+
+
+class Checkpointer(object):
+    '''
+    nets, solvers: the dicts of create_networks and create_solvers
+    loaders: the loaders of the run, saved in this order
+    states: dict name -> object with state_dict() and load_state_dict()
+    Without save_dir nothing is saved and the loaders are not watched.
+    '''
+    def __init__(self, save_dir, nets, solvers, loaders, states=None, every=None):
+        self.path = None if save_dir is None else os.path.join(save_dir, CHECKPOINT_DIR)
+        self.nets = nets
+        self.solvers = solvers
+        self.loaders = loaders
+        self.states = states or {}
+        self.every = every
+        self.epoch = 0
+        self.stop = False
+        self.handlers = {}
+
+    ####################
+    # Save and restore
+    ####################
+    def save(self, epoch, finished=False):
+        '''
+        Saves the checkpoint of epoch. finished: the passes of the loaders
+        over the previous epoch are over, resume with fresh ones
+        '''
+        if self.path is None:
+            return
+        tmp = self.path + '.tmp'
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for name, net in self.nets.items():
+            torch.save(net.state_dict(), os.path.join(tmp, name + '.pt'))
+        torch.save({'solvers': dict((name, solver.state_dict()) for name, solver in self.solvers.items()),
+                    'torch_rng': torch.get_rng_state(), 'numpy_rng': np.random.get_state()},
+                   os.path.join(tmp, 'solvers.pt'))
+        loaders = [loader.state_dict(finished) if hasattr(loader, 'state_dict') else None
+                   for loader in self.loaders]
+        state = {'epoch': epoch, 'loaders': loaders,
+                 'states': dict((name, obj.state_dict()) for name, obj in self.states.items())}
+        with open(os.path.join(tmp, 'state.json'), 'w') as f:
+            json.dump(state, f)
+        replace_dir(tmp, self.path)
+
+    def restore(self):
+        '''
+        Loads the checkpoint, if any
+        return: the epoch to start from (0 without a checkpoint)
+        '''
+        path = None if self.path is None else existing_dir(self.path)
+        if path is None:
+            return 0
+        for name, net in self.nets.items():
+            net.load_state_dict(torch.load(os.path.join(path, name + '.pt'),
+                                           map_location=lambda storage, loc: storage))
+        saved = torch.load(os.path.join(path, 'solvers.pt'), weights_only=False)
+        for name, solver in self.solvers.items():
+            solver.load_state_dict(saved['solvers'][name])
+        torch.set_rng_state(saved['torch_rng'])
+        np.random.set_state(saved['numpy_rng'])
+        with open(os.path.join(path, 'state.json')) as f:
+            state = json.load(f)
+        for loader, loader_state in zip(self.loaders, state['loaders']):
+            if loader_state is not None and hasattr(loader, 'load_state_dict'):
+                loader.load_state_dict(loader_state)
+        for name, obj in self.states.items():
+            if name in state['states']:
+                obj.load_state_dict(state['states'][name])
+        print('Resuming from {} at epoch {}'.format(path, state['epoch']))
+        return state['epoch']
+
+    ####################
+    # Between batches
+    ####################
+    def watch(self, loader):
+        '''
+        Wraps the loader the training loop draws from first, so that the
+        checkpoints in the middle of an epoch are taken between two batches
+        '''
+        if self.path is None:
+            return loader
+        return _WatchedLoader(loader, self)
+
+    def _between_batches(self, batches):
+        if self.stop:
+            # Before the first batch the loaders may still hold their previous pass
+            self.save(self.epoch, finished=not batches)
+            raise KeyboardInterrupt('Interrupted, checkpoint saved to {}'.format(self.path))
+        if self.every and batches and batches % self.every == 0:
+            self.save(self.epoch)
+
+    def _interrupt(self, signum, frame):
+        if self.stop:
+            # A second signal does not wait for the end of the batch
+            raise KeyboardInterrupt
+        print('Stopping after this batch, send the signal again to stop now')
+        self.stop = True
+
+    def __enter__(self):
+        if self.path is not None:
+            try:
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    self.handlers[signum] = signal.signal(signum, self._interrupt)
+            except ValueError:
+                # Not the main thread: no checkpoints on signals
+                pass
+        return self
+
+    def __exit__(self, *exc):
+        for signum, handler in self.handlers.items():
+            signal.signal(signum, handler)
+        self.handlers = {}
+        return False
+
+
+class _WatchedLoader(object):
+    def __init__(self, loader, checkpointer):
+        self.loader = loader
+        self.checkpointer = checkpointer
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def __iter__(self):
+        batches = 0
+        iterator = iter(self.loader)
+        while True:
+            # Every loader has handed out the batches that were trained on
+            self.checkpointer._between_batches(batches)
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            batches += 1
+            yield batch
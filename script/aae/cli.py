@@ -0,0 +1,430 @@
+'''
+Command line interface: python -m aae {basic,supervised,semi,generate,score,export} ...
+
+Only argparse is imported up front, the training and inference modules
+are imported once the command is known. The thread counts and loader
+workers saved by `python -m aae autotune` are applied automatically, and so
+is the tuned batch size of the inference commands. Training only takes the
+tuned batch size with --tuned-batch-size, since it changes the optimization.
+'''
+import argparse
+import importlib
+
+# Command -> module implementing the training mode
+MODES = {'basic': 'basic', 'supervised': 'supervised', 'semi': 'semisupervised'}
+
+
+def _mode_module(mode):
+    return importlib.import_module('.' + MODES[mode], __package__)
+
+
+def _add_common_arguments(parser, training=False):
+    _add_batch_size_arguments(parser, training)
+    parser.add_argument('--data-path', type=str, default='../data/', metavar='DIR',
+                        help='directory with the datasets of create_datasets.py (default: ../data/)')
+
+
+def _add_batch_size_arguments(parser, training=False):
+    if training:
+        parser.add_argument('--batch-size', type=int, default=None, metavar='N',
+                            help='input batch size (default: 100)')
+        parser.add_argument('--tuned-batch-size', action='store_true',
+                            help='train with the autotuned batch size instead of 100, '
+                                 'which changes the optimization')
+    else:
+        parser.add_argument('--batch-size', type=int, default=None, metavar='N',
+                            help='input batch size (default: autotuned, else 100)')
+    _add_profile_argument(parser)
+
+
+def _add_profile_argument(parser):
+    parser.add_argument('--profile', type=str, default=None, metavar='PATH',
+                        help='autotune profile file (default: $AAE_PROFILE or ~/.cache/aae/profile.json)')
+
+
+def _add_backbone_arguments(parser):
+    parser.add_argument('--backbone', choices=['mlp', 'conv'], default='mlp',
+                        help='encoder and decoder architecture (default: mlp)')
+    parser.add_argument('--conv-width', type=int, default=32, metavar='C',
+                        help='channels of the first conv stage of the conv backbone (default: 32)')
+
+
+def _backbone(args):
+    if not hasattr(args, 'backbone'):
+        return {}
+    return {'backbone': args.backbone, 'conv_width': args.conv_width}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='aae', description='PyTorch adversarial autoencoders on MNIST')
+    commands = parser.add_subparsers(dest='command')
+
+    for mode, help in (('basic', 'train the unsupervised AAE'),
+                       ('supervised', 'train the AAE with a class-conditional decoder'),
+                       ('semi', 'train the semi-supervised AAE')):
+        train_parser = commands.add_parser(mode, help=help)
+        _add_backbone_arguments(train_parser)
+        _add_common_arguments(train_parser, training=True)
+        train_parser.add_argument('--epochs', type=int, default=500, metavar='N',
+                                  help='number of epochs to train (default: 500)')
+        train_parser.add_argument('--log-file', type=str, default=None, metavar='PATH',
+                                  help='append per-epoch metrics to a .jsonl or .csv file')
+        train_parser.add_argument('--tensorboard-dir', type=str, default=None, metavar='DIR',
+                                  help='also write per-epoch metrics as TensorBoard events')
+        train_parser.add_argument('--save-dir', type=str, default=None, metavar='DIR',
+                                  help='save the trained networks to this directory')
+        train_parser.add_argument('--mmap-weights', action='store_true',
+                                  help='also save them as a memory-mappable networks.aaew')
+        train_parser.add_argument('--resume', action='store_true',
+                                  help='resume from the checkpoint of the save dir, kept at every epoch '
+                                       'and on SIGINT/SIGTERM')
+        train_parser.add_argument('--checkpoint-every', type=int, default=None, metavar='N',
+                                  help='also checkpoint every N batches (resumed within the epoch '
+                                       'for sharded datasets)')
+        train_parser.add_argument('--d-steps', type=int, default=1, metavar='K',
+                                  help='discriminator updates per regularized batch (default: 1)')
+        train_parser.add_argument('--g-steps', type=int, default=1, metavar='K',
+                                  help='generator updates per regularized batch (default: 1)')
+        train_parser.add_argument('--reg-every', type=int, default=1, metavar='N',
+                                  help='run the regularization phase every N-th batch (default: 1)')
+        train_parser.add_argument('--d-min-loss', type=float, default=None, metavar='LOSS',
+                                  help='skip discriminator updates while its loss is below LOSS')
+        train_parser.add_argument('--d-max-loss', type=float, default=None, metavar='LOSS',
+                                  help='skip generator updates while the discriminator loss is above LOSS')
+        train_parser.add_argument('--track-memory', action='store_true',
+                                  help='report the peak RSS of every training phase (resets the process peak)')
+        if mode == 'semi':
+            train_parser.add_argument('--eval-every', type=int, default=10, metavar='N',
+                                      help='evaluate the accuracy every N epochs in the background (default: 10)')
+            train_parser.add_argument('--patience', type=int, default=None, metavar='N',
+                                      help='stop after N evaluations without validation accuracy improvement')
+            train_parser.add_argument('--min-delta', type=float, default=0., metavar='ACC',
+                                      help='smallest accuracy gain counted as an improvement (default: 0)')
+            train_parser.add_argument('--joint-batches', action='store_true',
+                                      help='one encoder forward for the labeled and unlabeled batches')
+            train_parser.add_argument('--time-budget', type=float, default=None, metavar='SECONDS',
+                                      help='stop training after this many seconds')
+        if mode != 'supervised':
+            train_parser.add_argument('--prioritized', action='store_true',
+                                      help='sample unlabeled batches by their reconstruction loss')
+            train_parser.add_argument('--priority-alpha', type=float, default=0.6, metavar='A',
+                                      help='priority exponent of the losses (default: 0.6)')
+            train_parser.add_argument('--priority-beta', type=float, default=0.4, metavar='B',
+                                      help='importance-weight exponent (default: 0.4)')
+            train_parser.add_argument('--uniform-mix', type=float, default=0.1, metavar='E',
+                                      help='share of the uniform distribution in the sampling (default: 0.1)')
+        train_parser.set_defaults(func=run_train)
+
+    generate_parser = commands.add_parser('generate', help='decode prior samples to .npy shards')
+    _add_backbone_arguments(generate_parser)
+    generate_parser.add_argument('--mode', choices=sorted(MODES), required=True)
+    generate_parser.add_argument('--model-dir', type=str, required=True, metavar='DIR')
+    generate_parser.add_argument('--out-dir', type=str, required=True, metavar='DIR')
+    generate_parser.add_argument('--n-samples', type=int, default=100000, metavar='N')
+    generate_parser.add_argument('--shard-size', type=int, default=100000, metavar='N')
+    generate_parser.add_argument('--batch-size', type=int, default=10000, metavar='N')
+    generate_parser.add_argument('--seed', type=int, default=0)
+    generate_parser.add_argument('--processes', type=int, default=None, metavar='N')
+    _add_profile_argument(generate_parser)
+    generate_parser.set_defaults(func=run_generate)
+
+    score_parser = commands.add_parser('score', help='reconstruction-error anomaly scores of a dataset')
+    _add_backbone_arguments(score_parser)
+    _add_common_arguments(score_parser)
+    score_parser.add_argument('--mode', choices=sorted(MODES), required=True)
+    score_parser.add_argument('--model-dir', type=str, required=True, metavar='DIR')
+    score_parser.add_argument('--out-dir', type=str, required=True, metavar='DIR')
+    score_parser.add_argument('--split', choices=['labeled', 'unlabeled', 'validation'], default='unlabeled')
+    score_parser.add_argument('--shard-size', type=int, default=10000, metavar='N')
+    score_parser.add_argument('--top-k', type=int, default=100, metavar='K')
+    score_parser.add_argument('--processes', type=int, default=None, metavar='N')
+    score_parser.set_defaults(func=run_score)
+
+    export_parser = commands.add_parser('export', help='write per-sample latents, predictions and scores as columns')
+    _add_backbone_arguments(export_parser)
+    _add_common_arguments(export_parser)
+    export_parser.add_argument('--mode', choices=sorted(MODES), required=True)
+    export_parser.add_argument('--model-dir', type=str, required=True, metavar='DIR')
+    export_parser.add_argument('--out-dir', type=str, required=True, metavar='DIR')
+    export_parser.add_argument('--split', choices=['labeled', 'unlabeled', 'validation'], default='validation')
+    export_parser.add_argument('--format', choices=['npy', 'parquet'], nargs='+', default=['npy'],
+                               help='column-wise .npy files with schema.json and/or records.parquet '
+                                    '(needs pyarrow, default: npy)')
+    export_parser.set_defaults(func=run_export)
+
+    convert_parser = commands.add_parser('convert', help='write networks.aaew for saved .pt networks')
+    _add_backbone_arguments(convert_parser)
+    convert_parser.add_argument('--mode', choices=sorted(MODES), required=True)
+    convert_parser.add_argument('--model-dir', type=str, required=True, metavar='DIR')
+    convert_parser.set_defaults(func=run_convert)
+
+    autotune_parser = commands.add_parser('autotune', help='benchmark thread counts and batch sizes on this host')
+    autotune_parser.add_argument('--mode', choices=sorted(MODES), default='semi')
+    autotune_parser.add_argument('--data-path', type=str, default='../data/', metavar='DIR')
+    autotune_parser.add_argument('--steps', type=int, default=20, metavar='N',
+                                 help='timed training batches per configuration (default: 20)')
+    _add_profile_argument(autotune_parser)
+    autotune_parser.set_defaults(func=run_autotune)
+
+    distill_parser = commands.add_parser('distill', help='distill the semi-supervised encoder into smaller students')
+    _add_backbone_arguments(distill_parser)
+    _add_common_arguments(distill_parser, training=True)
+    distill_parser.add_argument('--model-dir', type=str, required=True, metavar='DIR',
+                                help='directory with the trained semi-supervised networks')
+    distill_parser.add_argument('--hidden', type=str, action='append', default=None, metavar='SIZES',
+                                help='comma separated hidden sizes of a student, repeat for several '
+                                     '(default: 256 and 64)')
+    distill_parser.add_argument('--epochs', type=int, default=20, metavar='N')
+    distill_parser.add_argument('--save-dir', type=str, default=None, metavar='DIR',
+                                help='save the students as Q_student-<sizes>.pt in this directory')
+    distill_parser.set_defaults(func=run_distill)
+
+    online_parser = commands.add_parser('online', help='train continuously on a streaming source')
+    _add_backbone_arguments(online_parser)
+    online_parser.add_argument('--mode', choices=sorted(MODES), default='semi')
+    _add_batch_size_arguments(online_parser, training=True)
+    online_parser.add_argument('--source', type=str, required=True, metavar='SOURCE',
+                               help='dir:<path> to watch a directory of .npy files or '
+                                    'socket:<host>:<port> to listen for producers')
+    online_parser.add_argument('--snapshot-dir', type=str, required=True, metavar='DIR')
+    online_parser.add_argument('--snapshot-every', type=int, default=1000, metavar='STEPS')
+    online_parser.add_argument('--snapshot-interval', type=float, default=None, metavar='SECONDS')
+    online_parser.add_argument('--model-dir', type=str, default=None, metavar='DIR',
+                               help='start from the networks saved in this directory')
+    online_parser.add_argument('--max-steps', type=int, default=None, metavar='N')
+    online_parser.add_argument('--log-file', type=str, default=None, metavar='PATH')
+    online_parser.add_argument('--track-memory', action='store_true',
+                               help='report the peak RSS of every training phase (resets the process peak)')
+    online_parser.set_defaults(func=run_online)
+
+    shard_parser = commands.add_parser('shard', help='convert the pickled datasets to streamable shards')
+    shard_parser.add_argument('--data-path', type=str, default='../data/', metavar='DIR',
+                              help='directory with the datasets of create_datasets.py (default: ../data/)')
+    shard_parser.add_argument('--out-dir', type=str, default=None, metavar='DIR',
+                              help='write <out-dir>/<split>/ (default: the data path, where training picks them up)')
+    shard_parser.add_argument('--shard-size', type=int, default=100000, metavar='N')
+    shard_parser.set_defaults(func=run_shard)
+
+    check_parser = commands.add_parser('check', help='compare an optimized training path with the reference')
+    _add_backbone_arguments(check_parser)
+    check_parser.add_argument('--mode', choices=sorted(MODES), default='semi')
+    check_parser.add_argument('--optimized', type=str, default='reference', metavar='PATH',
+                              help='registered path to compare (default: the reference itself)')
+    check_parser.add_argument('--reference', type=str, default='reference', metavar='PATH',
+                              help='registered path to compare against (default: reference)')
+    check_parser.add_argument('--batch-size', type=int, default=100, metavar='N')
+    check_parser.add_argument('--steps', type=int, default=10, metavar='N')
+    check_parser.add_argument('--seed', type=int, default=0)
+    check_parser.add_argument('--rtol', type=float, default=1e-4)
+    check_parser.add_argument('--atol', type=float, default=1e-6)
+    check_parser.set_defaults(func=run_check)
+
+    memory_parser = commands.add_parser('memory', help='memory breakdown of the networks and peak RSS per phase')
+    _add_backbone_arguments(memory_parser)
+    memory_parser.add_argument('--mode', choices=sorted(MODES), default='semi')
+    memory_parser.add_argument('--batch-size', type=int, default=100, metavar='N')
+    memory_parser.add_argument('--z-dim', type=int, default=2, metavar='N')
+    memory_parser.add_argument('--hidden', type=int, default=1000, metavar='N',
+                               help='hidden units N of every network (default: 1000)')
+    memory_parser.add_argument('--steps', type=int, default=5, metavar='N',
+                               help='synthetic batches run through the training phases (default: 5)')
+    memory_parser.set_defaults(func=run_memory)
+
+    return parser
+
+
+def _tuned_params(args, section, **overrides):
+    '''
+    params with the autotuned settings of section applied, the command line
+    arguments taking precedence. The tuned batch size of the 'train' section
+    is only used with --tuned-batch-size.
+    '''
+    from .autotune import apply_profile, load_profile
+    from .config import default_params
+
+    profile = load_profile(args.profile)
+    tuned = apply_profile(profile, section)
+    batch_size = args.batch_size
+    if batch_size is None and 'batch_size' in tuned and (section != 'train' or args.tuned_batch_size):
+        batch_size = tuned['batch_size']
+        print('Using the autotuned {} batch size {}'.format(section, batch_size))
+    batch_size = batch_size or 100
+    num_workers = profile.get('num_workers') if profile else None
+    overrides = dict(_backbone(args), **overrides)
+    return default_params(train_batch_size=batch_size, valid_batch_size=batch_size,
+                          num_workers=num_workers, **overrides)
+
+
+def _load_networks(args, params, copy=True):
+    from .utils import load_networks
+    nets = _mode_module(args.mode).create_networks(params)
+    return load_networks(nets, args.model_dir, copy=copy)
+
+
+def run_train(args):
+    from .data import load_data
+
+    prioritized = None
+    if getattr(args, 'prioritized', False):
+        prioritized = {'alpha': args.priority_alpha, 'beta': args.priority_beta,
+                       'uniform_mix': args.uniform_mix}
+    schedule = {'d_steps': args.d_steps, 'g_steps': args.g_steps, 'every': args.reg_every,
+                'd_min_loss': args.d_min_loss, 'd_max_loss': args.d_max_loss}
+    evaluation = {}
+    if args.command == 'semi':
+        evaluation = {'eval_every': args.eval_every, 'patience': args.patience,
+                      'min_delta': args.min_delta, 'time_budget': args.time_budget,
+                      'joint_batches': args.joint_batches}
+    if (args.resume or args.checkpoint_every) and args.save_dir is None:
+        raise SystemExit('--resume and --checkpoint-every need --save-dir')
+    params = _tuned_params(args, 'train', epochs=args.epochs, prioritized=prioritized, schedule=schedule,
+                           track_memory=args.track_memory, **evaluation)
+    train_labeled_loader, train_unlabeled_loader, valid_loader = load_data(params, args.data_path)
+    _mode_module(args.command).generate_model(train_labeled_loader, train_unlabeled_loader, valid_loader,
+                                              params, log_file=args.log_file,
+                                              tensorboard_dir=args.tensorboard_dir,
+                                              save_dir=args.save_dir, mmap_weights=args.mmap_weights,
+                                              resume=args.resume, checkpoint_every=args.checkpoint_every)
+
+
+def run_generate(args):
+    from .autotune import apply_profile, load_profile
+    from .config import default_params
+    from .generate import generate
+
+    apply_profile(load_profile(args.profile), 'inference')
+    params = default_params(**_backbone(args))
+    nets = _load_networks(args, params, copy=False)
+    generate(nets['P'], args.n_samples, args.out_dir, params, shard_size=args.shard_size,
+             batch_size=args.batch_size, seed=args.seed, std=_mode_module(args.mode).PRIOR_STD,
+             processes=args.processes)
+
+
+def run_score(args):
+    from .data import load_data, map_dataset
+    from .scoring import score_dataset
+
+    params = _tuned_params(args, 'inference')
+    nets = _load_networks(args, params, copy=False)
+    loaders = dict(zip(['labeled', 'unlabeled', 'validation'], load_data(params, args.data_path)))
+    score_dataset(nets['Q'], nets['P'], map_dataset(loaders[args.split]), args.out_dir,
+                  D_gauss=nets['D_gauss'], shard_size=args.shard_size,
+                  batch_size=params['train_batch_size'],
+                  top_k=args.top_k, processes=args.processes, cuda=params['cuda'])
+
+
+def run_export(args):
+    from .data import load_data, map_dataset
+    from .export import export_records
+
+    params = _tuned_params(args, 'inference')
+    nets = _load_networks(args, params, copy=False)
+    loaders = dict(zip(['labeled', 'unlabeled', 'validation'], load_data(params, args.data_path)))
+    schema = export_records(nets['Q'], nets['P'], map_dataset(loaders[args.split]), args.out_dir,
+                            formats=args.format, batch_size=params['train_batch_size'], cuda=params['cuda'])
+    if schema is not None:
+        print('Wrote {} records: {}'.format(schema['n_samples'],
+                                            ', '.join(column['name'] for column in schema['columns'])))
+
+
+def run_distill(args):
+    import os
+    import torch
+    from .data import load_data
+    from .distill import Student_Q, compare, distill
+
+    args.mode = 'semi'
+    params = _tuned_params(args, 'train')
+    Q = _load_networks(args, params)['Q']
+    train_labeled_loader, train_unlabeled_loader, valid_loader = load_data(params, args.data_path)
+
+    models = [('teacher', Q)]
+    for sizes in args.hidden or ['256', '64']:
+        hidden = [int(n) for n in sizes.split(',')]
+        student = Student_Q(params['X_dim'], hidden, params['z_dim'], params['n_classes'])
+        if params['cuda']:
+            student.cuda()
+        distill(Q, student, train_unlabeled_loader, params, epochs=args.epochs)
+        models.append(('student-' + sizes, student))
+        if args.save_dir is not None:
+            if not os.path.isdir(args.save_dir):
+                os.makedirs(args.save_dir)
+            torch.save(student.state_dict(), os.path.join(args.save_dir, 'Q_student-{}.pt'.format(sizes)))
+    compare(models, valid_loader, params)
+
+
+def run_online(args):
+    from .online import DirectorySource, SocketSource, online_train
+
+    kind, _, location = args.source.partition(':')
+    if kind == 'dir':
+        source = DirectorySource(location)
+    elif kind == 'socket':
+        host, _, port = location.rpartition(':')
+        source = SocketSource(host or '127.0.0.1', int(port))
+    else:
+        raise SystemExit('Unknown source: {}'.format(args.source))
+
+    params = _tuned_params(args, 'train', track_memory=args.track_memory)
+    online_train(args.mode, source, params, args.snapshot_dir, model_dir=args.model_dir,
+                 max_steps=args.max_steps, snapshot_every=args.snapshot_every,
+                 snapshot_interval=args.snapshot_interval, log_file=args.log_file)
+
+
+def run_convert(args):
+    from .config import default_params
+    from .utils import save_networks
+
+    params = default_params(cuda=False, **_backbone(args))
+    save_networks(_load_networks(args, params), args.model_dir, mmap=True)
+
+
+def run_shard(args):
+    import os
+    from .data import SPLITS, load_datasets
+    from .shards import dataset_arrays, write_shards
+
+    out_dir = args.out_dir or args.data_path
+    for split, dataset in zip(SPLITS, load_datasets(args.data_path)):
+        manifest = write_shards(dataset_arrays(dataset), os.path.join(out_dir, split), args.shard_size)
+        print('{}: {} samples in {} shards'.format(split, manifest['n_samples'], len(manifest['shards'])))
+
+
+def run_check(args):
+    from .config import default_params
+    from .equivalence import PATHS, check_equivalence
+
+    for path in (args.optimized, args.reference):
+        if path not in PATHS[args.mode]:
+            raise SystemExit('Unknown path {} for {}, registered: {}'.format(path, args.mode,
+                                                                             ', '.join(sorted(PATHS[args.mode]))))
+    params = default_params(train_batch_size=args.batch_size, valid_batch_size=args.batch_size,
+                            **_backbone(args))
+    passed, _, _ = check_equivalence(args.mode, args.optimized, params, steps=args.steps, seed=args.seed,
+                                     rtol=args.rtol, atol=args.atol, reference=args.reference)
+    if not passed:
+        raise SystemExit(1)
+
+
+def run_memory(args):
+    from .config import default_params
+    from .memory import memory_report
+
+    params = default_params(train_batch_size=args.batch_size, valid_batch_size=args.batch_size,
+                            z_dim=args.z_dim, N=args.hidden, **_backbone(args))
+    memory_report(args.mode, params, steps=args.steps)
+
+
+def run_autotune(args):
+    from .autotune import autotune
+    autotune(args.mode, args.data_path, steps=args.steps, path=args.profile)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    args.func(args)
+    return 0
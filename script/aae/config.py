@@ -0,0 +1,36 @@
+def default_params(**overrides):
+    '''
+    Settings shared by the networks, loaders and training loops.
+    cuda defaults to whether a GPU is available, num_workers (of the training
+    DataLoaders) to 1 with a GPU and 0 without. prioritized holds the
+    alpha, beta and uniform_mix of the PrioritizedSampler of the unlabeled
+    set, or None to sample it uniformly. schedule holds the keyword arguments
+    of the AdversarialSchedule of the regularization phase, or None for one
+    discriminator and one generator update per batch. eval_every, patience,
+    min_delta and time_budget drive the asynchronous evaluation and early
+    stopping of the semi-supervised training (None: no early stopping).
+    backbone selects the encoder and decoder of networks.build_encoder and
+    build_decoder: 'mlp' or 'conv' (image_shape (C, H, W) and conv_width).
+    joint_batches makes the semi-supervised training run the labeled and
+    unlabeled batches through one encoder forward, each loss still stepping
+    its own optimizer. conditioning is how the supervised decoder gets the
+    class: 'embedding' looks up the class columns of its first layer,
+    'onehot' concatenates one-hot codes (same result).
+    track_memory makes the EpochMetrics of the training loops report the
+    peak RSS of every phase.
+    '''
+    params = {'n_classes': 10, 'z_dim': 2, 'X_dim': 784, 'y_dim': 10,
+              'train_batch_size': 100, 'valid_batch_size': 100, 'N': 1000,
+              'epochs': 500, 'cuda': None, 'num_workers': None,
+              'prioritized': None, 'schedule': None,
+              'eval_every': 10, 'patience': None, 'min_delta': 0., 'time_budget': None,
+              'backbone': 'mlp', 'image_shape': (1, 28, 28), 'conv_width': 32,
+              'joint_batches': False, 'conditioning': 'embedding',
+              'track_memory': False}
+    params.update(overrides)
+    if params['cuda'] is None:
+        import torch
+        params['cuda'] = torch.cuda.is_available()
+    if params['num_workers'] is None:
+        params['num_workers'] = 1 if params['cuda'] else 0
+    return params
@@ -0,0 +1,80 @@
+import os
+import pickle
+
+import numpy as np
+import torch
+
+from .sampler import prioritized_loader
+from .shards import ShardedDataset, is_sharded, sharded_loader
+
+SPLITS = ['train_labeled', 'train_unlabeled', 'validation']
+
+
+##################################
+# Load data and create Data loaders
+##################################
+def load_datasets(data_path='../data/'):
+    '''
+    return: the pickled train_labeled, train_unlabeled and validation datasets,
+    with the file each was loaded from as source_file
+    '''
+    datasets = []
+    for split in SPLITS:
+        filename = os.path.join(data_path, split + '.p')
+        with open(filename, 'rb') as f:
+            dataset = pickle.load(f)
+        dataset.source_file = filename
+        datasets.append(dataset)
+    return tuple(datasets)
+
+
+def map_dataset(loader):
+    '''
+    return: the map-style dataset behind loader, the ShardArray of the
+    shards for the loaders of load_data over a sharded dataset
+    '''
+    if isinstance(loader.dataset, ShardedDataset):
+        return loader.dataset.samples()
+    return loader.dataset
+
+
+def load_data(params, data_path='../data/'):
+    '''
+    Loads the datasets written by create_datasets.py, or streams them from
+    data_path/<split>/ when they have been converted to shards. The sharded
+    loaders yield whole batches, use map_dataset() to index or re-batch them.
+    return: train_labeled_loader, train_unlabeled_loader, valid_loader
+    '''
+    print('loading data!')
+    kwargs = {'num_workers': params['num_workers'], 'pin_memory': params['cuda']}
+    train_batch_size = params['train_batch_size']
+    valid_batch_size = params['valid_batch_size']
+
+    if all(is_sharded(os.path.join(data_path, split)) for split in SPLITS):
+        if params.get('prioritized'):
+            raise ValueError('Prioritized sampling needs random access, it does not support sharded datasets')
+        # Unlabeled shards hold -1 labels
+        return tuple(sharded_loader(os.path.join(data_path, split), batch_size, **kwargs)
+                     for split, batch_size in zip(SPLITS, [train_batch_size, train_batch_size,
+                                                           valid_batch_size]))
+
+    trainset_labeled, trainset_unlabeled, validset = load_datasets(data_path)
+    # Set -1 as labels for unlabeled data
+    trainset_unlabeled.train_labels = torch.from_numpy(np.full(len(trainset_unlabeled), -1, dtype='int64'))
+    # Its samples no longer match the file
+    trainset_unlabeled.source_file = None
+
+    train_labeled_loader = torch.utils.data.DataLoader(trainset_labeled,
+                                                       batch_size=train_batch_size,
+                                                       shuffle=True, **kwargs)
+
+    if params.get('prioritized'):
+        train_unlabeled_loader = prioritized_loader(trainset_unlabeled, params, **kwargs)
+    else:
+        train_unlabeled_loader = torch.utils.data.DataLoader(trainset_unlabeled,
+                                                             batch_size=train_batch_size,
+                                                             shuffle=True, **kwargs)
+
+    valid_loader = torch.utils.data.DataLoader(validset, batch_size=valid_batch_size, shuffle=True)
+
+    return train_labeled_loader, train_unlabeled_loader, valid_loader
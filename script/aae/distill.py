@@ -0,0 +1,124 @@
+'''
+Knowledge distillation of the semi-supervised encoder.
+
+A small Student_Q is trained to reproduce the categorical (xcat) and
+Gaussian (xgauss) outputs of a trained Q_net on the unlabeled set, then
+compared with the teacher for accuracy and latency on the validation set.
+'''
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+
+from .generate import inference_mode
+from .utils import classification_accuracy
+
+TINY = 1e-15
+
+
+class Student_Q(nn.Module):
+    '''
+    Encoder with the interface of the semi-supervised Q_net, forward
+    returns (xcat, xgauss), and a configurable stack of hidden layers.
+    '''
+    def __init__(self, X_dim=784, hidden=(256,), z_dim=2, n_classes=10):
+        super(Student_Q, self).__init__()
+        self.hidden = tuple(hidden)
+        sizes = (X_dim,) + self.hidden
+        self.layers = nn.ModuleList([nn.Linear(n_in, n_out) for n_in, n_out in zip(sizes[:-1], sizes[1:])])
+        self.lin3gauss = nn.Linear(sizes[-1], z_dim)
+        self.lin3cat = nn.Linear(sizes[-1], n_classes)
+
+    def forward(self, x):
+        for layer in self.layers:
+            x = F.relu(layer(x))
+        xgauss = self.lin3gauss(x)
+        xcat = F.softmax(self.lin3cat(x), dim=1)
+
+        return xcat, xgauss
+
+
+def distillation_loss(student_out, teacher_out, gauss_weight=1.):
+    '''
+    KL divergence between the categorical codes plus the weighted MSE
+    between the Gaussian codes
+    '''
+    s_cat, s_gauss = student_out
+    t_cat, t_gauss = teacher_out
+    cat_loss = F.kl_div(torch.log(s_cat + TINY), t_cat, reduction='batchmean')
+    gauss_loss = F.mse_loss(s_gauss, t_gauss)
+    return cat_loss + gauss_weight * gauss_loss, cat_loss, gauss_loss
+
+
+def distill(teacher, student, data_loader, params, epochs=20, lr=0.001, gauss_weight=1.):
+    '''
+    Trains student to match the outputs of teacher on the samples of
+    data_loader (the labels are not used)
+    return: student
+    '''
+    teacher.eval()
+    solver = optim.Adam(student.parameters(), lr=lr)
+
+    for epoch in range(epochs):
+        student.train()
+        total, n_batches = 0., 0
+        for X, _ in data_loader:
+            X = X * 0.3081 + 0.1307
+            X = X.view(X.size(0), -1)
+            if params['cuda']:
+                X = X.cuda()
+
+            with inference_mode():
+                teacher_out = teacher(X)
+            loss, _, _ = distillation_loss(student(X), [t.clone() for t in teacher_out], gauss_weight)
+
+            student.zero_grad()
+            loss.backward()
+            solver.step()
+            total += loss.detach()
+            n_batches += 1
+        if epoch % 5 == 0:
+            print('Student {} epoch-{}; distillation loss: {:.4}'.format(
+                student.hidden, epoch, (total / max(n_batches, 1)).item()))
+    return student
+
+
+def latency(Q, params, batch_size, repeat=100):
+    '''
+    return: mean milliseconds of a forward pass of Q on batch_size samples
+    '''
+    Q.eval()
+    X = torch.rand(batch_size, params['X_dim'])
+    if params['cuda']:
+        X = X.cuda()
+    with inference_mode():
+        Q(X)
+        start = time.time()
+        for _ in range(repeat):
+            out = Q(X)
+        out[0].sum().item()
+    return 1000. * (time.time() - start) / repeat
+
+
+def compare(models, valid_loader, params, batch_sizes=(1, 100)):
+    '''
+    Prints the accuracy, size and latency of every (name, encoder) of models
+    return: list with one dict per model
+    '''
+    rows = []
+    for name, Q in models:
+        row = {'model': name,
+               'parameters': sum(p.numel() for p in Q.parameters()),
+               'val_acc': classification_accuracy(Q, valid_loader, params)}
+        for batch_size in batch_sizes:
+            row['ms@{}'.format(batch_size)] = latency(Q, params, batch_size)
+        rows.append(row)
+
+    columns = ['model', 'parameters', 'val_acc'] + ['ms@{}'.format(b) for b in batch_sizes]
+    print(' '.join('{:>16}'.format(c) for c in columns))
+    for row in rows:
+        print(' '.join('{:>16}'.format(row[c] if isinstance(row[c], (str, int)) else '{:.3f}'.format(row[c]))
+                       for c in columns))
+    return rows
@@ -0,0 +1,191 @@
+'''
+Numerical-equivalence and throughput harness for optimized training paths.
+
+A path is a train_step-like function plus parameter overrides. Both paths
+start from the same weights and random state, run the same fixed batches,
+and the losses of every step, the last gradients seen by every optimizer
+and the final parameters are compared within tolerances. The wall time of
+both paths gives the speedup.
+
+Optimized paths are registered below with register_path(mode, name, ...);
+`python -m aae check --mode semi --optimized <name>` runs the comparison.
+'''
+import importlib
+import time
+
+import numpy as np
+import torch
+
+# mode -> name -> (step function or None for module.train_step, params overrides)
+PATHS = {'basic': {'reference': (None, {})},
+         'supervised': {'reference': (None, {})},
+         'semi': {'reference': (None, {})}}
+
+
+def register_path(mode, name, step=None, **params):
+    '''
+    Registers a training path of mode: step(nets, solvers, X, target, params,
+    metrics) defaults to the train_step of the mode, run with params updated
+    by the keyword arguments
+    '''
+    PATHS[mode][name] = (step, params)
+
+
+# The supervised decoder conditioned by one-hot concatenation or by class column lookup
+register_path('supervised', 'onehot', conditioning='onehot')
+register_path('supervised', 'embedding', conditioning='embedding')
+# The labeled and unlabeled rows of a batch through one encoder forward. Both
+# gradients are taken before the reconstruction update, so it is expected to
+# diverge from the reference on mixed batches, see semisupervised.joint_phase
+register_path('semi', 'joint', joint_batches=True)
+
+
+def fixed_batches(params, n_batches, seed=0, labeled_fraction=0.5):
+    '''
+    return: n_batches (X, target) batches of random images between 0 and 1,
+    labeled_fraction of the samples with a label and the others with -1
+    '''
+    rng = np.random.RandomState(seed)
+    batches = []
+    for _ in range(n_batches):
+        size = params['train_batch_size']
+        X = torch.from_numpy(rng.rand(size, params['X_dim']).astype('float32'))
+        target = rng.randint(0, params['n_classes'], size)
+        target[rng.rand(size) >= labeled_fraction] = -1
+        target = torch.from_numpy(target.astype('int64'))
+        if params['cuda']:
+            X, target = X.cuda(), target.cuda()
+        batches.append((X, target))
+    return batches
+
+
+def _record_grads(solvers, grads):
+    '''
+    Makes every optimizer store a copy of its gradients in grads before each step
+    '''
+    def recording(key, optimizer):
+        original = optimizer.step
+
+        def step(*args, **kwargs):
+            params = [p for group in optimizer.param_groups for p in group['params']]
+            grads[key] = [None if p.grad is None else p.grad.detach().clone() for p in params]
+            return original(*args, **kwargs)
+        return step
+
+    for key, optimizer in solvers.items():
+        optimizer.step = recording(key, optimizer)
+
+
+def run_path(mode, name, params, batches, seed=0, initial=None):
+    '''
+    Trains fresh networks of mode along the path name on batches
+    return: dict with the per-step losses, last gradients per optimizer,
+    final parameters, initial state and wall time
+    '''
+    from .cli import MODES
+    module = importlib.import_module('.' + MODES[mode], __package__)
+    step, overrides = PATHS[mode][name]
+    step = step or module.train_step
+    params = dict(params, **overrides)
+
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    nets = module.create_networks(params)
+    if initial is not None:
+        for net_name, net in nets.items():
+            net.load_state_dict(initial[net_name])
+    state = dict((net_name, dict((k, v.clone()) for k, v in net.state_dict().items()))
+                 for net_name, net in nets.items())
+    solvers = module.create_solvers(nets)
+    grads = {}
+    _record_grads(solvers, grads)
+
+    # Same random stream for both paths from the first step on
+    torch.manual_seed(seed + 1)
+    np.random.seed(seed + 1)
+    losses = []
+    if params['cuda']:
+        torch.cuda.synchronize()
+    start = time.time()
+    for X, target in batches:
+        losses.append(step(nets, solvers, X, target, params))
+    if params['cuda']:
+        torch.cuda.synchronize()
+    elapsed = time.time() - start
+
+    losses = [dict((k, float(v)) for k, v in step_losses.items()) for step_losses in losses]
+    final = dict(('{}.{}'.format(net_name, k), v.detach().clone())
+                 for net_name, net in nets.items() for k, v in net.state_dict().items())
+    return {'losses': losses, 'grads': grads, 'params': final, 'initial': state, 'time': elapsed}
+
+
+def _violation(a, b, rtol, atol):
+    '''
+    Largest amount by which |a - b| exceeds atol + rtol * |b| (<= 0 when close)
+    '''
+    a, b = torch.as_tensor(a, dtype=torch.float64), torch.as_tensor(b, dtype=torch.float64)
+    return ((a - b).abs() - atol - rtol * b.abs()).max().item()
+
+
+def compare(reference, optimized, rtol=1e-4, atol=1e-6):
+    '''
+    return: dict check -> (largest absolute difference, whether it is within tolerance)
+    '''
+    report = {}
+    if len(reference['losses']) != len(optimized['losses']):
+        report['loss/steps'] = (float('inf'), False)
+
+    def check(name, a, b):
+        if a is None and b is None:
+            # A parameter without a gradient in both paths
+            report[name] = (0., True)
+            return
+        if a is None or b is None or torch.as_tensor(a).shape != torch.as_tensor(b).shape:
+            report[name] = (float('inf'), False)
+            return
+        diff = (torch.as_tensor(a, dtype=torch.float64) - torch.as_tensor(b, dtype=torch.float64)).abs().max().item()
+        report[name] = (diff, _violation(a, b, rtol, atol) <= 0)
+
+    for i, (ref_losses, opt_losses) in enumerate(zip(reference['losses'], optimized['losses'])):
+        for key in sorted(set(ref_losses) | set(opt_losses)):
+            check('loss/{}/step{}'.format(key, i), opt_losses.get(key), ref_losses.get(key))
+    for key in sorted(set(reference['grads']) | set(optimized['grads'])):
+        ref_grads, opt_grads = reference['grads'].get(key), optimized['grads'].get(key)
+        if ref_grads is None or opt_grads is None or len(ref_grads) != len(opt_grads):
+            report['grad/' + key] = (float('inf'), False)
+            continue
+        for j, (a, b) in enumerate(zip(opt_grads, ref_grads)):
+            check('grad/{}/{}'.format(key, j), a, b)
+    for key in sorted(set(reference['params']) | set(optimized['params'])):
+        check('param/' + key, optimized['params'].get(key), reference['params'].get(key))
+    return report
+
+
+def check_equivalence(mode, optimized, params, steps=10, seed=0, rtol=1e-4, atol=1e-6,
+                      reference='reference', verbose=True):
+    '''
+    Runs the reference and optimized paths of mode on steps fixed batches
+    return: (whether every check passed, the compare() report, the speedup)
+    '''
+    # The supervised mode skips the unlabeled samples
+    batches = fixed_batches(params, steps, seed, labeled_fraction=1. if mode == 'supervised' else 0.5)
+    ref = run_path(mode, reference, params, batches, seed)
+    opt = run_path(mode, optimized, params, batches, seed, initial=ref['initial'])
+    report = compare(ref, opt, rtol, atol)
+    speedup = ref['time'] / opt['time'] if opt['time'] > 0 else float('inf')
+    passed = all(ok for _, ok in report.values())
+
+    if verbose:
+        failures = sorted((name, diff) for name, (diff, ok) in report.items() if not ok)
+        groups = {}
+        for name, (diff, ok) in report.items():
+            group = name.split('/')[0]
+            groups[group] = max(groups.get(group, 0.), diff)
+        print('{} vs {} ({}, {} steps, rtol={}, atol={})'.format(optimized, reference, mode, steps, rtol, atol))
+        for group in sorted(groups):
+            print('  max |diff| {:<6} {:.3e}'.format(group, groups[group]))
+        for name, diff in failures[:20]:
+            print('  FAIL {} ({:.3e})'.format(name, diff))
+        print('  {}; {:.3f}s vs {:.3f}s, speedup {:.2f}x'.format('PASS' if passed else 'FAIL',
+                                                                ref['time'], opt['time'], speedup))
+    return passed, report, speedup
@@ -0,0 +1,210 @@
+'''
+Asynchronous evaluation with early stopping.
+
+The trainer hands a copy of the encoder weights to an AsyncEvaluator,
+which computes the classification accuracies in a separate process while
+training continues, and picks up the results at the end of a later epoch.
+EarlyStopping then keeps the best checkpoint and stops on a validation
+accuracy plateau or when the time budget is spent.
+'''
+import importlib
+import multiprocessing
+import os
+import shutil
+import time
+import traceback
+
+import torch
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .utils import classification_accuracy, replace_dir
+
+
+def _cpu_state(net):
+    return dict((k, v.detach().cpu().clone()) for k, v in net.state_dict().items())
+
+
+def _evaluate_worker(module_name, params, datasets, threads, jobs, results):
+    '''
+    Evaluates the jobs until it gets None. An exception is sent back as a
+    result with its traceback under 'error' (eval_epoch None when the
+    worker could not start).
+    '''
+    epoch = None
+    try:
+        torch.set_num_threads(threads)
+        Q = importlib.import_module(module_name).create_networks(params)['Q']
+        loaders = dict((name, torch.utils.data.DataLoader(dataset, batch_size=params['valid_batch_size']))
+                       for name, dataset in datasets.items())
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            epoch, state = job
+            start = time.time()
+            Q.load_state_dict(state)
+            result = {'eval_epoch': epoch}
+            for name, loader in loaders.items():
+                result[name + '_acc'] = classification_accuracy(Q, loader, params)
+            result['eval_time'] = time.time() - start
+            results.put(result)
+            epoch = None
+    except Exception:
+        results.put({'eval_epoch': epoch, 'error': traceback.format_exc()})
+
+
+class EvaluationError(RuntimeError):
+    pass
+
+
+class AsyncEvaluator(object):
+    '''
+    Evaluates the encoder of a mode module on datasets (dict name -> dataset,
+    reported as <name>_acc) in a worker process with threads threads.
+    At most max_pending snapshots wait for evaluation: submit() skips the
+    snapshot rather than blocking the training loop when the worker is behind.
+    A failure of the worker is raised as EvaluationError by the next
+    submit(), poll() or close().
+    The worker is spawned, so datasets are pickled to it.
+    '''
+    def __init__(self, module, params, datasets, threads=1, max_pending=1):
+        self.params = dict(params, cuda=False)
+        self.max_pending = max_pending
+        self.pending = {}
+        # A forked child would inherit the CUDA state of the trainer, which it cannot use
+        context = multiprocessing.get_context('spawn')
+        self.jobs = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=_evaluate_worker,
+                                       args=(module.__name__, self.params, datasets, threads, self.jobs, self.results))
+        self.process.daemon = True
+        self.process.start()
+
+    def submit(self, epoch, nets):
+        '''
+        Queues the evaluation of nets['Q'] and keeps a copy of every network
+        until its result arrives
+        return: whether the snapshot was queued
+        '''
+        if not self.process.is_alive():
+            try:
+                # Raises the error the worker sent back, if any
+                self._collect(timeout=0)
+            except queue.Empty:
+                pass
+            raise EvaluationError('The evaluation worker exited with code {}'.format(self.process.exitcode))
+        if len(self.pending) >= self.max_pending:
+            return False
+        state = dict((name, _cpu_state(net)) for name, net in nets.items())
+        self.pending[epoch] = state
+        self.jobs.put((epoch, state['Q']))
+        return True
+
+    def _collect(self, timeout):
+        result = self.results.get(timeout=timeout)
+        state = self.pending.pop(result['eval_epoch'], None)
+        if 'error' in result:
+            raise EvaluationError('Evaluation of epoch {} failed:\n{}'.format(result['eval_epoch'],
+                                                                             result['error']))
+        result['state'] = state
+        return result
+
+    def poll(self):
+        '''
+        return: the results that arrived, each with the evaluated network
+        states under 'state'
+        '''
+        collected = []
+        while self.pending:
+            try:
+                collected.append(self._collect(timeout=0))
+            except queue.Empty:
+                break
+        return collected
+
+    def close(self, timeout=None):
+        '''
+        Waits up to timeout seconds (None: as long as the worker is alive)
+        for the pending evaluations and stops the worker
+        return: their results
+        '''
+        collected = []
+        deadline = None if timeout is None else time.time() + timeout
+        try:
+            while self.pending:
+                try:
+                    collected.append(self._collect(timeout=1.))
+                except queue.Empty:
+                    # The worker may have died in the middle of a job
+                    if not self.process.is_alive() or (deadline is not None and time.time() >= deadline):
+                        break
+        finally:
+            self.jobs.put(None)
+            self.process.join(1. if timeout is None else max(0., min(timeout, deadline - time.time())))
+            if self.process.is_alive():
+                self.process.terminate()
+        return collected
+
+
+class EarlyStopping(object):
+    '''
+    Tracks the validation accuracy of the evaluated snapshots.
+    Stops after patience evaluations without an improvement larger than
+    min_delta, or once time_budget seconds have passed since creation.
+    With save_dir the best snapshot is kept in save_dir/best, replaced with
+    replace_dir (a crash can leave it in save_dir/best.old, see existing_dir).
+    '''
+    def __init__(self, patience=None, min_delta=0., time_budget=None, save_dir=None, metric='val_acc'):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.time_budget = time_budget
+        self.save_dir = save_dir
+        self.metric = metric
+        self.start = time.time()
+        self.best = None
+        self.best_epoch = None
+        self.stale = 0
+
+    def update(self, result):
+        '''
+        Records an AsyncEvaluator result
+        return: whether it is the best so far
+        '''
+        value = result[self.metric]
+        if self.best is not None and value <= self.best + self.min_delta:
+            self.stale += 1
+            return False
+        self.best, self.best_epoch, self.stale = value, result['eval_epoch'], 0
+        if self.save_dir is not None:
+            self._save(result['state'])
+        return True
+
+    def _save(self, state):
+        best_dir = os.path.join(self.save_dir, 'best')
+        tmp = best_dir + '.tmp'
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for name, state_dict in state.items():
+            torch.save(state_dict, os.path.join(tmp, name + '.pt'))
+        replace_dir(tmp, best_dir)
+
+    def state_dict(self):
+        return {'best': self.best, 'best_epoch': self.best_epoch, 'stale': self.stale}
+
+    def load_state_dict(self, state):
+        self.best = state['best']
+        self.best_epoch = state['best_epoch']
+        self.stale = state['stale']
+
+    def out_of_time(self):
+        return self.time_budget is not None and time.time() - self.start >= self.time_budget
+
+    def should_stop(self):
+        if self.out_of_time():
+            return True
+        return self.patience is not None and self.stale >= self.patience
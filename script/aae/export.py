@@ -0,0 +1,183 @@
+'''
+Columnar export of the per-sample inference results.
+
+export_records runs the encoder and decoder over a dataset once and
+streams, batch by batch, one record per sample:
+
+    index          (n,) int64 position in the dataset
+    label          (n,) int64 label, -1 for unlabeled samples
+    z              (n, z_dim) float32 Gaussian code
+    probs          (n, n_classes) float32 class probabilities (semi only)
+    pred           (n,) int64 predicted class (semi only)
+    recon_error    (n,) float32 BCE of the reconstruction, averaged over the pixels
+
+to out_dir as one <column>.npy file per column described by schema.json,
+and/or as records.parquet with one row group per chunk (needs pyarrow).
+load_columns reads back only the requested columns, memory-mapped.
+'''
+import json
+import os
+
+import numpy as np
+import torch
+
+from .generate import inference_mode
+from .scoring import reconstruction_error
+
+SCHEMA = 'schema.json'
+PARQUET = 'records.parquet'
+FORMATS = ('npy', 'parquet')
+
+
+####################
+# Inference
+####################
+def record_batches(Q, P, dataset, batch_size=1000, cuda=False):
+    '''
+    Yields the records of dataset in order, one dict column -> numpy array
+    per batch of batch_size samples
+    '''
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False)
+    Q.eval()
+    P.eval()
+
+    start = 0
+    with inference_mode():
+        for X, target in loader:
+            X = X * 0.3081 + 0.1307
+            X = X.view(X.size(0), -1)
+            if cuda:
+                X, target = X.cuda(), target.cuda()
+            out = Q(X)
+            record = {'index': np.arange(start, start + len(X), dtype='int64'),
+                      'label': target.cpu().numpy().astype('int64')}
+            if isinstance(out, tuple):
+                probs, z = out
+                record['z'] = z.cpu().numpy()
+                record['probs'] = probs.cpu().numpy()
+                record['pred'] = probs.argmax(1).cpu().numpy()
+            else:
+                record['z'] = out.cpu().numpy()
+            record['recon_error'] = reconstruction_error(P, out, X, target).cpu().numpy()
+            start += len(X)
+            yield record
+
+
+####################
+# Writers
+####################
+class NpyWriter(object):
+    '''
+    Writes every column to a memory-mapped <column>.npy of n rows, created
+    from the first chunk, and the schema once all rows are written. The
+    files are written under temporary names and renamed by close().
+    '''
+    def __init__(self, out_dir, n):
+        self.out_dir = out_dir
+        self.n = n
+        self.columns = None
+        self.rows = 0
+
+    def _tmp(self, name):
+        return os.path.join(self.out_dir, name + '.tmp.npy')
+
+    def write(self, record):
+        if self.columns is None:
+            self.columns = dict((name, np.lib.format.open_memmap(
+                self._tmp(name), mode='w+', dtype=values.dtype, shape=(self.n,) + values.shape[1:]))
+                for name, values in record.items())
+        size = len(record['index'])
+        for name, values in record.items():
+            self.columns[name][self.rows:self.rows + size] = values
+        self.rows += size
+
+    def close(self):
+        if self.columns is None:
+            return None
+        schema = {'n_samples': self.rows, 'columns': []}
+        for name, column in sorted(self.columns.items()):
+            column.flush()
+            schema['columns'].append({'name': name, 'file': name + '.npy', 'dtype': column.dtype.str,
+                                      'shape': list(column.shape[1:])})
+        self.columns = None
+        for column in schema['columns']:
+            os.replace(self._tmp(column['name']), os.path.join(self.out_dir, column['file']))
+        tmp = os.path.join(self.out_dir, SCHEMA + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(schema, f, indent=2)
+        os.replace(tmp, os.path.join(self.out_dir, SCHEMA))
+        return schema
+
+
+class ParquetWriter(object):
+    '''
+    Writes every chunk as a row group of records.parquet, the vector
+    columns as fixed-size lists
+    '''
+    def __init__(self, out_dir):
+        import pyarrow
+        import pyarrow.parquet
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.filename = os.path.join(out_dir, PARQUET)
+        self.writer = None
+
+    def _array(self, values):
+        if values.ndim == 1:
+            return self.pa.array(values)
+        flat = self.pa.array(np.ascontiguousarray(values).reshape(-1))
+        return self.pa.FixedSizeListArray.from_arrays(flat, values.shape[1])
+
+    def write(self, record):
+        names = sorted(record)
+        table = self.pa.Table.from_arrays([self._array(record[name]) for name in names], names=names)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.filename + '.tmp', table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            os.replace(self.filename + '.tmp', self.filename)
+
+
+####################
+# Export
+####################
+def export_records(Q, P, dataset, out_dir, formats=('npy',), batch_size=1000, cuda=False):
+    '''
+    Streams the records of every sample of dataset to out_dir in formats
+    ('npy' and/or 'parquet'); only one batch is held in memory at a time
+    return: the schema of the npy columns (None without 'npy')
+    '''
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError('Unknown export format: {}'.format(fmt))
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    npy = NpyWriter(out_dir, len(dataset)) if 'npy' in formats else None
+    # Fails before the encoder runs when pyarrow is missing
+    parquet = ParquetWriter(out_dir) if 'parquet' in formats else None
+
+    for record in record_batches(Q, P, dataset, batch_size, cuda):
+        for writer in (npy, parquet):
+            if writer is not None:
+                writer.write(record)
+    if parquet is not None:
+        parquet.close()
+    return npy.close() if npy is not None else None
+
+
+def load_columns(out_dir, columns=None):
+    '''
+    Reads the requested columns (default: all) of an npy export
+    return: dict column -> memory-mapped array
+    '''
+    with open(os.path.join(out_dir, SCHEMA)) as f:
+        schema = json.load(f)
+    available = dict((column['name'], column['file']) for column in schema['columns'])
+    columns = sorted(available) if columns is None else columns
+    for name in columns:
+        if name not in available:
+            raise KeyError('No column {} in {}, available: {}'.format(name, out_dir, ', '.join(sorted(available))))
+    return dict((name, np.load(os.path.join(out_dir, available[name]), mmap_mode='r')) for name in columns)
@@ -0,0 +1,130 @@
+import copy
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import torch
+
+
+def inference_mode():
+    # torch.inference_mode is only available in recent versions of pytorch
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+####################
+# Prior sampling
+####################
+def sample_prior(rng, n, z_dim, n_classes=0, std=1.):
+    '''
+    Draws n codes from the Gaussian prior and, for the conditional decoders,
+    n classes from the uniform categorical prior
+    return:
+        z_gauss: (n, z_dim) float32 codes
+        labels: (n,) int64 classes, -1 when n_classes is 0
+    '''
+    z_gauss = (rng.standard_normal((n, z_dim)) * std).astype('float32')
+    if not n_classes:
+        return z_gauss, np.full(n, -1, dtype='int64')
+    return z_gauss, rng.randint(0, n_classes, n).astype('int64')
+
+
+def decode_shard(P, filename, n, params, seed, std=1., batch_size=10000):
+    '''
+    Decodes n prior samples with P and writes them as uint8 images to a
+    memory-mapped .npy file, with the classes in a matching *.labels.npy.
+    The samples only depend on seed, so a shard can be regenerated alone.
+    '''
+    z_dim = params['z_dim']
+    n_classes = params.get('n_classes', 0) if P.lin1.in_features > z_dim else 0
+    side = int(round(np.sqrt(params['X_dim'])))
+    rng = np.random.RandomState(seed)
+
+    images = np.lib.format.open_memmap(filename + '.tmp', mode='w+', dtype='uint8',
+                                       shape=(n, side, side))
+    labels = np.empty(n, dtype='int64')
+    P.eval()
+    with inference_mode():
+        for start in range(0, n, batch_size):
+            size = min(batch_size, n - start)
+            z, labels[start:start + size] = sample_prior(rng, size, z_dim, n_classes, std)
+            z = torch.from_numpy(z)
+            if params['cuda']:
+                z = z.cuda()
+            if n_classes:
+                X = P.conditional(z, torch.from_numpy(labels[start:start + size]).to(z.device))
+            else:
+                X = P(z)
+            X = X.mul(255.).round_().byte()
+            images[start:start + size] = X.cpu().numpy().reshape(size, side, side)
+    images.flush()
+    del images
+    # Labels first: a reader watching the directory picks up the shard as soon as it appears
+    labels_file = filename[:-len('.npy')] + '.labels.npy'
+    with open(labels_file + '.tmp', 'wb') as f:
+        np.save(f, labels)
+    os.replace(labels_file + '.tmp', labels_file)
+    os.replace(filename + '.tmp', filename)
+
+
+####################
+# Process pool
+####################
+_worker = {}
+
+
+def _init_worker(P, params, threads):
+    torch.set_num_threads(threads)
+    _worker['P'] = P
+    _worker['params'] = params
+
+
+def _decode_shard_job(job):
+    filename, n, seed, std, batch_size = job
+    decode_shard(_worker['P'], filename, n, _worker['params'], seed, std, batch_size)
+    return filename
+
+
+def generate(P, n_samples, out_dir, params, shard_size=100000, batch_size=10000,
+             seed=0, std=1., processes=None):
+    '''
+    Writes n_samples digits decoded from the prior to out_dir as shards of
+    shard_size images, spread over a pool of processes. Shard i is seeded
+    with (seed, i) and a manifest.json lists the shards.
+    return: list with the shard filenames
+    '''
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    n_shards = (n_samples + shard_size - 1) // shard_size
+    jobs = []
+    for i in range(n_shards):
+        n = min(shard_size, n_samples - i * shard_size)
+        jobs.append((os.path.join(out_dir, 'shard-{:05d}.npy'.format(i)), n,
+                     [seed, i], std, batch_size))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, n_shards))
+    threads = max(1, multiprocessing.cpu_count() // processes)
+
+    if processes > 1 and params['cuda']:
+        P = copy.deepcopy(P).cpu()
+    if processes == 1:
+        _init_worker(P, params, torch.get_num_threads())
+        shards = [_decode_shard_job(job) for job in jobs]
+    else:
+        params = dict(params, cuda=False)
+        pool = multiprocessing.Pool(processes, _init_worker, (P, params, threads))
+        try:
+            shards = pool.map(_decode_shard_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    manifest = {'n_samples': n_samples, 'shard_size': shard_size, 'seed': seed,
+                'std': std, 'shards': [os.path.basename(s) for s in shards]}
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return shards
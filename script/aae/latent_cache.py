@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import torch
+from torch.autograd import Variable
+
+from .data import map_dataset
+
+
+####################
+# Fingerprints
+####################
+def model_fingerprint(model):
+    '''
+    Hash of every tensor in the state_dict of model.
+    Any change to the weights gives a different fingerprint.
+    '''
+    h = hashlib.sha1()
+    for name, tensor in sorted(model.state_dict().items()):
+        tensor = tensor.cpu().contiguous()
+        h.update(name.encode('utf-8'))
+        h.update(str(tuple(tensor.size())).encode('utf-8'))
+        h.update(tensor.numpy().tobytes())
+    return h.hexdigest()
+
+
+def block_fingerprints(dataset, block_size=1024):
+    '''
+    Hashes the samples of dataset in consecutive blocks of block_size.
+    Samples appended to the dataset only change the hash of the last block.
+    return: list with one hex digest per block
+    '''
+    loader = torch.utils.data.DataLoader(dataset, batch_size=block_size, shuffle=False)
+    blocks = []
+    for X, target in loader:
+        h = hashlib.sha1()
+        h.update(X.numpy().tobytes())
+        h.update(np.asarray(target.numpy()).tobytes())
+        blocks.append(h.hexdigest())
+    return blocks
+
+
+def dataset_stat(dataset):
+    '''
+    Identity of the file dataset was loaded from (its source_file), which
+    changes whenever the file is rewritten
+    return: [path, size, mtime_ns, inode], or None without a source file
+    '''
+    filename = getattr(dataset, 'source_file', None)
+    if filename is None:
+        return None
+    st = os.stat(filename)
+    return [os.path.realpath(filename), st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+####################
+# Cache
+####################
+class LatentEntry(object):
+    '''
+    Latent codes of one dataset under one encoder, memory-mapped from disk.
+        z: the Gaussian codes
+        y: the categorical codes (None for encoders without one)
+        labels: the targets of the samples
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.z = np.load(os.path.join(path, 'z.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+        y_file = os.path.join(path, 'y.npy')
+        self.y = np.load(y_file, mmap_mode='r') if os.path.exists(y_file) else None
+
+    def __len__(self):
+        return len(self.z)
+
+
+class LatentCache(object):
+    '''
+    On-disk cache of the latent codes produced by an encoder.
+
+    Entries are keyed by the dataset name and the fingerprint of the encoder
+    weights. The samples are fingerprinted in blocks, so when new samples are
+    appended to a dataset only the blocks that changed are encoded again.
+    The block fingerprints of a dataset loaded from a file (source_file) are
+    kept in fingerprints.json and only recomputed when the file changes.
+    Storing an entry for a new encoder invalidates the entries of the older
+    encoders for the same dataset, and the least recently used entries are
+    evicted once the cache grows beyond max_bytes.
+    '''
+    def __init__(self, root, max_bytes=1 << 30, block_size=1024, cuda=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.cuda = cuda
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def get(self, Q, dataset, name=None, batch_size=1000):
+        '''
+        Latent codes of dataset under the encoder Q, encoding only what
+        is not cached yet.
+        return: LatentEntry
+        '''
+        if len(dataset) == 0:
+            raise ValueError('Cannot cache the latent codes of an empty dataset')
+        blocks = self._fingerprints(dataset)
+        if name is None:
+            name = blocks[0]
+        model_hash = model_fingerprint(Q)
+        path = os.path.join(self.root, '{}-{}'.format(name, model_hash[:16]))
+
+        meta = self._read_meta(path)
+        n_valid = 0
+        if meta is not None and meta['block_size'] == self.block_size:
+            for old, new in zip(meta['blocks'], blocks):
+                if old != new:
+                    break
+                n_valid += 1
+            n_valid = min(n_valid * self.block_size, meta['n'])
+
+        if meta is None or meta['blocks'] != blocks:
+            self._update(Q, dataset, path, n_valid, batch_size)
+            meta = {'name': name, 'model': model_hash, 'blocks': blocks,
+                    'block_size': self.block_size, 'n': len(dataset)}
+            self._invalidate(name, path)
+
+        meta['last_access'] = time.time()
+        self._write_meta(path, meta)
+        self._evict(keep=path)
+        return LatentEntry(path)
+
+    def _fingerprints(self, dataset):
+        '''
+        block_fingerprints of dataset, read from fingerprints.json when its
+        source file has not changed since they were computed
+        '''
+        stat = dataset_stat(dataset)
+        if stat is None:
+            return block_fingerprints(dataset, self.block_size)
+        filename = os.path.join(self.root, 'fingerprints.json')
+        try:
+            with open(filename) as f:
+                known = json.load(f)
+        except (IOError, OSError, ValueError):
+            known = {}
+        entry = known.get(stat[0])
+        if entry is not None and entry['stat'] == stat and entry['block_size'] == self.block_size \
+                and entry['n'] == len(dataset):
+            return entry['blocks']
+
+        blocks = block_fingerprints(dataset, self.block_size)
+        known[stat[0]] = {'stat': stat, 'block_size': self.block_size, 'n': len(dataset), 'blocks': blocks}
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(known, f)
+        os.replace(filename + '.tmp', filename)
+        return blocks
+
+    def _encode(self, Q, dataset, start, batch_size):
+        indices = list(range(start, len(dataset)))
+        subset = torch.utils.data.Subset(dataset, indices)
+        loader = torch.utils.data.DataLoader(subset, batch_size=batch_size, shuffle=False)
+
+        Q.eval()
+        z_values, y_values, labels = [], [], []
+        with torch.no_grad():
+            for X, target in loader:
+                X = X * 0.3081 + 0.1307
+                X = Variable(X.view(X.size(0), -1))
+                if self.cuda:
+                    X = X.cuda()
+                out = Q(X)
+                if isinstance(out, tuple):
+                    y_values.append(out[0].data.cpu().numpy())
+                    out = out[1]
+                z_values.append(out.data.cpu().numpy())
+                labels.append(target.numpy())
+        return z_values, y_values, labels
+
+    def _update(self, Q, dataset, path, n_valid, batch_size):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        z_new, y_new, labels_new = self._encode(Q, dataset, n_valid, batch_size)
+        columns = [('z', z_new), ('labels', labels_new)]
+        if y_new or os.path.exists(os.path.join(path, 'y.npy')):
+            columns.append(('y', y_new))
+        for column, new in columns:
+            filename = os.path.join(path, column + '.npy')
+            old = np.load(filename, mmap_mode='r')[:n_valid] if n_valid else None
+            self._write_column(filename, old, new)
+
+    @staticmethod
+    def _write_column(filename, old, chunks):
+        '''
+        Writes the valid prefix old followed by chunks to filename,
+        replacing the previous file atomically.
+        '''
+        parts = ([old] if old is not None else []) + list(chunks)
+        n = sum(len(part) for part in parts)
+        tmp = filename + '.tmp.npy'
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=parts[0].dtype,
+                                        shape=(n,) + parts[0].shape[1:])
+        offset = 0
+        for part in parts:
+            out[offset:offset + len(part)] = part
+            offset += len(part)
+        out.flush()
+        del out
+        os.replace(tmp, filename)
+
+    @staticmethod
+    def _read_meta(path):
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_meta(path, meta):
+        tmp = os.path.join(path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+
+    def _entries(self):
+        for entry in os.listdir(self.root):
+            path = os.path.join(self.root, entry)
+            if os.path.isdir(path):
+                yield path
+
+    def _invalidate(self, name, keep):
+        for path in self._entries():
+            meta = self._read_meta(path)
+            if path != keep and (meta is None or meta['name'] == name):
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _size(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+    def _evict(self, keep):
+        entries = []
+        for path in self._entries():
+            meta = self._read_meta(path)
+            last_access = meta.get('last_access', 0.) if meta is not None else 0.
+            entries.append((last_access, path, self._size(path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+def create_latent_cached(Q, loader, cache, name=None):
+    '''
+    Same as create_latent but served from cache when possible
+    return:
+        z_values: numpy array with the latent representations
+        labels: the labels corresponding to the latent representations
+    '''
+    dataset = map_dataset(loader)
+    # The sharded loaders batch in the dataset
+    batch_size = loader.batch_size or loader.dataset.batch_size
+    entry = cache.get(Q, dataset, name=name, batch_size=batch_size)
+    return entry.z, entry.labels
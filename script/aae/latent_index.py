@@ -0,0 +1,367 @@
+import numpy as np
+
+
+####################
+# Base index
+####################
+class LatentIndex(object):
+    '''
+    Nearest-neighbour index over latent codes.
+
+    Subclasses implement query() and query_radius(); knn_classify() votes
+    with the labels given at construction time (negative labels, such as the
+    -1 of the unlabeled set, never vote).
+    '''
+    def __init__(self, points, labels=None):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        if self.points.ndim != 2 or len(self.points) == 0:
+            raise ValueError('Expected a non-empty (n_samples, z_dim) array of latent codes')
+        self.labels = None if labels is None else np.asarray(labels).astype(np.int64)
+
+    def query(self, X, k=1):
+        '''
+        k nearest neighbours of every row of X
+        return:
+            dist: (n_queries, k) euclidean distances, inf where missing
+            idx: (n_queries, k) indices into points, -1 where missing
+        '''
+        raise NotImplementedError
+
+    def query_radius(self, X, radius):
+        '''
+        All points within radius of every row of X, in CSR layout: the
+        neighbours of query i are indices[indptr[i]:indptr[i + 1]]
+        return: indptr, indices, distances
+        '''
+        raise NotImplementedError
+
+    def knn_classify(self, X, k=5, n_classes=None):
+        '''
+        Majority vote of the labels of the k nearest neighbours
+        return:
+            pred: (n_queries,) predicted class, -1 when no neighbour has a label
+            proba: (n_queries, n_classes) fraction of the votes per class
+        '''
+        if self.labels is None:
+            raise ValueError('The index was built without labels')
+        if n_classes is None:
+            n_classes = int(self.labels.max()) + 1
+
+        _, idx = self.query(X, k)
+        labels = np.where(idx >= 0, self.labels[np.maximum(idx, 0)], -1)
+        valid = labels >= 0
+        rows = np.repeat(np.arange(len(idx)), idx.shape[1]).reshape(idx.shape)
+        votes = np.bincount(rows[valid] * n_classes + labels[valid],
+                            minlength=len(idx) * n_classes).reshape(len(idx), n_classes)
+
+        n_votes = votes.sum(1, keepdims=True)
+        proba = votes / np.maximum(n_votes, 1).astype(np.float64)
+        pred = np.where(n_votes[:, 0] > 0, votes.argmax(1), -1)
+        return pred, proba
+
+
+def _to_csr(neighbours, X, points):
+    counts = np.array([len(n) for n in neighbours], dtype=np.int64)
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    indices = np.concatenate([np.asarray(n, dtype=np.int64) for n in neighbours]) \
+        if len(neighbours) else np.zeros(0, dtype=np.int64)
+    rows = np.repeat(np.arange(len(neighbours)), counts)
+    distances = np.sqrt(((points[indices] - X[rows]) ** 2).sum(1))
+    return indptr, indices, distances
+
+
+####################
+# Uniform grid (2D)
+####################
+class GridIndex(LatentIndex):
+    '''
+    Uniform grid over 2D latent codes.
+
+    The points are sorted by cell so the contents of any row of cells are a
+    contiguous slice. Queries are answered for a whole batch at once:
+    the candidate cells of all queries are expanded with numpy, at most
+    max_pairs query-point pairs at a time, and only the queries whose k-th
+    neighbour is not yet guaranteed to be exact are retried with a larger
+    ring of cells. The queries still pending after max_ring (e.g. far from
+    every point) are answered by a brute-force search in blocks.
+    Radius queries filter the same blocks of pairs as they are expanded.
+    '''
+    def __init__(self, points, labels=None, leaf_size=8, chunk_size=65536, max_ring=8, max_pairs=1 << 22):
+        super(GridIndex, self).__init__(points, labels)
+        if self.points.shape[1] != 2:
+            raise ValueError('GridIndex only supports 2D latent codes')
+        self.chunk_size = chunk_size
+        self.max_ring = max_ring
+        self.max_pairs = max_pairs
+
+        self.lo = self.points.min(0)
+        extent = np.maximum(self.points.max(0) - self.lo, 1e-12)
+        # On average leaf_size points per cell, with at most about
+        # len(points) / leaf_size cells along either axis for flat clouds
+        self.cell_size = max(np.sqrt(extent.prod() * leaf_size / len(self.points)),
+                             extent.max() * leaf_size / len(self.points))
+        self.shape = (extent // self.cell_size).astype(np.int64) + 1
+
+        cell_id = self._cell_id(self._cells(self.points))
+        self.order = np.argsort(cell_id, kind='mergesort')
+        self.sorted_points = self.points[self.order]
+        self.starts = np.searchsorted(cell_id[self.order], np.arange(self.shape.prod() + 1))
+
+    def _cells(self, X):
+        cells = ((X - self.lo) // self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.shape - 1)
+
+    def _cell_id(self, cells):
+        return cells[:, 0] * self.shape[1] + cells[:, 1]
+
+    def _windows(self, cells, ring):
+        '''
+        The cells within ring of every query cell, clamped to the grid, as
+        one slice of sorted points per row of cells
+        return: (n_queries, n_rows) start and count of every slice
+        '''
+        dx = np.arange(max(-ring, 1 - self.shape[0]), min(ring, self.shape[0] - 1) + 1)
+        cx = cells[:, 0:1] + dx
+        valid = (cx >= 0) & (cx < self.shape[0])
+        cx = np.clip(cx, 0, self.shape[0] - 1)
+        y_lo = np.maximum(cells[:, 1:2] - ring, 0)
+        y_hi = np.minimum(cells[:, 1:2] + ring, self.shape[1] - 1)
+        start = self.starts[cx * self.shape[1] + y_lo]
+        count = np.where(valid, self.starts[cx * self.shape[1] + y_hi + 1] - start, 0)
+        return start, count
+
+    @staticmethod
+    def _expand(start, count):
+        '''
+        return: query row and sorted point index of every candidate pair of the slices
+        '''
+        rows = np.repeat(np.arange(len(start)), count.sum(1))
+        start, count = start.ravel(), count.ravel()
+        shift = np.repeat(start - np.cumsum(count) + count, count)
+        return rows, shift + np.arange(len(shift))
+
+    def _blocks(self, start, count):
+        '''
+        The candidate pairs of the slices of _windows, for consecutive
+        queries with at most max_pairs pairs (at least one query) at a time
+        yield: first and end query, query row (from the first) and sorted
+        point index of every candidate pair
+        '''
+        pairs = np.cumsum(count.sum(1))
+        i = 0
+        while i < len(start):
+            before = pairs[i - 1] if i else 0
+            j = max(i + 1, int(np.searchsorted(pairs, before + self.max_pairs, side='right')))
+            rows, cand = self._expand(start[i:j], count[i:j])
+            yield i, j, rows, cand
+            i = j
+
+    def _ring_query(self, X, cells, k, ring):
+        '''
+        k nearest sorted points within ring of the cells of the rows of X
+        return: (n_queries, k) squared distances and sorted point indices
+        '''
+        D = np.full((len(X), k), np.inf)
+        I = np.full((len(X), k), -1, dtype=np.int64)
+        for i, j, rows, cand in self._blocks(*self._windows(cells, ring)):
+            d = ((self.sorted_points[cand] - X[i:j][rows]) ** 2).sum(1)
+
+            order = np.lexsort((d, rows))
+            rows, d, cand = rows[order], d[order], cand[order]
+            rank = np.arange(len(rows)) - np.searchsorted(rows, np.arange(j - i))[rows]
+            keep = rank < k
+            D[i + rows[keep], rank[keep]] = d[keep]
+            I[i + rows[keep], rank[keep]] = cand[keep]
+        return D, I
+
+    def _brute_force(self, X, k):
+        '''
+        Exact k nearest sorted points of the rows of X, by blocks of queries
+        of at most max_pairs distances
+        return: (n_queries, k) distances and sorted point indices
+        '''
+        n = len(self.sorted_points)
+        kk = min(k, n)
+        dist = np.full((len(X), k), np.inf)
+        idx = np.full((len(X), k), -1, dtype=np.int64)
+        step = max(1, self.max_pairs // n)
+        for i in range(0, len(X), step):
+            block = X[i:i + step]
+            d = ((block[:, 0:1] - self.sorted_points[:, 0]) ** 2 +
+                 (block[:, 1:2] - self.sorted_points[:, 1]) ** 2)
+            nearest = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+            d = np.take_along_axis(d, nearest, 1)
+            order = np.argsort(d, 1)
+            dist[i:i + step, :kk] = np.sqrt(np.take_along_axis(d, order, 1))
+            idx[i:i + step, :kk] = np.take_along_axis(nearest, order, 1)
+        return dist, idx
+
+    def _query_chunk(self, X, k):
+        m = len(X)
+        dist = np.full((m, k), np.inf)
+        idx = np.full((m, k), -1, dtype=np.int64)
+        cells = self._cells(X)
+        pending = np.arange(m)
+        ring = 1
+        while len(pending) and ring <= self.max_ring:
+            D, I = self._ring_query(X[pending], cells[pending], k, ring)
+
+            # Every point outside the ring is at least ring * cell_size away
+            done = D[:, -1] <= (ring * self.cell_size) ** 2
+            if ring >= self.shape.max():
+                done[:] = True
+            dist[pending[done]] = np.sqrt(D[done])
+            idx[pending[done]] = I[done]
+            pending = pending[~done]
+            ring *= 2
+        if len(pending):
+            dist[pending], idx[pending] = self._brute_force(X[pending], k)
+
+        return dist, np.where(idx >= 0, self.order[np.maximum(idx, 0)], -1)
+
+    def query(self, X, k=1):
+        X = np.ascontiguousarray(X, dtype=np.float64).reshape(-1, 2)
+        dist = np.empty((len(X), k))
+        idx = np.empty((len(X), k), dtype=np.int64)
+        for i in range(0, len(X), self.chunk_size):
+            dist[i:i + self.chunk_size], idx[i:i + self.chunk_size] = \
+                self._query_chunk(X[i:i + self.chunk_size], k)
+        return dist, idx
+
+    def query_radius(self, X, radius):
+        X = np.ascontiguousarray(X, dtype=np.float64).reshape(-1, 2)
+        ring = int(min(np.ceil(radius / self.cell_size), self.shape.max()))
+        counts, indices, distances = [], [], []
+        for c in range(0, len(X), self.chunk_size):
+            chunk = X[c:c + self.chunk_size]
+            # Only the pairs within radius are kept from every block of candidates
+            for i, j, rows, cand in self._blocks(*self._windows(self._cells(chunk), ring)):
+                d = np.sqrt(((self.sorted_points[cand] - chunk[i:j][rows]) ** 2).sum(1))
+                inside = d <= radius
+                rows, cand, d = rows[inside], cand[inside], d[inside]
+                counts.append(np.bincount(rows, minlength=j - i))
+                indices.append(self.order[cand])
+                distances.append(d)
+        if not counts:
+            return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        indptr = np.concatenate(([0], np.cumsum(np.concatenate(counts))))
+        return indptr, np.concatenate(indices), np.concatenate(distances)
+
+
+####################
+# Trees and brute force (any z_dim)
+####################
+class KDTreeIndex(LatentIndex):
+    '''
+    scipy's cKDTree, queried on every core
+    '''
+    def __init__(self, points, labels=None, leaf_size=16):
+        super(KDTreeIndex, self).__init__(points, labels)
+        from scipy.spatial import cKDTree
+        self.tree = cKDTree(self.points, leafsize=leaf_size)
+
+    def query(self, X, k=1):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.points.shape[1])
+        try:
+            dist, idx = self.tree.query(X, k, workers=-1)
+        except TypeError:
+            dist, idx = self.tree.query(X, k, n_jobs=-1)
+        dist, idx = dist.reshape(len(X), k), idx.reshape(len(X), k)
+        return dist, np.where(idx < len(self.points), idx, -1)
+
+    def query_radius(self, X, radius):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.points.shape[1])
+        try:
+            neighbours = self.tree.query_ball_point(X, radius, workers=-1)
+        except TypeError:
+            neighbours = self.tree.query_ball_point(X, radius, n_jobs=-1)
+        return _to_csr(neighbours, X, self.points)
+
+
+class BallTreeIndex(LatentIndex):
+    '''
+    scikit-learn's BallTree, better suited than a KD-tree for larger z_dim
+    '''
+    def __init__(self, points, labels=None, leaf_size=40):
+        super(BallTreeIndex, self).__init__(points, labels)
+        from sklearn.neighbors import BallTree
+        self.tree = BallTree(self.points, leaf_size=leaf_size)
+
+    def query(self, X, k=1):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.points.shape[1])
+        n = min(k, len(self.points))
+        dist = np.full((len(X), k), np.inf)
+        idx = np.full((len(X), k), -1, dtype=np.int64)
+        dist[:, :n], idx[:, :n] = self.tree.query(X, n)
+        return dist, idx
+
+    def query_radius(self, X, radius):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.points.shape[1])
+        return _to_csr(self.tree.query_radius(X, radius), X, self.points)
+
+
+class BruteForceIndex(LatentIndex):
+    '''
+    Chunked exact search with numpy, used when neither scipy nor
+    scikit-learn is installed
+    '''
+    def __init__(self, points, labels=None, chunk_size=1024):
+        super(BruteForceIndex, self).__init__(points, labels)
+        self.chunk_size = chunk_size
+        self.sq_norms = (self.points ** 2).sum(1)
+
+    def _sq_distances(self, X):
+        d = (X ** 2).sum(1)[:, None] - 2 * X.dot(self.points.T) + self.sq_norms[None, :]
+        return np.maximum(d, 0.)
+
+    def query(self, X, k=1):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.points.shape[1])
+        n = min(k, len(self.points))
+        dist = np.full((len(X), k), np.inf)
+        idx = np.full((len(X), k), -1, dtype=np.int64)
+        for i in range(0, len(X), self.chunk_size):
+            d = self._sq_distances(X[i:i + self.chunk_size])
+            part = np.argpartition(d, n - 1, axis=1)[:, :n]
+            d_part = np.take_along_axis(d, part, 1)
+            order = np.argsort(d_part, axis=1)
+            idx[i:i + self.chunk_size, :n] = np.take_along_axis(part, order, 1)
+            dist[i:i + self.chunk_size, :n] = np.sqrt(np.take_along_axis(d_part, order, 1))
+        return dist, idx
+
+    def query_radius(self, X, radius):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.points.shape[1])
+        neighbours = []
+        for i in range(0, len(X), self.chunk_size):
+            inside = self._sq_distances(X[i:i + self.chunk_size]) <= radius ** 2
+            neighbours.extend(np.nonzero(row)[0] for row in inside)
+        return _to_csr(neighbours, X, self.points)
+
+
+def build_index(z_values, labels=None, method='auto'):
+    '''
+    Index over the latent codes returned by create_latent.
+    method: 'grid', 'kdtree', 'balltree', 'brute' or 'auto', which picks a
+    grid for 2D codes, then a KD-tree up to 16 dimensions and a ball tree
+    above, depending on what is installed
+    return: LatentIndex
+    '''
+    z_values = np.asarray(z_values)
+    if method == 'auto':
+        if z_values.shape[1] == 2:
+            method = 'grid'
+        else:
+            method = 'kdtree' if z_values.shape[1] <= 16 else 'balltree'
+            try:
+                return build_index(z_values, labels, method)
+            except ImportError:
+                method = 'brute'
+
+    if method == 'grid':
+        return GridIndex(z_values, labels)
+    if method == 'kdtree':
+        return KDTreeIndex(z_values, labels)
+    if method == 'balltree':
+        return BallTreeIndex(z_values, labels)
+    if method == 'brute':
+        return BruteForceIndex(z_values, labels)
+    raise ValueError('Unknown index method: {}'.format(method))
@@ -0,0 +1,257 @@
+'''
+Memory accounting of the AAE networks.
+
+network_report() breaks the memory of every network down into parameters,
+gradients, optimizer state and the activations saved for the backward pass
+at a given batch size. PhaseMemoryTracker measures the peak RSS of the
+process during each training phase, in memory_report() on synthetic
+batches or during training with EpochMetrics(track_memory=True).
+'''
+import contextlib
+import importlib
+import os
+import threading
+import time
+
+import torch
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+####################
+# Static accounting
+####################
+def _nbytes(tensor):
+    return tensor.numel() * tensor.element_size()
+
+
+def optimizer_state_bytes(optimizer):
+    '''
+    Bytes of the state of optimizer per parameter id. Parameters without
+    state yet are estimated: Adam keeps two buffers per parameter (three
+    with amsgrad), SGD with momentum one.
+    '''
+    sizes = {}
+    for group in optimizer.param_groups:
+        for p in group['params']:
+            state = optimizer.state.get(p)
+            if state:
+                sizes[id(p)] = sum(_nbytes(v) for v in state.values() if torch.is_tensor(v))
+            elif isinstance(optimizer, torch.optim.Adam):
+                sizes[id(p)] = (3 if group.get('amsgrad') else 2) * _nbytes(p)
+            elif group.get('momentum'):
+                sizes[id(p)] = _nbytes(p)
+    return sizes
+
+
+def _storage_ptr(tensor):
+    storage = tensor.untyped_storage() if hasattr(tensor, 'untyped_storage') else tensor.storage()
+    return storage.data_ptr()
+
+
+def activation_bytes(net, batch_size):
+    '''
+    Bytes of the tensors autograd saves for the backward pass during a
+    training-mode forward pass of net on batch_size random inputs. The
+    parameters (e.g. the weight saved by every linear layer) are not counted.
+    '''
+    saved = {}
+    parameters = set(_storage_ptr(p) for p in net.parameters())
+
+    def pack(tensor):
+        if _storage_ptr(tensor) not in parameters:
+            saved[(tensor.data_ptr(), tensor.numel())] = _nbytes(tensor)
+        return tensor
+
+    device = next(net.parameters()).device
+    in_features = getattr(net, 'in_features', None) or net.lin1.in_features
+    x = torch.rand(batch_size, in_features, device=device)
+    was_training = net.training
+    net.train()
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        net(x)
+    net.train(was_training)
+    return sum(saved.values())
+
+
+def network_report(nets, solvers, batch_size):
+    '''
+    return: dict network name -> dict with the bytes of its parameters,
+    gradients, optimizer state (summed over all the optimizers of solvers
+    that update it) and activations
+    '''
+    owner = {}
+    for name, net in nets.items():
+        for p in net.parameters():
+            owner[id(p)] = name
+
+    report = {}
+    for name, net in nets.items():
+        params = list(net.parameters())
+        report[name] = {'parameters': sum(_nbytes(p) for p in params),
+                        'gradients': sum(_nbytes(p) for p in params if p.requires_grad),
+                        'optimizer': 0,
+                        'activations': activation_bytes(net, batch_size)}
+    for optimizer in solvers.values():
+        for param_id, size in optimizer_state_bytes(optimizer).items():
+            if param_id in owner:
+                report[owner[param_id]]['optimizer'] += size
+    for row in report.values():
+        row['total'] = sum(row.values())
+    return report
+
+
+####################
+# Peak RSS
+####################
+def _status_bytes(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def current_rss():
+    return _status_bytes('VmRSS')
+
+
+def peak_rss():
+    '''
+    Peak RSS since the last reset_peak_rss(), or over the whole process
+    '''
+    peak = _status_bytes('VmHWM')
+    if peak is None and resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if os.uname()[0] == 'Darwin' else 1024
+    return peak
+
+
+def reset_peak_rss():
+    '''
+    Resets the peak RSS of the process (Linux 4.0 and later)
+    return: whether the reset is supported
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class PhaseMemoryTracker(object):
+    '''
+    Peak RSS of the process during each named phase:
+
+        tracker = PhaseMemoryTracker()
+        with tracker.phase('reconstruction'):
+            ...
+        tracker.peaks  # phase -> largest peak RSS in bytes over all its runs
+
+    The kernel peak counter is reset at the start of every phase when
+    possible; otherwise the RSS is sampled every interval seconds by a
+    background thread while the phase runs.
+    '''
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.can_reset = reset_peak_rss()
+        self.peaks = {}
+        self.growth = {}
+
+    def _sample(self, stop, result):
+        while not stop.is_set():
+            rss = current_rss() or 0
+            result[0] = max(result[0], rss)
+            time.sleep(self.interval)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = current_rss() or 0
+        if self.can_reset:
+            reset_peak_rss()
+        else:
+            stop, result = threading.Event(), [start]
+            sampler = threading.Thread(target=self._sample, args=(stop, result))
+            sampler.daemon = True
+            sampler.start()
+        try:
+            yield
+        finally:
+            if self.can_reset:
+                peak = peak_rss()
+            else:
+                stop.set()
+                sampler.join()
+                peak = max(result[0], current_rss() or 0)
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+            self.growth[name] = max(self.growth.get(name, 0), peak - start)
+
+
+def _phases(mode, module, nets, solvers, X, target, params):
+    P, Q, D_gauss = nets['P'], nets['Q'], nets['D_gauss']
+    if mode == 'semi':
+        D_cat = nets['D_cat']
+        return [('reconstruction', lambda: module.reconstruction_phase(
+                    P, Q, X, solvers['P_decoder'], solvers['Q_encoder'])),
+                ('discriminator', lambda: module.discriminator_phase(
+                    Q, D_cat, D_gauss, X, solvers['D_cat_solver'], solvers['D_gauss_solver'], params)),
+                ('generator', lambda: module.generator_phase(Q, D_cat, D_gauss, X, solvers['Q_generator'])),
+                ('semi_supervised', lambda: module.semi_supervised_phase(
+                    Q, X, target, solvers['Q_semi_supervised']))]
+    if mode == 'supervised':
+        reconstruction = lambda: module.reconstruction_phase(
+            P, Q, X, target, solvers['P_decoder'], solvers['Q_encoder'], params)
+    else:
+        reconstruction = lambda: module.reconstruction_phase(P, Q, X, solvers['P_decoder'], solvers['Q_encoder'])
+    return [('reconstruction', reconstruction),
+            ('discriminator', lambda: module.discriminator_phase(Q, D_gauss, X, solvers['D_gauss_solver'], params)),
+            ('generator', lambda: module.generator_phase(Q, D_gauss, X, solvers['Q_generator']))]
+
+
+def memory_report(mode, params, steps=5):
+    '''
+    Prints the per-network memory breakdown of mode at params['train_batch_size']
+    and the peak RSS of each of its training phases over steps batches
+    return: the network report and the PhaseMemoryTracker
+    '''
+    from .cli import MODES
+    from .utils import zero_grad
+    module = importlib.import_module('.' + MODES[mode], __package__)
+    batch_size = params['train_batch_size']
+    nets = module.create_networks(params)
+    solvers = module.create_solvers(nets)
+
+    tracker = PhaseMemoryTracker()
+    with tracker.phase('setup'):
+        X = torch.rand(batch_size, params['X_dim'])
+        target = torch.randint(0, params['n_classes'], (batch_size,))
+        if params['cuda']:
+            X, target = X.cuda(), target.cuda()
+    for _ in range(steps):
+        for name, run in _phases(mode, module, nets, solvers, X, target, params):
+            with tracker.phase(name):
+                run()
+            zero_grad(*nets.values())
+
+    report = network_report(nets, solvers, batch_size)
+    mb = 1024. * 1024.
+    columns = ['parameters', 'gradients', 'optimizer', 'activations', 'total']
+    print('z_dim={} N={} batch_size={} (MiB)'.format(params['z_dim'], params['N'], batch_size))
+    print('{:<10}'.format('network') + ''.join('{:>13}'.format(c) for c in columns))
+    for name in sorted(report):
+        print('{:<10}'.format(name) + ''.join('{:>13.2f}'.format(report[name][c] / mb) for c in columns))
+    print('{:<10}'.format('all') + ''.join('{:>13.2f}'.format(sum(r[c] for r in report.values()) / mb)
+                                           for c in columns))
+
+    print('{:<16}{:>14}{:>14}'.format('phase', 'peak RSS', 'growth'))
+    for name, peak in tracker.peaks.items():
+        print('{:<16}{:>14.2f}{:>14.2f}'.format(name, peak / mb, tracker.growth[name] / mb))
+    return report, tracker
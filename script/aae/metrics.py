@@ -0,0 +1,229 @@
+import contextlib
+import csv
+import json
+import os
+import threading
+import time
+
+import torch
+
+from .memory import PhaseMemoryTracker, peak_rss
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+####################
+# Accumulation
+####################
+class EpochMetrics(object):
+    '''
+    Accumulates the per-batch losses of one epoch.
+
+    The running sums stay on the device the losses were computed on, so
+    calling update() inside the training loop never waits for the host.
+    Everything is copied back in a single transfer by summary().
+
+    With track_memory the training loops run their phases inside phase(name)
+    and summary() reports the peak RSS of each as peak_rss_mb_<name>. The
+    PhaseMemoryTracker resets the peak RSS counter of the whole process at
+    the start of every phase, hence it is off by default.
+    '''
+    def __init__(self, track_memory=False):
+        self.memory = PhaseMemoryTracker() if track_memory else None
+        self.reset()
+
+    def reset(self):
+        self.sums = {}
+        self.counts = {}
+        self.totals = {}
+        self.n_samples = 0
+        self.start = time.time()
+        if self.memory is not None:
+            self.memory.peaks, self.memory.growth = {}, {}
+
+    def phase(self, name):
+        '''
+        Context of the phase name of a training step
+        '''
+        if self.memory is None:
+            return _untracked()
+        return self.memory.phase(name)
+
+    def update(self, batch_size=0, **losses):
+        for name, value in losses.items():
+            value = value.detach().view(-1)
+            if name in self.sums:
+                self.sums[name].add_(value)
+            else:
+                self.sums[name] = value.clone()
+            self.counts[name] = self.counts.get(name, 0) + 1
+        self.n_samples += batch_size
+
+    def count(self, **totals):
+        '''
+        Adds host-side counts to the epoch totals, e.g. the number of
+        updates of a phase
+        '''
+        for name, n in totals.items():
+            self.totals[name] = self.totals.get(name, 0) + n
+
+    def summary(self, epoch):
+        '''
+        Mean of every metric over the epoch plus the sample throughput and
+        the peak RSS of the process: the largest peak of the phases over the
+        epoch with track_memory, else since the start of the process
+        return: dict with one entry per metric
+        '''
+        names = sorted(self.sums)
+        values = []
+        if names:
+            values = torch.cat([self.sums[name] for name in names]).cpu().tolist()
+        elapsed = time.time() - self.start
+
+        record = {'epoch': epoch}
+        for name, value in zip(names, values):
+            record[name] = value / self.counts[name]
+        record.update(self.totals)
+        record['samples_per_sec'] = self.n_samples / elapsed if elapsed > 0 else 0.
+        record['epoch_time'] = elapsed
+        if self.memory is not None and self.memory.peaks:
+            for name, peak in self.memory.peaks.items():
+                record['peak_rss_mb_' + name] = peak / (1024. * 1024.)
+            peak = max(self.memory.peaks.values())
+        else:
+            peak = peak_rss()
+        if peak is not None:
+            record['peak_rss_mb'] = peak / (1024. * 1024.)
+        return record
+
+
+@contextlib.contextmanager
+def _untracked():
+    yield
+
+
+def track_phase(metrics, name):
+    '''
+    metrics.phase(name), or a context doing nothing when metrics is None
+    '''
+    return _untracked() if metrics is None else metrics.phase(name)
+
+
+####################
+# Sinks
+####################
+class JSONLSink(object):
+    def __init__(self, filename):
+        self.file = open(filename, 'a')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, sort_keys=True) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CSVSink(object):
+    '''
+    Writes the records as CSV rows. The columns are the keys seen so far:
+    a record with a new key (e.g. the accuracies of the first evaluation)
+    rewrites the file with the wider header, the earlier rows leaving the
+    new columns empty.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.fields = None
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            with open(filename) as f:
+                self.fields = next(csv.reader(f), None)
+        self.file = open(filename, 'a')
+
+    def _rewrite(self, fields):
+        self.file.close()
+        rows = []
+        if self.fields:
+            with open(self.filename) as f:
+                rows = list(csv.DictReader(f))
+        with open(self.filename + '.tmp', 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(self.filename + '.tmp', self.filename)
+        self.fields = fields
+        self.file = open(self.filename, 'a')
+
+    def write(self, record):
+        new = sorted(k for k in record if k != 'epoch' and (self.fields is None or k not in self.fields))
+        if self.fields is None:
+            self._rewrite(['epoch'] + new)
+        elif new:
+            self._rewrite(self.fields + new)
+        csv.DictWriter(self.file, fieldnames=self.fields).writerow(record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class TensorBoardSink(object):
+    '''
+    Forwards records to a TensorBoard SummaryWriter from a background
+    thread so event-file I/O never blocks the training loop.
+    '''
+    def __init__(self, log_dir):
+        try:
+            from torch.utils.tensorboard import SummaryWriter
+        except ImportError:
+            from tensorboardX import SummaryWriter
+        self.summary_writer = SummaryWriter(log_dir)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            step = record['epoch']
+            for name, value in record.items():
+                if name != 'epoch' and value is not None:
+                    self.summary_writer.add_scalar(name, value, step)
+            self.summary_writer.flush()
+
+    def write(self, record):
+        self.queue.put(dict(record))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.summary_writer.close()
+
+
+class MetricLogger(object):
+    '''
+    Fans every epoch record out to the configured sinks.
+    A log_file ending in .csv is written as CSV, anything else as JSON lines.
+    '''
+    def __init__(self, log_file=None, tensorboard_dir=None):
+        self.sinks = []
+        if log_file is not None:
+            if log_file.endswith('.csv'):
+                self.sinks.append(CSVSink(log_file))
+            else:
+                self.sinks.append(JSONLSink(log_file))
+        if tensorboard_dir is not None:
+            self.sinks.append(TensorBoardSink(tensorboard_dir))
+
+    def write(self, record):
+        for sink in self.sinks:
+            sink.write(record)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
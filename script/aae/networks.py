@@ -0,0 +1,253 @@
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+##################################
+# Define Networks
+##################################
+# Encoder
+class Q_net(nn.Module):
+    '''
+    Encoder. With n_classes > 0 it also outputs the categorical code (y)
+    and forward returns (xcat, xgauss) instead of xgauss.
+    '''
+    def __init__(self, X_dim=784, N=1000, z_dim=2, n_classes=0, p=0.2):
+        super(Q_net, self).__init__()
+        self.p = p
+        self.lin1 = nn.Linear(X_dim, N)
+        self.lin2 = nn.Linear(N, N)
+        # Gaussian code (z)
+        self.lin3gauss = nn.Linear(N, z_dim)
+        # Categorical code (y)
+        self.lin3cat = nn.Linear(N, n_classes) if n_classes else None
+
+    def forward(self, x):
+        x = F.dropout(self.lin1(x), p=self.p, training=self.training)
+        x = F.relu(x)
+        x = F.dropout(self.lin2(x), p=self.p, training=self.training)
+        x = F.relu(x)
+        xgauss = self.lin3gauss(x)
+        if self.lin3cat is None:
+            return xgauss
+        xcat = F.softmax(self.lin3cat(x), dim=1)
+
+        return xcat, xgauss
+
+
+# Decoder
+def conditional_linear(lin1, z_gauss, labels):
+    '''
+    lin1 of the one-hot labels concatenated in front of z_gauss, computed as
+    the projection of z_gauss plus the class columns of the weight looked up
+    by label, without building the one-hot codes. Every label must be a
+    class: a negative index would select a column of the Gaussian code.
+    The callers validate the labels where they come in (check_labels), this
+    only asserts it on the device, without waiting for the GPU.
+    '''
+    n_classes = lin1.in_features - z_gauss.size(1)
+    torch._assert_async(((labels >= 0) & (labels < n_classes)).all(),
+                        'conditional decoding needs labels in [0, {})'.format(n_classes))
+    return F.linear(z_gauss, lin1.weight[:, n_classes:], lin1.bias) + lin1.weight.t()[labels]
+
+
+def check_labels(labels, n_classes):
+    '''
+    Raises ValueError unless every label is a class of [0, n_classes).
+    Waits for the labels on a GPU: call it once per request, not per batch.
+    '''
+    labels = torch.as_tensor(labels)
+    if labels.numel() and (labels.min() < 0 or labels.max() >= n_classes):
+        raise ValueError('conditional decoding needs labels in [0, {}), unlabeled samples (-1) '
+                         'have no class'.format(n_classes))
+
+
+class P_net(nn.Module):
+    '''
+    Decoder. With n_classes > 0 its input is the one-hot (or softmax) class
+    concatenated in front of the Gaussian code; conditional() takes the
+    classes as labels instead of one-hot codes.
+    '''
+    def __init__(self, X_dim=784, N=1000, z_dim=2, n_classes=0, p=0.2):
+        super(P_net, self).__init__()
+        self.p = p
+        self.lin1 = nn.Linear(z_dim + n_classes, N)
+        self.lin2 = nn.Linear(N, N)
+        self.lin3 = nn.Linear(N, X_dim)
+
+    def forward(self, x):
+        return self._decode(self.lin1(x))
+
+    def conditional(self, z_gauss, labels):
+        return self._decode(conditional_linear(self.lin1, z_gauss, labels))
+
+    def _decode(self, x):
+        x = F.dropout(x, p=self.p, training=self.training)
+        x = F.relu(x)
+        x = self.lin2(x)
+        x = F.dropout(x, p=self.p, training=self.training)
+        x = self.lin3(x)
+        return torch.sigmoid(x)
+
+
+# Discriminator networks
+class D_net_cat(nn.Module):
+    def __init__(self, n_classes=10, N=1000):
+        super(D_net_cat, self).__init__()
+        self.lin1 = nn.Linear(n_classes, N)
+        self.lin2 = nn.Linear(N, N)
+        self.lin3 = nn.Linear(N, 1)
+
+    def forward(self, x):
+        x = self.lin1(x)
+        x = F.relu(x)
+        x = F.dropout(x, p=0.2, training=self.training)
+        x = self.lin2(x)
+        x = F.relu(x)
+        x = self.lin3(x)
+        return torch.sigmoid(x)
+
+
+class D_net_gauss(nn.Module):
+    def __init__(self, z_dim=2, N=1000):
+        super(D_net_gauss, self).__init__()
+        self.lin1 = nn.Linear(z_dim, N)
+        self.lin2 = nn.Linear(N, N)
+        self.lin3 = nn.Linear(N, 1)
+
+    def forward(self, x):
+        x = F.dropout(self.lin1(x), p=0.2, training=self.training)
+        x = F.relu(x)
+        x = F.dropout(self.lin2(x), p=0.2, training=self.training)
+        x = F.relu(x)
+
+        return torch.sigmoid(self.lin3(x))
+
+
+##################################
+# Convolutional backbone
+##################################
+def conv_widths(image_shape, width=32, min_size=4):
+    '''
+    Channels of the stride-2 stages that bring image_shape (C, H, W) down
+    to at most min_size x min_size; they double up to 8 * width.
+    return: the widths and the (h, w) size after the last stage
+    '''
+    _, h, w = image_shape
+    widths = []
+    while max(h, w) > min_size:
+        widths.append(width * 2 ** min(len(widths), 3))
+        h, w = (h + 1) // 2, (w + 1) // 2
+    return widths, (h, w)
+
+
+def conv_relu(n_in, n_out):
+    # Conv followed by ReLU, the pattern oneDNN fuses into one primitive
+    # (torch.jit.freeze, torch.compile)
+    return nn.Sequential(nn.Conv2d(n_in, n_out, 3, stride=2, padding=1), nn.ReLU(inplace=True))
+
+
+class Q_conv(nn.Module):
+    '''
+    Convolutional encoder with the interface of Q_net: it takes flat
+    (batch, C*H*W) inputs and computes in the channels_last layout. The
+    number of parameters grows with the log of the image size only.
+    '''
+    def __init__(self, image_shape=(1, 28, 28), width=32, z_dim=2, n_classes=0, p=0.2):
+        super(Q_conv, self).__init__()
+        self.image_shape = tuple(image_shape)
+        self.in_features = int(np.prod(self.image_shape))
+        self.p = p
+        widths, (h, w) = conv_widths(self.image_shape, width)
+        self.convs = nn.Sequential(*[conv_relu(n_in, n_out)
+                                     for n_in, n_out in zip((self.image_shape[0],) + tuple(widths[:-1]), widths)])
+        self.convs.to(memory_format=torch.channels_last)
+        features = widths[-1] * h * w
+        # Gaussian code (z)
+        self.lin3gauss = nn.Linear(features, z_dim)
+        # Categorical code (y)
+        self.lin3cat = nn.Linear(features, n_classes) if n_classes else None
+
+    def forward(self, x):
+        x = x.view((x.size(0),) + self.image_shape).contiguous(memory_format=torch.channels_last)
+        x = self.convs(x).flatten(1)
+        x = F.dropout(x, p=self.p, training=self.training)
+        xgauss = self.lin3gauss(x)
+        if self.lin3cat is None:
+            return xgauss
+        xcat = F.softmax(self.lin3cat(x), dim=1)
+
+        return xcat, xgauss
+
+
+class P_conv(nn.Module):
+    '''
+    Convolutional decoder with the interface of P_net: lin1 maps the
+    (class and) Gaussian code to a small feature map that transposed
+    convolutions upsample to the image, returned flat.
+    '''
+    def __init__(self, image_shape=(1, 28, 28), width=32, z_dim=2, n_classes=0, p=0.2):
+        super(P_conv, self).__init__()
+        self.image_shape = tuple(image_shape)
+        self.p = p
+        widths, self.map_size = conv_widths(self.image_shape, width)
+        self.map_channels = widths[-1]
+        self.lin1 = nn.Linear(z_dim + n_classes, widths[-1] * self.map_size[0] * self.map_size[1])
+        layers = []
+        for n_in, n_out in zip(widths[::-1], widths[-2::-1]):
+            layers += [nn.ConvTranspose2d(n_in, n_out, 4, stride=2, padding=1), nn.ReLU(inplace=True)]
+        layers.append(nn.ConvTranspose2d(widths[0], self.image_shape[0], 4, stride=2, padding=1))
+        self.deconvs = nn.Sequential(*layers)
+        self.deconvs.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        return self._decode(self.lin1(x))
+
+    def conditional(self, z_gauss, labels):
+        return self._decode(conditional_linear(self.lin1, z_gauss, labels))
+
+    def _decode(self, x):
+        x = F.relu(F.dropout(x, p=self.p, training=self.training))
+        x = x.view(x.size(0), self.map_channels, *self.map_size).contiguous(memory_format=torch.channels_last)
+        x = self.deconvs(x)
+        # The upsampled map can be larger than the image
+        x = x[:, :, :self.image_shape[1], :self.image_shape[2]]
+        return torch.sigmoid(x).reshape(x.size(0), -1)
+
+
+##################################
+# Factory
+##################################
+BACKBONES = ('mlp', 'conv')
+
+
+def _image_shape(params):
+    image_shape = tuple(params.get('image_shape') or (1, 28, 28))
+    if int(np.prod(image_shape)) != params['X_dim']:
+        raise ValueError('image_shape {} does not match X_dim {}'.format(image_shape, params['X_dim']))
+    return image_shape
+
+
+def build_encoder(params, n_classes=0, p=0.2):
+    '''
+    Encoder of params['backbone'] ('mlp', the default, or 'conv')
+    '''
+    backbone = params.get('backbone') or 'mlp'
+    if backbone == 'mlp':
+        return Q_net(params['X_dim'], params['N'], params['z_dim'], n_classes, p=p)
+    if backbone == 'conv':
+        return Q_conv(_image_shape(params), params.get('conv_width', 32), params['z_dim'], n_classes, p=p)
+    raise ValueError('Unknown backbone: {}'.format(backbone))
+
+
+def build_decoder(params, n_classes=0, p=0.2):
+    '''
+    Decoder of params['backbone'] ('mlp', the default, or 'conv')
+    '''
+    backbone = params.get('backbone') or 'mlp'
+    if backbone == 'mlp':
+        return P_net(params['X_dim'], params['N'], params['z_dim'], n_classes, p=p)
+    if backbone == 'conv':
+        return P_conv(_image_shape(params), params.get('conv_width', 32), params['z_dim'], n_classes, p=p)
+    raise ValueError('Unknown backbone: {}'.format(backbone))
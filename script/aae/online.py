@@ -0,0 +1,360 @@
+'''
+Continual online training.
+
+The training loop pulls batches from an iterable source instead of a fixed
+dataset, runs the reconstruction, regularization and (semi-)supervised
+phases on every batch with the mode's train_step, and publishes snapshots
+of the networks at fixed step or time intervals without pausing.
+
+Sources yield (X, target) chunks of any length: X uint8 images (n, 28, 28)
+or floats between 0 and 1 (n, X_dim), target the labels with -1 for the
+unlabeled samples. Backpressure is explicit in every source:
+    QueueSource: a bounded queue, producers block, fail or drop the oldest
+        chunk when it is full
+    DirectorySource: files are only read when the trainer needs data, so
+        unread files simply accumulate on disk; pending() reports how many
+    SocketSource: the socket is only read when the trainer needs data, so
+        fast producers are throttled by TCP flow control
+'''
+import collections
+import glob
+import importlib
+import io
+import os
+import shutil
+import socket
+import struct
+import threading
+import time
+import traceback
+
+import numpy as np
+import torch
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .metrics import EpochMetrics, MetricLogger
+from .schedule import AdversarialSchedule
+
+
+def to_batch(X, target):
+    '''
+    return: float (n, X_dim) tensor between 0 and 1 and int64 labels
+    '''
+    X = torch.as_tensor(np.asarray(X))
+    if X.dtype == torch.uint8:
+        X = X.float().div_(255.)
+    X = X.float().view(X.size(0), -1)
+    if target is None:
+        target = torch.full((X.size(0),), -1, dtype=torch.int64)
+    return X, torch.as_tensor(np.asarray(target)).long().view(-1)
+
+
+####################
+# Sources
+####################
+class QueueSource(object):
+    '''
+    In-process source fed with put().
+    policy is what put() does when maxsize chunks are already waiting:
+    'block' waits for room (up to timeout), 'error' raises queue.Full and
+    'drop_oldest' discards the oldest waiting chunk.
+    '''
+    def __init__(self, maxsize=64, policy='block'):
+        if policy not in ('block', 'error', 'drop_oldest'):
+            raise ValueError('Unknown backpressure policy: {}'.format(policy))
+        self.queue = queue.Queue(maxsize)
+        self.policy = policy
+        self.dropped = 0
+
+    def put(self, X, target=None, timeout=None):
+        item = to_batch(X, target)
+        if self.policy == 'block':
+            self.queue.put(item, timeout=timeout)
+        elif self.policy == 'error':
+            self.queue.put_nowait(item)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def close(self):
+        # Blocks like put() so that no chunk is dropped
+        self.queue.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            yield item
+
+
+class DirectorySource(object):
+    '''
+    Watches path for new <name>.npy files of uint8 images, with the labels
+    in an optional <name>.labels.npy (the layout written by generate).
+    Files are consumed in modification-time order and moved to path/done.
+    Producers should write under another name and rename, so that
+    half-written files are never read.
+    '''
+    def __init__(self, path, poll_interval=1., stop_when_empty=False):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.stop_when_empty = stop_when_empty
+        self.done_dir = os.path.join(path, 'done')
+        if not os.path.isdir(self.done_dir):
+            os.makedirs(self.done_dir)
+
+    def _files(self):
+        files = [f for f in glob.glob(os.path.join(self.path, '*.npy'))
+                 if not f.endswith(('.labels.npy', '.tmp.npy'))]
+        return sorted(files, key=os.path.getmtime)
+
+    def pending(self):
+        return len(self._files())
+
+    def __iter__(self):
+        while True:
+            files = self._files()
+            if not files:
+                if self.stop_when_empty:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            for filename in files:
+                labels_file = filename[:-len('.npy')] + '.labels.npy'
+                X = np.load(filename)
+                target = np.load(labels_file) if os.path.exists(labels_file) else None
+                shutil.move(filename, os.path.join(self.done_dir, os.path.basename(filename)))
+                if target is not None:
+                    shutil.move(labels_file, os.path.join(self.done_dir, os.path.basename(labels_file)))
+                yield to_batch(X, target)
+
+
+class SocketSource(object):
+    '''
+    Listens on (host, port) for producers sending messages made of an 8-byte
+    big-endian length followed by an .npz holding X and optionally target.
+    '''
+    def __init__(self, host='127.0.0.1', port=5555):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+
+    @staticmethod
+    def _recv(conn, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                return None
+            data.extend(chunk)
+        return bytes(data)
+
+    def __iter__(self):
+        while True:
+            conn, _ = self.server.accept()
+            with conn:
+                while True:
+                    header = self._recv(conn, 8)
+                    if header is None:
+                        break
+                    payload = self._recv(conn, struct.unpack('>Q', header)[0])
+                    if payload is None:
+                        break
+                    arrays = np.load(io.BytesIO(payload))
+                    yield to_batch(arrays['X'], arrays['target'] if 'target' in arrays.files else None)
+
+    def close(self):
+        self.server.close()
+
+
+def send_batch(conn, X, target=None):
+    '''
+    Producer side of SocketSource
+    '''
+    buf = io.BytesIO()
+    if target is None:
+        np.savez(buf, X=X)
+    else:
+        np.savez(buf, X=X, target=target)
+    payload = buf.getvalue()
+    conn.sendall(struct.pack('>Q', len(payload)) + payload)
+
+
+def rebatch(source, batch_size):
+    '''
+    Regroups the chunks of source into batches of exactly batch_size samples.
+    A batch within one chunk is a view of it, only the batches that span
+    several chunks are copied.
+    '''
+    chunks = collections.deque()
+    # Position in the first chunk and samples left in all the chunks
+    offset, n = 0, 0
+    for X, target in source:
+        chunks.append((X, target))
+        n += X.size(0)
+        while n >= batch_size:
+            X_parts, target_parts, needed = [], [], batch_size
+            while needed:
+                X_chunk, target_chunk = chunks[0]
+                take = min(needed, X_chunk.size(0) - offset)
+                X_parts.append(X_chunk[offset:offset + take])
+                target_parts.append(target_chunk[offset:offset + take])
+                offset += take
+                needed -= take
+                if offset == X_chunk.size(0):
+                    chunks.popleft()
+                    offset = 0
+            n -= batch_size
+            if len(X_parts) == 1:
+                yield X_parts[0], target_parts[0]
+            else:
+                yield torch.cat(X_parts), torch.cat(target_parts)
+
+
+####################
+# Trainer
+####################
+class OnlineTrainer(object):
+    '''
+    Trains the networks of a mode module (basic, supervised or
+    semisupervised) on the batches of a source.
+    Every snapshot_every steps, or snapshot_interval seconds, the networks
+    are copied to the host and saved to snapshot_dir/step-<step> by a
+    background thread, and snapshot_dir/latest is updated atomically.
+    An error of the background thread is raised by the next snapshot or
+    at the end of run(), where it is only printed when training itself
+    failed.
+    '''
+    def __init__(self, module, nets, solvers, params, snapshot_dir,
+                 snapshot_every=1000, snapshot_interval=None, log_file=None):
+        self.module = module
+        self.nets = nets
+        self.solvers = solvers
+        self.params = params
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self.logger = MetricLogger(log_file)
+        self.schedule = AdversarialSchedule.from_params(params)
+        self.step = 0
+        self.n_snapshots = 0
+        self.snapshot_step = None
+        self.writer = None
+        self.writer_error = None
+
+    def snapshot(self):
+        state = dict((name, {k: v.detach().cpu().clone() for k, v in net.state_dict().items()})
+                     for name, net in self.nets.items())
+        self.wait()
+        self.writer = threading.Thread(target=self._write_snapshot, args=(state, self.step))
+        self.writer.start()
+        self.n_snapshots += 1
+        self.snapshot_step = self.step
+
+    def wait(self):
+        '''
+        Waits for the snapshot being written and raises its error, if any
+        '''
+        if self.writer is not None:
+            self.writer.join()
+            self.writer = None
+        if self.writer_error is not None:
+            error, self.writer_error = self.writer_error, None
+            raise error
+
+    def _write_snapshot(self, state, step):
+        try:
+            self._save_snapshot(state, step)
+        except Exception as e:
+            self.writer_error = e
+
+    def _save_snapshot(self, state, step):
+        path = os.path.join(self.snapshot_dir, 'step-{:010d}'.format(step))
+        tmp = path + '.tmp'
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for name, state_dict in state.items():
+            torch.save(state_dict, os.path.join(tmp, name + '.pt'))
+        # A restart in the same snapshot_dir can reach the steps of the previous run again
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+        latest = os.path.join(self.snapshot_dir, 'latest')
+        with open(latest + '.tmp', 'w') as f:
+            f.write(os.path.basename(path) + '\n')
+        os.replace(latest + '.tmp', latest)
+
+    def run(self, source, max_steps=None):
+        '''
+        Trains until the source is exhausted or max_steps steps have run
+        '''
+        batches = rebatch(source, self.params['train_batch_size'])
+        metrics = EpochMetrics(self.params.get('track_memory', False))
+        last_snapshot = time.time()
+        try:
+            for X, target in batches:
+                if self.params['cuda']:
+                    X, target = X.cuda(), target.cuda()
+                self.module.train_step(self.nets, self.solvers, X, target, self.params, metrics, self.schedule)
+                self.step += 1
+
+                due = self.step % self.snapshot_every == 0
+                if self.snapshot_interval is not None:
+                    due = due or time.time() - last_snapshot >= self.snapshot_interval
+                if due:
+                    record = metrics.summary(self.n_snapshots)
+                    record['step'] = self.step
+                    self.logger.write(record)
+                    self.snapshot()
+                    metrics = EpochMetrics(self.params.get('track_memory', False))
+                    last_snapshot = time.time()
+                if max_steps is not None and self.step >= max_steps:
+                    break
+        except BaseException:
+            # The last snapshot must not replace the error of the training loop
+            try:
+                self._last_snapshot()
+            except Exception:
+                print('The last snapshot at step {} failed:\n{}'.format(self.step, traceback.format_exc()))
+            raise
+        else:
+            self._last_snapshot()
+        finally:
+            self.logger.close()
+
+    def _last_snapshot(self):
+        if self.snapshot_step != self.step:
+            self.snapshot()
+        self.wait()
+
+
+def online_train(mode, source, params, snapshot_dir, model_dir=None, max_steps=None, **kwargs):
+    '''
+    Builds the networks of mode ('basic', 'supervised' or 'semi'), optionally
+    starting from the networks saved in model_dir, and trains them on source
+    return: the OnlineTrainer
+    '''
+    from .cli import MODES
+    from .utils import load_networks
+    module = importlib.import_module('.' + MODES[mode], __package__)
+    nets = module.create_networks(params)
+    if model_dir is not None:
+        load_networks(nets, model_dir)
+    trainer = OnlineTrainer(module, nets, module.create_solvers(nets), params, snapshot_dir, **kwargs)
+    trainer.run(source, max_steps=max_steps)
+    return trainer
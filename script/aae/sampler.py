@@ -0,0 +1,81 @@
+import collections
+
+import torch
+
+
+class PrioritizedSampler(torch.utils.data.Sampler):
+    '''
+    Batch sampler drawing samples with probability
+
+        p_i = (1 - uniform_mix) * l_i^alpha / sum_j l_j^alpha + uniform_mix / n
+
+    where l_i is the latest reconstruction loss of sample i (samples not seen
+    yet get the largest loss so far). Every batch comes with the importance
+    weights (n * p_i)^-beta / max_batch, which make the weighted loss an
+    unbiased estimate of the uniform one.
+
+    Use it as the batch_sampler of a DataLoader. The batches are queued as
+    they are drawn, and train() takes the indices and weights of the batch
+    it is processing with pop() and reports its losses with update().
+    The losses stay on the device they were computed on: update() never
+    waits for the device, the probabilities are copied to the host once per
+    epoch, when the batches of the epoch are drawn.
+    '''
+    def __init__(self, n_samples, batch_size, alpha=0.6, beta=0.4, uniform_mix=0.1, n_batches=None):
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.alpha = alpha
+        self.beta = beta
+        self.uniform_mix = uniform_mix
+        self.n_batches = n_batches or n_samples // batch_size
+        self.losses = torch.zeros(n_samples)
+        self.seen = torch.zeros(n_samples, dtype=torch.bool)
+        self.pending = collections.deque()
+
+    def __len__(self):
+        return self.n_batches
+
+    def probabilities(self):
+        # One transfer from the device of the losses, -1 marks the unseen samples
+        losses = torch.where(self.seen, self.losses, torch.full_like(self.losses, -1.)).cpu()
+        seen = losses >= 0
+        if not seen.all():
+            losses[~seen] = losses.max() if seen.any() else 1.
+        priorities = losses.clamp(min=1e-12) ** self.alpha
+        return (1. - self.uniform_mix) * priorities / priorities.sum() + self.uniform_mix / self.n_samples
+
+    def __iter__(self):
+        self.pending.clear()
+        probs = self.probabilities()
+        for _ in range(self.n_batches):
+            indices = torch.multinomial(probs, self.batch_size, replacement=True)
+            weights = (self.n_samples * probs[indices]) ** -self.beta
+            self.pending.append((indices, weights / weights.max()))
+            yield indices.tolist()
+
+    def pop(self):
+        '''
+        return: indices and importance weights of the oldest batch not yet trained on
+        '''
+        return self.pending.popleft()
+
+    def update(self, indices, losses):
+        '''
+        Records the per-sample losses of the samples at indices, on the
+        device of losses
+        '''
+        losses = losses.detach().float()
+        if self.losses.device != losses.device:
+            self.losses, self.seen = self.losses.to(losses.device), self.seen.to(losses.device)
+        indices = torch.as_tensor(indices).to(losses.device, non_blocking=True)
+        self.losses[indices] = losses
+        self.seen[indices] = True
+
+
+def prioritized_loader(dataset, params, **kwargs):
+    '''
+    DataLoader over dataset sampling with a PrioritizedSampler configured
+    by params['prioritized'] (alpha, beta, uniform_mix)
+    '''
+    sampler = PrioritizedSampler(len(dataset), params['train_batch_size'], **params['prioritized'])
+    return torch.utils.data.DataLoader(dataset, batch_sampler=sampler, **kwargs)
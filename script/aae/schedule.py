@@ -0,0 +1,71 @@
+class AdversarialSchedule(object):
+    '''
+    Decides how many discriminator and generator updates the regularization
+    phase runs on each batch.
+
+        d_steps, g_steps: updates per regularized batch (k:1 D:G ratios)
+        every: regularize every n-th batch only
+        d_min_loss: skip the discriminator updates while its loss is below,
+            i.e. while it is saturated and only starves the generator
+        d_max_loss: skip the generator updates while the discriminator loss
+            is above, i.e. while the discriminator is badly losing
+        max_skip: after this many consecutive skips of an update, run it
+            anyway, which also refreshes the loss the thresholds look at
+
+    The discriminator loss is the mean over the discriminators, so the same
+    thresholds apply to every mode (2 log 2 ~ 1.39 at the equilibrium).
+    Thresholds read the loss on the host, once per discriminator update.
+    The defaults run one update of each on every batch.
+    '''
+    def __init__(self, d_steps=1, g_steps=1, every=1, d_min_loss=None, d_max_loss=None, max_skip=10):
+        if d_steps < 1 or g_steps < 1 or every < 1:
+            raise ValueError('d_steps, g_steps and every have to be positive')
+        self.d_steps = d_steps
+        self.g_steps = g_steps
+        self.every = every
+        self.d_min_loss = d_min_loss
+        self.d_max_loss = d_max_loss
+        self.max_skip = max_skip
+        self.batch = 0
+        self.d_loss = None
+        self.d_skipped = 0
+        self.g_skipped = 0
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(**(params.get('schedule') or {}))
+
+    def next_batch(self):
+        '''
+        return: numbers of discriminator and generator updates to run on the next batch
+        '''
+        self.batch += 1
+        if (self.batch - 1) % self.every:
+            return 0, 0
+
+        d_steps, g_steps = self.d_steps, self.g_steps
+        if self.d_loss is not None:
+            if self.d_min_loss is not None and self.d_loss < self.d_min_loss and self.d_skipped < self.max_skip:
+                d_steps = 0
+            if self.d_max_loss is not None and self.d_loss > self.d_max_loss and self.g_skipped < self.max_skip:
+                g_steps = 0
+        self.d_skipped = 0 if d_steps else self.d_skipped + 1
+        self.g_skipped = 0 if g_steps else self.g_skipped + 1
+        return d_steps, g_steps
+
+    def observe(self, *d_losses):
+        '''
+        Records the losses of the discriminators after an update
+        '''
+        if self.d_min_loss is not None or self.d_max_loss is not None:
+            self.d_loss = sum(float(loss) for loss in d_losses) / len(d_losses)
+
+    def state_dict(self):
+        return {'batch': self.batch, 'd_loss': self.d_loss,
+                'd_skipped': self.d_skipped, 'g_skipped': self.g_skipped}
+
+    def load_state_dict(self, state):
+        self.batch = state['batch']
+        self.d_loss = state['d_loss']
+        self.d_skipped = state['d_skipped']
+        self.g_skipped = state['g_skipped']
@@ -0,0 +1,154 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from .generate import inference_mode
+
+
+SCORE_COLUMNS = ['recon_error', 'latent_norm', 'disc_score']
+
+
+####################
+# Scoring
+####################
+def score_batch(Q, P, D_gauss, X, target):
+    '''
+    Per-sample anomaly scores of one normalized batch
+    return:
+        recon_error: BCE between P(Q(X)) and X averaged over the pixels,
+            nan for the unlabeled samples of a supervised decoder
+        latent_norm: euclidean norm of the Gaussian code
+        disc_score: D_gauss output for the code (nan without D_gauss)
+    '''
+    out = Q(X)
+    z_gauss = out[1] if isinstance(out, tuple) else out
+    recon_error = reconstruction_error(P, out, X, target)
+    latent_norm = z_gauss.norm(2, 1)
+    if D_gauss is not None:
+        disc_score = D_gauss(z_gauss).view(-1)
+    else:
+        disc_score = torch.full_like(latent_norm, float('nan'))
+    return recon_error, latent_norm, disc_score
+
+
+def reconstruction_error(P, out, X, target):
+    '''
+    Per-sample BCE between X and its reconstruction from the encoder output
+    out, nan for the unlabeled samples (target -1) of a supervised decoder
+    '''
+    TINY = 1e-15
+    if isinstance(out, tuple):
+        X_sample = P(torch.cat(out, 1))
+    elif out.size(1) < P.lin1.in_features:
+        # Supervised decoder, condition on the true class; the unlabeled rows have none
+        unlabeled = target < 0
+        X_sample = P.conditional(out, target.masked_fill(unlabeled, 0))
+        error = F.binary_cross_entropy(X_sample + TINY, X + TINY, reduction='none').mean(1)
+        return error.masked_fill(unlabeled, float('nan'))
+    else:
+        X_sample = P(out)
+    return F.binary_cross_entropy(X_sample + TINY, X + TINY, reduction='none').mean(1)
+
+
+def score_range(Q, P, D_gauss, dataset, start, stop, out, cuda=False, batch_size=1000):
+    '''
+    Scores the samples [start, stop) of dataset into the rows of the
+    (len(dataset), 3) array out
+    '''
+    subset = torch.utils.data.Subset(dataset, list(range(start, stop)))
+    loader = torch.utils.data.DataLoader(subset, batch_size=batch_size, shuffle=False)
+    for net in (Q, P, D_gauss):
+        if net is not None:
+            net.eval()
+
+    row = start
+    with inference_mode():
+        for X, target in loader:
+            X = X * 0.3081 + 0.1307
+            X = X.view(X.size(0), -1)
+            if cuda:
+                X, target = X.cuda(), target.cuda()
+            scores = score_batch(Q, P, D_gauss, X, target)
+            out[row:row + len(X)] = torch.stack(scores, 1).cpu().numpy()
+            row += len(X)
+
+
+####################
+# Process pool
+####################
+_worker = {}
+
+
+def _init_worker(nets, dataset, scores_file, threads):
+    torch.set_num_threads(threads)
+    _worker['nets'] = nets
+    _worker['dataset'] = dataset
+    _worker['scores'] = np.load(scores_file, mmap_mode='r+')
+
+
+def _score_shard_job(job):
+    start, stop, batch_size = job
+    Q, P, D_gauss = _worker['nets']
+    score_range(Q, P, D_gauss, _worker['dataset'], start, stop, _worker['scores'],
+                batch_size=batch_size)
+    _worker['scores'].flush()
+    return stop - start
+
+
+def score_dataset(Q, P, dataset, out_dir, D_gauss=None, shard_size=10000,
+                  batch_size=1000, top_k=100, processes=None, cuda=False):
+    '''
+    Anomaly scores of every sample of dataset, computed in shards of
+    shard_size samples spread over a pool of processes.
+    Writes to out_dir:
+        scores.npy: (len(dataset), 3) float32 array with SCORE_COLUMNS
+        top_anomalies.json: the top_k samples with the largest recon_error
+    return: the scores, memory-mapped
+    '''
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    n = len(dataset)
+    scores_file = os.path.join(out_dir, 'scores.npy')
+    scores = np.lib.format.open_memmap(scores_file, mode='w+', dtype='float32', shape=(n, 3))
+
+    jobs = [(start, min(start + shard_size, n), batch_size) for start in range(0, n, shard_size)]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+
+    if processes == 1 or cuda:
+        for start, stop, _ in jobs:
+            score_range(Q, P, D_gauss, dataset, start, stop, scores, cuda, batch_size)
+        scores.flush()
+    else:
+        scores.flush()
+        threads = max(1, multiprocessing.cpu_count() // processes)
+        pool = multiprocessing.Pool(processes, _init_worker,
+                                    ((Q, P, D_gauss), dataset, scores_file, threads))
+        try:
+            pool.map(_score_shard_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    del scores
+
+    scores = np.load(scores_file, mmap_mode='r')
+    write_top_anomalies(scores, os.path.join(out_dir, 'top_anomalies.json'), top_k)
+    return scores
+
+
+def write_top_anomalies(scores, filename, top_k=100):
+    recon_error = np.asarray(scores[:, 0])
+    # Unscored samples (nan) are never anomalies
+    recon_error = np.where(np.isnan(recon_error), -np.inf, recon_error)
+    top_k = min(top_k, int(np.isfinite(recon_error).sum()))
+    top = np.argpartition(-recon_error, top_k - 1)[:top_k] if top_k else np.zeros(0, 'int64')
+    top = top[np.argsort(-recon_error[top])]
+    records = [dict(index=int(i), **{c: float(scores[i, j]) for j, c in enumerate(SCORE_COLUMNS)})
+               for i in top]
+    with open(filename, 'w') as f:
+        json.dump(records, f, indent=2)
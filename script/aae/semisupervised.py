@@ -0,0 +1,457 @@
+import sys
+import time
+
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.autograd import Variable
+
+from .checkpoint import Checkpointer
+from .data import map_dataset
+from .evaluation import AsyncEvaluator, EarlyStopping
+from .metrics import EpochMetrics, MetricLogger, track_phase
+from .networks import D_net_cat, D_net_gauss, build_decoder, build_encoder
+from .sampler import PrioritizedSampler
+from .schedule import AdversarialSchedule
+from .utils import sample_categorical, save_networks, zero_grad
+
+TINY = 1e-15
+# Standard deviation of the Gaussian prior imposed on the latent code
+PRIOR_STD = 1.
+
+
+def create_networks(params):
+    '''
+    return: dict with the encoder Q, decoder P and discriminators D_gauss and D_cat
+    '''
+    N, z_dim, n_classes = params['N'], params['z_dim'], params['n_classes']
+    nets = {'Q': build_encoder(params, n_classes, p=0.25),
+            'P': build_decoder(params, n_classes, p=0.25),
+            'D_gauss': D_net_gauss(z_dim, N),
+            'D_cat': D_net_cat(n_classes, N)}
+    if params['cuda']:
+        for net in nets.values():
+            net.cuda()
+    return nets
+
+
+def create_solvers(nets):
+    '''
+    return: dict with the optimizers of the networks of create_networks
+    '''
+    Q, P, D_cat, D_gauss = nets['Q'], nets['P'], nets['D_cat'], nets['D_gauss']
+
+    # Set learning rates
+    gen_lr = 0.0006
+    semi_lr = 0.001
+    reg_lr = 0.0008
+
+    # Set optimizators
+    return {'P_decoder': optim.Adam(P.parameters(), lr=gen_lr),
+            'Q_encoder': optim.Adam(Q.parameters(), lr=gen_lr),
+            'Q_semi_supervised': optim.Adam(Q.parameters(), lr=semi_lr),
+            'Q_generator': optim.Adam(Q.parameters(), lr=reg_lr),
+            'D_gauss_solver': optim.Adam(D_gauss.parameters(), lr=reg_lr),
+            'D_cat_solver': optim.Adam(D_cat.parameters(), lr=reg_lr)}
+
+
+def report_loss(record):
+    '''
+    Print the epoch means of the losses and the numbers of regularization updates
+    '''
+    nan = float('nan')
+    print('Epoch-{}; D_loss_cat: {:.4}; D_loss_gauss: {:.4}; G_loss: {:.4}; recon_loss: {:.4}; '
+          'D/G steps: {}/{}; {:.1f} samples/s'.format(record['epoch'],
+                                                      record.get('D_loss_cat', nan),
+                                                      record.get('D_loss_gauss', nan),
+                                                      record.get('G_loss', nan),
+                                                      record['recon_loss'],
+                                                      record.get('D_steps', 0),
+                                                      record.get('G_steps', 0),
+                                                      record['samples_per_sec']))
+
+
+####################
+# Train procedure
+####################
+def reconstruction_phase(P, Q, X, P_decoder, Q_encoder):
+    z_sample = torch.cat(Q(X), 1)
+    X_sample = P(z_sample)
+
+    recon_loss = F.binary_cross_entropy(X_sample + TINY, X + TINY)
+    recon_loss.backward()
+    P_decoder.step()
+    Q_encoder.step()
+    return recon_loss
+
+
+def weighted_reconstruction_phase(P, Q, X, weights, P_decoder, Q_encoder):
+    '''
+    Reconstruction phase with per-sample importance weights
+    return: the weighted loss and the unweighted loss of every sample
+    '''
+    z_sample = torch.cat(Q(X), 1)
+    X_sample = P(z_sample)
+
+    sample_loss = F.binary_cross_entropy(X_sample + TINY, X + TINY, reduction='none').mean(1)
+    recon_loss = (sample_loss * weights).mean()
+    recon_loss.backward()
+    P_decoder.step()
+    Q_encoder.step()
+    return recon_loss, sample_loss
+
+
+def discriminator_phase(Q, D_cat, D_gauss, X, D_cat_solver, D_gauss_solver, params):
+    Q.eval()
+    z_real_cat = sample_categorical(X.size(0), n_classes=params['n_classes'])
+    z_real_gauss = Variable(torch.randn(X.size(0), params['z_dim']) * PRIOR_STD)
+    if params['cuda']:
+        z_real_cat = z_real_cat.cuda()
+        z_real_gauss = z_real_gauss.cuda()
+
+    z_fake_cat, z_fake_gauss = Q(X)
+
+    D_real_cat = D_cat(z_real_cat)
+    D_real_gauss = D_gauss(z_real_gauss)
+    D_fake_cat = D_cat(z_fake_cat)
+    D_fake_gauss = D_gauss(z_fake_gauss)
+
+    D_loss_cat = -torch.mean(torch.log(D_real_cat + TINY) + torch.log(1 - D_fake_cat + TINY))
+    D_loss_gauss = -torch.mean(torch.log(D_real_gauss + TINY) + torch.log(1 - D_fake_gauss + TINY))
+
+    D_loss = D_loss_cat + D_loss_gauss
+
+    D_loss.backward()
+    D_cat_solver.step()
+    D_gauss_solver.step()
+    return D_loss_cat, D_loss_gauss
+
+
+def generator_phase(Q, D_cat, D_gauss, X, Q_generator):
+    Q.train()
+    z_fake_cat, z_fake_gauss = Q(X)
+
+    D_fake_cat = D_cat(z_fake_cat)
+    D_fake_gauss = D_gauss(z_fake_gauss)
+
+    G_loss = - torch.mean(torch.log(D_fake_cat + TINY)) - torch.mean(torch.log(D_fake_gauss + TINY))
+    G_loss.backward()
+    Q_generator.step()
+    return G_loss
+
+
+def semi_supervised_phase(Q, X, target, Q_semi_supervised):
+    pred, _ = Q(X)
+    class_loss = F.cross_entropy(pred, target)
+    class_loss.backward()
+    Q_semi_supervised.step()
+    return class_loss
+
+
+def joint_phase(P, Q, X, target, P_decoder, Q_encoder, Q_semi_supervised):
+    '''
+    Reconstruction phase on the unlabeled rows of X (target -1) and
+    semi-supervised phase on the labeled rows from a single encoder forward
+    over the whole batch. Every optimizer still steps with the gradient of
+    its own loss; unlike the separate phases, both gradients are taken at
+    the weights before the reconstruction update.
+    return: recon_loss and class_loss (None without rows of that kind)
+    '''
+    unlabeled = target == -1
+    labeled = ~unlabeled
+    xcat, xgauss = Q(X)
+    Q_params, P_params = list(Q.parameters()), list(P.parameters())
+
+    recon_loss = class_loss = None
+    recon_grads = class_grads = ()
+    if unlabeled.any():
+        X_sample = P(torch.cat((xcat[unlabeled], xgauss[unlabeled]), 1))
+        recon_loss = F.binary_cross_entropy(X_sample + TINY, X[unlabeled] + TINY)
+    if labeled.any():
+        class_loss = F.cross_entropy(xcat[labeled], target[labeled])
+    if recon_loss is not None:
+        recon_grads = torch.autograd.grad(recon_loss, Q_params + P_params,
+                                          retain_graph=class_loss is not None, allow_unused=True)
+    if class_loss is not None:
+        class_grads = torch.autograd.grad(class_loss, Q_params, allow_unused=True)
+
+    def step(optimizer, params, grads):
+        for p, grad in zip(params, grads):
+            p.grad = grad
+        optimizer.step()
+
+    if recon_loss is not None:
+        step(P_decoder, P_params, recon_grads[len(Q_params):])
+        step(Q_encoder, Q_params, recon_grads[:len(Q_params)])
+    if class_loss is not None:
+        step(Q_semi_supervised, Q_params, class_grads)
+    return recon_loss, class_loss
+
+
+def regularization_phase(Q, D_cat, D_gauss, X, Q_generator, D_cat_solver, D_gauss_solver, params, schedule,
+                         metrics=None):
+    '''
+    The discriminator and generator updates the schedule asks for
+    return: dict with the last loss of every phase that ran
+    '''
+    d_steps, g_steps = schedule.next_batch()
+    losses = {}
+    for _ in range(d_steps):
+        losses['D_loss_cat'], losses['D_loss_gauss'] = discriminator_phase(Q, D_cat, D_gauss, X, D_cat_solver,
+                                                                           D_gauss_solver, params)
+        schedule.observe(losses['D_loss_cat'], losses['D_loss_gauss'])
+        zero_grad(Q, D_cat, D_gauss)
+    for _ in range(g_steps):
+        losses['G_loss'] = generator_phase(Q, D_cat, D_gauss, X, Q_generator)
+        zero_grad(Q, D_cat, D_gauss)
+    # The discriminator phase leaves the encoder in eval mode
+    Q.train()
+    if metrics is not None:
+        metrics.count(D_steps=d_steps, G_steps=g_steps)
+    return losses
+
+
+def train(P, Q, D_cat, D_gauss, P_decoder, Q_encoder, Q_semi_supervised, Q_generator, D_cat_solver, D_gauss_solver,
+          train_labeled_loader, train_unlabeled_loader, params, metrics=None, schedule=None):
+    '''
+    Train procedure for one epoch. schedule is the AdversarialSchedule of
+    the regularization phase (default: built from params['schedule']).
+    return: the EpochMetrics accumulated over every batch
+    '''
+    if metrics is None:
+        metrics = EpochMetrics(params.get('track_memory', False))
+    if schedule is None:
+        schedule = AdversarialSchedule.from_params(params)
+    train_batch_size = params['train_batch_size']
+    # Set the networks in train mode (apply dropout when needed)
+    Q.train()
+    P.train()
+    D_cat.train()
+    D_gauss.train()
+
+    if train_unlabeled_loader is None:
+        train_unlabeled_loader = train_labeled_loader
+    sampler = train_unlabeled_loader.batch_sampler
+    prioritized = isinstance(sampler, PrioritizedSampler)
+
+    if params.get('joint_batches'):
+        if prioritized:
+            raise ValueError('Joint batches do not support prioritized sampling')
+        nets = {'P': P, 'Q': Q, 'D_cat': D_cat, 'D_gauss': D_gauss}
+        solvers = {'P_decoder': P_decoder, 'Q_encoder': Q_encoder, 'Q_semi_supervised': Q_semi_supervised,
+                   'Q_generator': Q_generator, 'D_cat_solver': D_cat_solver, 'D_gauss_solver': D_gauss_solver}
+        # One batch made of the unlabeled and labeled samples, see train_step
+        for (X_l, target_l), (X_u, target_u) in zip(train_labeled_loader, train_unlabeled_loader):
+            X = torch.cat((X_u, X_l)) * 0.3081 + 0.1307
+            X, target = X.view(X.size(0), -1), torch.cat((target_u, target_l))
+            if params['cuda']:
+                X, target = X.cuda(), target.cuda()
+            train_step(nets, solvers, X, target, params, metrics, schedule)
+        return metrics
+
+    # Loop through the labeled and unlabeled dataset getting one batch of samples from each
+    # The batch size has to be a divisor of the size of the dataset or it will return
+    # invalid samples
+    for (X_l, target_l), (X_u, target_u) in zip(train_labeled_loader, train_unlabeled_loader):
+
+        for X, target in [(X_u, target_u), (X_l, target_l)]:
+            if target[0] == -1:
+                labeled = False
+            else:
+                labeled = True
+
+            # Load batch and normalize samples to be between 0 and 1
+            X = X * 0.3081 + 0.1307
+            X.resize_(train_batch_size, params['X_dim'])
+
+            X, target = Variable(X), Variable(target)
+            if params['cuda']:
+                X, target = X.cuda(), target.cuda()
+
+            # Init gradients
+            zero_grad(P, Q, D_cat, D_gauss)
+
+            if not labeled:
+                #######################
+                # Reconstruction phase
+                #######################
+                with metrics.phase('reconstruction'):
+                    if prioritized:
+                        indices, weights = sampler.pop()
+                        if params['cuda']:
+                            weights = weights.cuda()
+                        recon_loss, sample_loss = weighted_reconstruction_phase(P, Q, X, weights,
+                                                                                P_decoder, Q_encoder)
+                        sampler.update(indices, sample_loss)
+                    else:
+                        recon_loss = reconstruction_phase(P, Q, X, P_decoder, Q_encoder)
+                zero_grad(P, Q, D_cat, D_gauss)
+
+                #######################
+                # Regularization phase
+                #######################
+                with metrics.phase('regularization'):
+                    losses = regularization_phase(Q, D_cat, D_gauss, X, Q_generator, D_cat_solver,
+                                                  D_gauss_solver, params, schedule, metrics)
+
+                metrics.update(batch_size=train_batch_size, recon_loss=recon_loss, **losses)
+
+                zero_grad(P, Q, D_cat, D_gauss)
+
+            #######################
+            # Semi-supervised phase
+            #######################
+            if labeled:
+                with metrics.phase('semi_supervised'):
+                    class_loss = semi_supervised_phase(Q, X, target, Q_semi_supervised)
+
+                metrics.update(batch_size=train_batch_size, class_loss=class_loss)
+
+                zero_grad(P, Q, D_cat, D_gauss)
+
+    return metrics
+
+
+def train_epoch(nets, solvers, train_labeled_loader, train_unlabeled_loader, valid_loader, params, metrics=None,
+                schedule=None):
+    '''
+    train() with the networks of create_networks and the optimizers of create_solvers
+    '''
+    return train(nets['P'], nets['Q'], nets['D_cat'], nets['D_gauss'],
+                 solvers['P_decoder'], solvers['Q_encoder'], solvers['Q_semi_supervised'],
+                 solvers['Q_generator'], solvers['D_cat_solver'], solvers['D_gauss_solver'],
+                 train_labeled_loader, train_unlabeled_loader, params, metrics, schedule)
+
+
+def train_step(nets, solvers, X, target, params, metrics=None, schedule=None):
+    '''
+    One training step outside of an epoch, e.g. for online training.
+    X: (batch, X_dim) samples between 0 and 1, target: their labels, -1 for
+    the unlabeled samples. The unlabeled rows go through the reconstruction
+    and regularization phases, the labeled ones through the semi-supervised phase.
+    With params['joint_batches'] the reconstruction and semi-supervised
+    phases share one encoder forward (joint_phase).
+    schedule: the AdversarialSchedule to keep across steps (default: one
+    update of each adversarial phase)
+    return: dict with the losses of the step
+    '''
+    P, Q, D_cat, D_gauss = nets['P'], nets['Q'], nets['D_cat'], nets['D_gauss']
+    Q.train()
+    P.train()
+    D_cat.train()
+    D_gauss.train()
+
+    losses = {}
+    unlabeled = target == -1
+    X_u, X_l, target_l = X[unlabeled], X[~unlabeled], target[~unlabeled]
+
+    zero_grad(P, Q, D_cat, D_gauss)
+    if params.get('joint_batches'):
+        with track_phase(metrics, 'joint'):
+            recon_loss, class_loss = joint_phase(P, Q, X, target, solvers['P_decoder'], solvers['Q_encoder'],
+                                                 solvers['Q_semi_supervised'])
+        zero_grad(P, Q, D_cat, D_gauss)
+        if recon_loss is not None:
+            losses['recon_loss'] = recon_loss
+        if class_loss is not None:
+            losses['class_loss'] = class_loss
+    elif X_u.size(0):
+        with track_phase(metrics, 'reconstruction'):
+            losses['recon_loss'] = reconstruction_phase(P, Q, X_u, solvers['P_decoder'], solvers['Q_encoder'])
+        zero_grad(P, Q, D_cat, D_gauss)
+    if X_u.size(0):
+        if schedule is None:
+            schedule = AdversarialSchedule()
+        with track_phase(metrics, 'regularization'):
+            losses.update(regularization_phase(Q, D_cat, D_gauss, X_u, solvers['Q_generator'],
+                                               solvers['D_cat_solver'], solvers['D_gauss_solver'], params,
+                                               schedule, metrics))
+        zero_grad(P, Q, D_cat, D_gauss)
+    if X_l.size(0) and not params.get('joint_batches'):
+        with track_phase(metrics, 'semi_supervised'):
+            losses['class_loss'] = semi_supervised_phase(Q, X_l, target_l, solvers['Q_semi_supervised'])
+        zero_grad(P, Q, D_cat, D_gauss)
+
+    if metrics is not None:
+        metrics.update(batch_size=X.size(0), **losses)
+    return losses
+
+
+def report_accuracy(result):
+    print('Epoch-{} evaluation: train accuracy: {} %; validation accuracy: {} %'.format(result['eval_epoch'],
+                                                                                       result['train_acc'],
+                                                                                       result['val_acc']))
+
+
+def generate_model(train_labeled_loader, train_unlabeled_loader, valid_loader, params,
+                   log_file=None, tensorboard_dir=None, save_dir=None, mmap_weights=False,
+                   resume=False, checkpoint_every=None):
+    '''
+    Trains the networks for params['epochs'] epochs. Every params['eval_every']
+    epochs the encoder is evaluated in a separate process while training goes
+    on; training stops early after params['patience'] evaluations without
+    improvement or after params['time_budget'] seconds, and the best
+    networks are kept in save_dir/best.
+    With save_dir a checkpoint is kept in save_dir/checkpoint (see
+    checkpoint.py), every checkpoint_every batches too, and resume starts
+    from it.
+    '''
+    torch.manual_seed(10)
+
+    nets = create_networks(params)
+    solvers = create_solvers(nets)
+    Q = nets['Q']
+
+    schedule = AdversarialSchedule.from_params(params)
+    logger = MetricLogger(log_file, tensorboard_dir)
+    evaluator = AsyncEvaluator(sys.modules[__name__], params,
+                               {'train': map_dataset(train_labeled_loader), 'val': map_dataset(valid_loader)})
+    stopping = EarlyStopping(params.get('patience'), params.get('min_delta', 0.),
+                             params.get('time_budget'), save_dir)
+    checkpointer = Checkpointer(save_dir, nets, solvers, [train_labeled_loader, train_unlabeled_loader, valid_loader],
+                                {'schedule': schedule, 'stopping': stopping}, every=checkpoint_every)
+    first_epoch = checkpointer.restore() if resume else 0
+
+    def evaluated(results, record=None):
+        for result in results:
+            if stopping.update(result):
+                print('Best model so far (epoch {})'.format(result['eval_epoch']))
+            report_accuracy(result)
+            if record is not None:
+                record.update((k, v) for k, v in result.items() if k != 'state')
+
+    start = time.time()
+    try:
+        with checkpointer:
+            for epoch in range(first_epoch, params['epochs']):
+                checkpointer.epoch = epoch
+                # The training loop draws from the labeled loader first
+                metrics = train_epoch(nets, solvers, checkpointer.watch(train_labeled_loader),
+                                      train_unlabeled_loader, valid_loader, params, schedule=schedule)
+                record = metrics.summary(epoch)
+                # The accuracies of the latest evaluation that came back, if any
+                record.update(eval_epoch=None, train_acc=None, val_acc=None, eval_time=None)
+                evaluated(evaluator.poll(), record)
+                if epoch % params.get('eval_every', 10) == 0:
+                    evaluator.submit(epoch, nets)
+                    report_loss(record)
+                    print('Classification Loss: {:.3}'.format(record['class_loss']))
+                logger.write(record)
+                checkpointer.save(epoch + 1, finished=True)
+                if stopping.should_stop():
+                    print('Stopping early after epoch {}'.format(epoch))
+                    break
+    finally:
+        try:
+            evaluated(evaluator.close())
+        finally:
+            logger.close()
+    end = time.time()
+    print('Training time: {} seconds'.format(end - start))
+    if stopping.best is not None:
+        print('Best validation accuracy: {} % (epoch {})'.format(stopping.best, stopping.best_epoch))
+
+    if save_dir is not None:
+        save_networks(nets, save_dir, mmap=mmap_weights)
+
+    return Q, nets['P']
@@ -0,0 +1,387 @@
+'''
+Sharded on-disk datasets for corpora larger than RAM.
+
+A dataset directory holds uint8 image shards, their labels and a manifest:
+
+    manifest.json              {"n_samples", "shard_size", "shards": [...], "sizes": [...]}
+    shard-00000.npy            (n, H, W) uint8 images
+    shard-00000.labels.npy     (n,) int64 labels, -1 for unlabeled samples (optional)
+
+which is also the layout written by generate. ShardedDataset streams the
+shards through memory maps: the shard order is shuffled every epoch, each
+DataLoader worker reads its own deterministic subset of the shards, and a
+shuffle buffer mixes the samples within a worker. ShardedLoader counts the
+batches it hands out so that an interrupted epoch can be resumed exactly.
+'''
+import collections
+import json
+import os
+
+import numpy as np
+import torch
+
+MANIFEST = 'manifest.json'
+# Normalization of the MNIST pickles of create_datasets.py
+MEAN = 0.1307
+STD = 0.3081
+
+
+####################
+# Writing
+####################
+def write_shards(chunks, out_dir, shard_size=100000):
+    '''
+    Writes the (images, labels) chunks of any length as shards of shard_size
+    samples. images are (n, H, W) uint8 arrays, labels (n,) arrays or None.
+    return: the manifest
+    '''
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    shards, sizes = [], []
+    images_buf, labels_buf, n = [], [], 0
+
+    def save(filename, array):
+        np.save(filename[:-len('.npy')] + '.tmp.npy', array)
+        os.replace(filename[:-len('.npy')] + '.tmp.npy', filename)
+
+    def flush(images, labels):
+        name = 'shard-{:05d}.npy'.format(len(shards))
+        # The labels are in place before the shard is, so a reader that sees
+        # the shard always finds its labels
+        save(os.path.join(out_dir, name[:-len('.npy')] + '.labels.npy'), labels)
+        save(os.path.join(out_dir, name), images)
+        shards.append(name)
+        sizes.append(len(images))
+
+    for images, labels in chunks:
+        images = np.asarray(images, dtype='uint8')
+        labels = np.full(len(images), -1, dtype='int64') if labels is None else np.asarray(labels, dtype='int64')
+        images_buf.append(images)
+        labels_buf.append(labels)
+        n += len(images)
+        while n >= shard_size:
+            images, labels = np.concatenate(images_buf), np.concatenate(labels_buf)
+            flush(images[:shard_size], labels[:shard_size])
+            images_buf, labels_buf = [images[shard_size:]], [labels[shard_size:]]
+            n -= shard_size
+    if n:
+        flush(np.concatenate(images_buf), np.concatenate(labels_buf))
+
+    manifest = {'n_samples': sum(sizes), 'shard_size': shard_size, 'shards': shards, 'sizes': sizes}
+    with open(os.path.join(out_dir, MANIFEST + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(out_dir, MANIFEST + '.tmp'), os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def dataset_arrays(dataset, chunk_size=100000):
+    '''
+    Yields the raw uint8 images and labels (None when unlabeled) of a
+    pickled subMNIST dataset in chunks
+    '''
+    train = getattr(dataset, 'train', True)
+    images = getattr(dataset, 'train_data' if train else 'test_data', None)
+    labels = getattr(dataset, 'train_labels' if train else 'test_labels', None)
+    if images is None:
+        images, labels = dataset.data, getattr(dataset, 'targets', None)
+    n = len(dataset)
+    for start in range(0, n, chunk_size):
+        end = min(n, start + chunk_size)
+        chunk_labels = None if labels is None else np.asarray(labels[start:end])
+        yield np.asarray(images[start:end]), chunk_labels
+
+
+def is_sharded(path):
+    return os.path.exists(os.path.join(path, MANIFEST))
+
+
+####################
+# Reading
+####################
+def read_manifest(path):
+    '''
+    return: the manifest of the dataset in path, with the shard sizes
+    '''
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if not manifest.get('sizes'):
+        manifest['sizes'] = [len(np.load(os.path.join(path, s), mmap_mode='r')) for s in manifest['shards']]
+    return manifest
+
+
+def _load_labels(path, name, n):
+    labels_file = os.path.join(path, name[:-len('.npy')] + '.labels.npy')
+    if os.path.exists(labels_file):
+        return np.load(labels_file)
+    return np.full(n, -1, dtype='int64')
+
+
+def _normalize(images):
+    return torch.from_numpy(np.array(images)).float().div_(255.).sub_(MEAN).div_(STD)
+
+
+class ShardArray(torch.utils.data.Dataset):
+    '''
+    Map-style dataset of the samples of a sharded dataset in manifest order:
+    item i is the normalized (1, H, W) image and the label of sample i.
+    The shards are memory-mapped on first access in each process.
+    '''
+    def __init__(self, path):
+        self.path = path
+        # write_shards replaces the manifest last
+        self.source_file = os.path.join(path, MANIFEST)
+        manifest = read_manifest(path)
+        self.shards = manifest['shards']
+        self.offsets = np.cumsum([0] + manifest['sizes'])
+        self.arrays = None
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['arrays'] = None
+        return state
+
+    def _shard(self, i):
+        if self.arrays is None:
+            self.arrays = [None] * len(self.shards)
+        if self.arrays[i] is None:
+            images = np.load(os.path.join(self.path, self.shards[i]), mmap_mode='r')
+            self.arrays[i] = (images, _load_labels(self.path, self.shards[i], len(images)))
+        return self.arrays[i]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        i = int(np.searchsorted(self.offsets, index, side='right')) - 1
+        images, labels = self._shard(i)
+        j = index - int(self.offsets[i])
+        return _normalize(images[j]).unsqueeze(0), int(labels[j])
+
+
+def worker_order(counts):
+    '''
+    The DataLoader takes the batches from its workers in turn, starting
+    with the first one and skipping the exhausted ones
+    return: the worker of every batch, when worker w yields counts[w] batches
+    '''
+    counts = list(counts)
+    order = []
+    w = 0
+    while any(counts):
+        if counts[w]:
+            order.append(w)
+            counts[w] -= 1
+        w = (w + 1) % len(counts)
+    return order
+
+
+class ShardedDataset(torch.utils.data.IterableDataset):
+    '''
+    Streams whole batches of batch_size samples, normalized like the pickled
+    datasets: X (batch, 1, H, W) floats and int64 targets. Use it with
+    batch_size=None in the DataLoader, or through ShardedLoader.
+
+    Epoch e shuffles the shard order with the seed (seed, e), worker w of W
+    reads the shards at positions w, w + W, ... of that order, and draws its
+    batches from a shuffle buffer of buffer_size samples seeded with
+    (seed, e, w). Each worker drops its last partial batch.
+    '''
+    def __init__(self, path, batch_size, shuffle=True, buffer_size=10000, seed=0):
+        manifest = read_manifest(path)
+        self.path = path
+        self.shards = manifest['shards']
+        self.sizes = manifest['sizes']
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.buffer_size = max(buffer_size, batch_size) if shuffle else batch_size
+        self.seed = seed
+        self.epoch = 0
+        self.skip = None
+
+    def __len__(self):
+        return sum(self.sizes)
+
+    def samples(self):
+        '''
+        return: the ShardArray of the same shards
+        '''
+        return ShardArray(self.path)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def shard_order(self, epoch):
+        order = np.arange(len(self.shards))
+        if self.shuffle:
+            np.random.RandomState([self.seed, epoch]).shuffle(order)
+        return order
+
+    def worker_batches(self, epoch, num_workers):
+        '''
+        return: number of batches every worker yields in epoch
+        '''
+        order = self.shard_order(epoch)
+        return [sum(self.sizes[i] for i in order[w::num_workers]) // self.batch_size
+                for w in range(num_workers)]
+
+    def resume(self, epoch, batches, num_workers):
+        '''
+        Makes the next iteration over epoch skip the batches the first
+        batches batches of the DataLoader came from
+        return: the workers of the remaining batches, in the order the
+        interrupted pass would have handed them out
+        '''
+        order = worker_order(self.worker_batches(epoch, max(num_workers, 1)))
+        skip = np.bincount(order[:batches], minlength=max(num_workers, 1)).tolist()
+        self.epoch = epoch
+        self.skip = (epoch, skip)
+        return order[batches:]
+
+    def _samples(self, shards):
+        for i in shards:
+            name = self.shards[i]
+            images = np.load(os.path.join(self.path, name), mmap_mode='r')
+            labels = _load_labels(self.path, name, len(images))
+            for start in range(0, len(images), self.batch_size):
+                yield images[start:start + self.batch_size], labels[start:start + self.batch_size]
+
+    def _rebatch(self, chunks):
+        images_buf, labels_buf, n = [], [], 0
+        for images, labels in chunks:
+            images_buf.append(images)
+            labels_buf.append(labels)
+            n += len(images)
+            while n >= self.batch_size:
+                images, labels = np.concatenate(images_buf), np.concatenate(labels_buf)
+                yield images[:self.batch_size], labels[:self.batch_size]
+                images_buf, labels_buf = [images[self.batch_size:]], [labels[self.batch_size:]]
+                n -= self.batch_size
+
+    def _shuffled(self, chunks, rng):
+        '''
+        Once the buffer is full, every incoming sample replaces a random
+        sample of the buffer, which is emitted
+        '''
+        buffer_images = buffer_labels = None
+        filled = 0
+        for images, labels in chunks:
+            if buffer_images is None:
+                buffer_images = np.empty((self.buffer_size,) + images.shape[1:], dtype=images.dtype)
+                buffer_labels = np.empty(self.buffer_size, dtype='int64')
+            take = min(len(images), self.buffer_size - filled)
+            buffer_images[filled:filled + take] = images[:take]
+            buffer_labels[filled:filled + take] = labels[:take]
+            filled += take
+            images, labels = images[take:], labels[take:]
+            if len(images):
+                index = rng.choice(self.buffer_size, len(images), replace=False)
+                yield buffer_images[index], buffer_labels[index]
+                buffer_images[index] = images
+                buffer_labels[index] = labels
+        if filled:
+            index = rng.permutation(filled)
+            yield buffer_images[:filled][index], buffer_labels[:filled][index]
+
+    def _batches(self, shards, rng):
+        '''
+        Full batches of (uint8 images, labels) of the shards
+        '''
+        chunks = ((np.array(images), labels) for images, labels in self._samples(shards))
+        if self.shuffle:
+            chunks = self._shuffled(chunks, rng)
+        return self._rebatch(chunks)
+
+    def __iter__(self):
+        info = torch.utils.data.get_worker_info()
+        worker, num_workers = (0, 1) if info is None else (info.id, info.num_workers)
+        epoch = self.epoch
+        shards = self.shard_order(epoch)[worker::num_workers]
+        skip = 0
+        if self.skip is not None and self.skip[0] == epoch:
+            skip = self.skip[1][worker] if worker < len(self.skip[1]) else 0
+        rng = np.random.RandomState([self.seed, epoch, worker])
+        for i, (images, labels) in enumerate(self._batches(shards, rng)):
+            if i < skip:
+                continue
+            yield _normalize(images).unsqueeze(1), torch.from_numpy(labels)
+
+
+class ShardedLoader(torch.utils.data.DataLoader):
+    '''
+    DataLoader over a ShardedDataset that advances the epoch of the dataset
+    on every pass (also when the pass is cut short, e.g. by zip) and counts
+    the batches it hands out. state_dict() after any batch and
+    load_state_dict() on a new loader resume the epoch where it stopped,
+    with the same batches.
+    '''
+    def __init__(self, dataset, **kwargs):
+        # The dataset seeds its own shuffling: every pass would otherwise draw
+        # a worker base seed from the global generator, and a resumed pass
+        # would draw it at another point of the training's random stream
+        kwargs.setdefault('generator', torch.Generator().manual_seed(dataset.seed))
+        super(ShardedLoader, self).__init__(dataset, batch_size=None, **kwargs)
+        self.epoch = 0
+        self.batches = 0
+        self.resuming = False
+        self.resumed_order = None
+
+    def __len__(self):
+        return sum(self.dataset.worker_batches(self.epoch, max(self.num_workers, 1)))
+
+    def __iter__(self):
+        if not self.resuming:
+            if self.batches:
+                # The previous pass was not run to the end
+                self.epoch += 1
+            self.batches = 0
+            self.dataset.skip = None
+        self.resuming = False
+        self.dataset.set_epoch(self.epoch)
+        batches = super(ShardedLoader, self).__iter__()
+        if self.resumed_order is not None:
+            batches = self._reordered(batches, self.resumed_order)
+            self.resumed_order = None
+        for batch in batches:
+            self.batches += 1
+            yield batch
+        self.epoch += 1
+        self.batches = 0
+
+    def _reordered(self, batches, expected):
+        '''
+        The resumed DataLoader starts again with its first worker: hold the
+        batches back until the worker the interrupted pass would have taken
+        the next batch from has produced it
+        '''
+        counts = np.bincount(expected, minlength=max(self.num_workers, 1))
+        queues = [collections.deque() for _ in counts]
+        expected = iter(expected)
+        w = next(expected, None)
+        for worker, batch in zip(worker_order(counts), batches):
+            queues[worker].append(batch)
+            while w is not None and queues[w]:
+                yield queues[w].popleft()
+                w = next(expected, None)
+
+    def state_dict(self, finished=False):
+        '''
+        finished: the current pass is over even if it was cut short (e.g. by
+        zip), the state is the one of the next pass
+        '''
+        if finished and self.batches:
+            return {'epoch': self.epoch + 1, 'batches': 0}
+        return {'epoch': self.epoch, 'batches': self.batches}
+
+    def load_state_dict(self, state):
+        self.epoch = state['epoch']
+        self.batches = state['batches']
+        self.resuming = True
+        self.resumed_order = self.dataset.resume(self.epoch, self.batches, self.num_workers)
+
+
+def sharded_loader(path, batch_size, shuffle=True, buffer_size=10000, seed=0, **kwargs):
+    return ShardedLoader(ShardedDataset(path, batch_size, shuffle, buffer_size, seed), **kwargs)
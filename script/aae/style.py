@@ -0,0 +1,107 @@
+'''
+Style transfer and conditional generation with the class-conditional
+decoders (supervised and semi-supervised).
+
+The Gaussian code of the encoder carries the style of a digit and the
+class code its identity. A StyleBank encodes a set of samples once, keeps
+their style codes, and decodes any product of styles and classes, or
+interpolations between styles, with batched decoder calls.
+'''
+import torch
+
+from .generate import inference_mode
+from .networks import check_labels
+
+
+class StyleBank(object):
+    def __init__(self, Q, P, params, chunk_size=4096):
+        self.Q = Q
+        self.P = P
+        self.n_classes = params['n_classes']
+        self.z_dim = params['z_dim']
+        self.cuda = params['cuda']
+        self.chunk_size = chunk_size
+        self.styles = torch.zeros(0, self.z_dim)
+        if self.cuda:
+            self.styles = self.styles.cuda()
+
+    def __len__(self):
+        return self.styles.size(0)
+
+    def encode(self, X):
+        '''
+        Adds the style codes of X, (n, X_dim) samples between 0 and 1
+        return: indices of the new styles in the bank
+        '''
+        self.Q.eval()
+        if self.cuda:
+            X = X.cuda()
+        with inference_mode():
+            z = torch.cat([self._style(X[i:i + self.chunk_size])
+                           for i in range(0, X.size(0), self.chunk_size)])
+        start = len(self)
+        self.styles = torch.cat((self.styles, z))
+        return torch.arange(start, len(self))
+
+    def _style(self, X):
+        out = self.Q(X)
+        return out[1] if isinstance(out, tuple) else out
+
+    def encode_loader(self, loader, max_samples=None):
+        '''
+        Adds the style codes of the (normalized) samples of a DataLoader
+        return: indices of the new styles in the bank
+        '''
+        start = len(self)
+        for X, _ in loader:
+            X = X * 0.3081 + 0.1307
+            self.encode(X.view(X.size(0), -1))
+            if max_samples is not None and len(self) - start >= max_samples:
+                break
+        end = len(self) if max_samples is None else min(len(self), start + max_samples)
+        self.styles = self.styles[:end]
+        return torch.arange(start, end)
+
+    def decode(self, z_gauss, labels):
+        '''
+        Decodes the style codes z_gauss (n, z_dim) as the classes labels (n,)
+        return: (n, X_dim) images
+        '''
+        check_labels(labels, self.n_classes)
+        self.P.eval()
+        out = []
+        with inference_mode():
+            for i in range(0, z_gauss.size(0), self.chunk_size):
+                z = z_gauss[i:i + self.chunk_size]
+                out.append(self.P.conditional(z, labels[i:i + self.chunk_size]))
+        return torch.cat(out) if out else torch.zeros(0)
+
+    def _classes(self, classes):
+        if classes is None:
+            classes = torch.arange(self.n_classes)
+        return torch.as_tensor(classes).long().to(self.styles.device)
+
+    def product(self, styles=None, classes=None):
+        '''
+        Every cached style (or the styles at the given indices) decoded as
+        every class (or the given classes)
+        return: (n_styles, n_classes, X_dim) images
+        '''
+        z = self.styles if styles is None else self.styles[torch.as_tensor(styles).long()]
+        classes = self._classes(classes)
+        n_styles, n_classes = z.size(0), classes.size(0)
+        z = z.unsqueeze(1).expand(n_styles, n_classes, self.z_dim).reshape(-1, self.z_dim)
+        labels = classes.repeat(n_styles)
+        return self.decode(z, labels).view(n_styles, n_classes, -1)
+
+    def interpolate(self, a, b, steps=10, classes=None):
+        '''
+        Styles linearly interpolated from the cached style a to b, decoded
+        as every class (or the given classes)
+        return: (steps, n_classes, X_dim) images
+        '''
+        t = torch.linspace(0, 1, steps, device=self.styles.device).view(-1, 1)
+        z = (1 - t) * self.styles[a] + t * self.styles[b]
+        classes = self._classes(classes)
+        z = z.unsqueeze(1).expand(steps, classes.size(0), self.z_dim).reshape(-1, self.z_dim)
+        return self.decode(z, classes.repeat(steps)).view(steps, classes.size(0), -1)
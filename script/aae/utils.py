@@ -0,0 +1,184 @@
+import os
+import shutil
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.autograd import Variable
+
+# Memory-mapped weights of all the networks, see weights.py
+WEIGHTS_FILE = 'networks.aaew'
+
+
+####################
+# Utility functions
+####################
+def zero_grad(*nets):
+    for net in nets:
+        net.zero_grad()
+
+
+def save_model(model, filename):
+    print('Best model so far, saving it...')
+    torch.save(model.state_dict(), filename)
+
+
+def save_networks(nets, save_dir, mmap=False):
+    '''
+    Saves the state_dict of every network of the dict nets as save_dir/<name>.pt,
+    and with mmap also all of them to the memory-mappable save_dir/networks.aaew.
+    Without mmap a networks.aaew left by an earlier save is removed.
+    '''
+    if not os.path.isdir(save_dir):
+        os.makedirs(save_dir)
+    weights_file = os.path.join(save_dir, WEIGHTS_FILE)
+    if not mmap and os.path.exists(weights_file):
+        os.remove(weights_file)
+    for name, net in nets.items():
+        torch.save(net.state_dict(), os.path.join(save_dir, name + '.pt'))
+    if mmap:
+        from .weights import save_weights
+        save_weights(nets, weights_file)
+
+
+def replace_dir(tmp, path):
+    '''
+    Replaces the directory path with the complete directory tmp. The old
+    path is renamed aside to path.old and removed last, so that a crash at
+    any point leaves path or path.old complete (see existing_dir).
+    '''
+    old = path + '.old'
+    if not os.path.isdir(path) and os.path.isdir(old):
+        os.rename(old, path)
+    if os.path.isdir(old):
+        shutil.rmtree(old)
+    if os.path.isdir(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    if os.path.isdir(old):
+        shutil.rmtree(old)
+
+
+def existing_dir(path):
+    '''
+    return: path, or the path.old that a replace_dir interrupted between its
+    renames left, or None when there is neither
+    '''
+    for candidate in (path, path + '.old'):
+        if os.path.isdir(candidate):
+            return candidate
+    return None
+
+
+def _weights_current(weights_file, save_dir, nets):
+    '''
+    return: whether weights_file is at least as recent as every <name>.pt of save_dir
+    '''
+    mtime = os.path.getmtime(weights_file)
+    for name in nets:
+        filename = os.path.join(save_dir, name + '.pt')
+        if os.path.exists(filename) and os.path.getmtime(filename) > mtime:
+            return False
+    return True
+
+
+def load_networks(nets, save_dir, copy=True):
+    '''
+    Loads the networks of the dict nets saved with save_networks.
+    Networks without a file in save_dir keep their weights.
+    When save_dir holds networks.aaew and copy is False, the weights are
+    memory-mapped read-only (shared between processes, inference only),
+    unless a .pt file is newer than it.
+    '''
+    weights_file = os.path.join(save_dir, WEIGHTS_FILE)
+    if not copy and os.path.exists(weights_file):
+        if not _weights_current(weights_file, save_dir, nets):
+            print('{} is older than the .pt files, loading those instead'.format(weights_file))
+            copy = True
+    if not copy and os.path.exists(weights_file):
+        from .weights import load_weights
+        return load_weights(nets, weights_file)
+    for name, net in nets.items():
+        filename = os.path.join(save_dir, name + '.pt')
+        if os.path.exists(filename):
+            net.load_state_dict(torch.load(filename, map_location=lambda storage, loc: storage))
+    return nets
+
+
+def sample_categorical(batch_size, n_classes=10):
+    '''
+     Sample from a categorical distribution
+     of size batch_size and # of classes n_classes
+     return: torch.autograd.Variable with the sample
+    '''
+    cat = np.random.randint(0, n_classes, batch_size)
+    cat = np.eye(n_classes)[cat].astype('float32')
+    cat = torch.from_numpy(cat)
+    return Variable(cat)
+
+
+def get_categorical(labels, n_classes=10):
+    cat = np.array(labels.data.tolist())
+    cat = np.eye(n_classes)[cat].astype('float32')
+    cat = torch.from_numpy(cat)
+    return Variable(cat)
+
+
+def create_latent(Q, loader, cuda=False):
+    '''
+    Creates the latent representation for the samples in loader
+    return:
+        z_values: numpy array with the latent representations
+        labels: the labels corresponding to the latent representations
+    '''
+    Q.eval()
+    labels = []
+
+    for batch_idx, (X, target) in enumerate(loader):
+
+        X = X * 0.3081 + 0.1307
+        X = X.view(X.size(0), -1)
+        X, target = Variable(X), Variable(target)
+        labels.extend(target.data.tolist())
+        if cuda:
+            X, target = X.cuda(), target.cuda()
+        # Reconstruction phase
+        z_sample = Q(X)
+        if isinstance(z_sample, tuple):
+            z_sample = z_sample[1]
+        if batch_idx > 0:
+            z_values = np.concatenate((z_values, np.array(z_sample.data.tolist())))
+        else:
+            z_values = np.array(z_sample.data.tolist())
+    labels = np.array(labels)
+
+    return z_values, labels
+
+
+def classification_accuracy(Q, data_loader, params):
+    Q.eval()
+    labels = []
+    test_loss = 0
+    correct = 0
+    # Counted rather than len(data_loader.dataset): the sharded loaders drop partial batches
+    n_samples = 0
+
+    for batch_idx, (X, target) in enumerate(data_loader):
+        X = X * 0.3081 + 0.1307
+        X = X.view(X.size(0), params['X_dim'])
+        n_samples += X.size(0)
+        X, target = Variable(X), Variable(target)
+        if params['cuda']:
+            X, target = X.cuda(), target.cuda()
+
+        labels.extend(target.data.tolist())
+        # Reconstruction phase
+        output = Q(X)[0]
+
+        test_loss += F.nll_loss(output, target).item()
+
+        pred = output.data.max(1)[1]
+        correct += pred.eq(target.data).cpu().sum().item()
+
+    test_loss /= len(data_loader)
+    return 100. * correct / max(n_samples, 1)
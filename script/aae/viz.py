@@ -0,0 +1,192 @@
+import numpy as np
+from torch.autograd import Variable
+import torch
+
+from .style import StyleBank
+
+
+def _pyplot():
+    # matplotlib is only imported once something is actually plotted
+    import matplotlib.pyplot as plt
+    from matplotlib import gridspec
+    return plt, gridspec
+
+
+def get_X_batch(data_loader, params, size=None):
+    if size is None:
+        size = data_loader.batch_size
+    for X, target in data_loader:
+        break
+
+    train_batch_size = params['train_batch_size']
+    X_dim = params['X_dim']
+    cuda = params['cuda']
+
+    X = X * 0.3081 + 0.1307
+
+    X = X[:size]
+    target = target[:size]
+
+    X.resize_(train_batch_size, X_dim)
+    X, target = Variable(X), Variable(target)
+
+    if cuda:
+        X, target = X.cuda(), target.cuda()
+
+    return X
+
+
+def create_reconstruction(Q, P, data_loader, params):
+    plt, gridspec = _pyplot()
+    Q.eval()
+    P.eval()
+    X = get_X_batch(data_loader, params, size=1)
+
+    z_c, z_g = Q(X)
+    z = torch.cat((z_c, z_g), 1)
+    x = P(z)
+
+    img_orig = np.array(X[0].data.tolist()).reshape(28, 28)
+    img_rec = np.array(x[0].data.tolist()).reshape(28, 28)
+    plt.subplot(1, 2, 1)
+    plt.imshow(img_orig)
+    plt.subplot(1, 2, 2)
+    plt.imshow(img_rec)
+
+
+def grid_plot(Q, P, data_loader, params):
+    plt, gridspec = _pyplot()
+    nx, ny = 5, params['n_classes']
+
+    # Every style decoded as every class in a single batched decoder call
+    bank = StyleBank(Q, P, params)
+    X = get_X_batch(data_loader, params, size=10)
+    styles = bank.encode(X[:nx].data)
+    images = bank.product(styles).cpu().numpy()
+
+    plt.subplot()
+    gs = gridspec.GridSpec(nx, ny, hspace=0.05, wspace=0.05)
+
+    for i, g in enumerate(gs):
+        ax = plt.subplot(g)
+        img = images[i // ny, i % ny].reshape(28, 28)
+        ax.imshow(img, )
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_aspect('auto')
+
+
+def grid_plot2d(Q, P, data_loader, params):
+    plt, gridspec = _pyplot()
+    Q.eval()
+    P.eval()
+
+    cuda = params['cuda']
+
+    z1 = Variable(torch.from_numpy(np.arange(-10, 10, 1.5).astype('float32')))
+    z2 = Variable(torch.from_numpy(np.arange(-10, 10, 1.5).astype('float32')))
+    if cuda:
+        z1, z2 = z1.cuda(), z2.cuda()
+
+    nx, ny = len(z1), len(z2)
+    plt.subplot()
+    gs = gridspec.GridSpec(nx, ny, hspace=0.05, wspace=0.05)
+
+    for i, g in enumerate(gs):
+        z = torch.cat((z1[i // ny], z2[i % nx])).resize(1, 2)
+        x = P(z)
+
+        ax = plt.subplot(g)
+        img = np.array(x.data.tolist()).reshape(28, 28)
+        ax.imshow(img, )
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_aspect('auto')
+
+
+####################
+# Latent density
+####################
+# Colors of the tab10 matplotlib palette, one per class
+DENSITY_COLORS = np.array([[31, 119, 180], [255, 127, 14], [44, 160, 44],
+                           [214, 39, 40], [148, 103, 189], [140, 86, 75],
+                           [227, 119, 194], [127, 127, 127], [188, 189, 34],
+                           [23, 190, 207]], dtype='float64') / 255.
+
+
+class DensityAccumulator(object):
+    '''
+    Streaming per-class 2D histogram of latent codes.
+    Batches of codes (e.g. from create_latent) are binned with numpy as they
+    arrive, so any number of points can be plotted in constant memory.
+    extent: (x_min, x_max, y_min, y_max); taken from the first batch when None.
+    Codes falling outside the extent or with a negative label are dropped.
+    '''
+    def __init__(self, extent=None, bins=512, n_classes=10):
+        self.extent = extent
+        self.bins = bins
+        self.n_classes = n_classes
+        self.counts = np.zeros((n_classes, bins, bins), dtype='int64')
+
+    def add(self, z, labels=None):
+        z = np.asarray(z, dtype='float64')
+        if labels is None:
+            labels = np.zeros(len(z), dtype='int64')
+        labels = np.asarray(labels).astype('int64')
+        if self.extent is None:
+            lo, hi = z[:, :2].min(0), z[:, :2].max(0)
+            margin = 0.05 * np.maximum(hi - lo, 1e-6)
+            self.extent = (lo[0] - margin[0], hi[0] + margin[0],
+                           lo[1] - margin[1], hi[1] + margin[1])
+
+        x_min, x_max, y_min, y_max = self.extent
+        ix = np.floor((z[:, 0] - x_min) * (self.bins / (x_max - x_min))).astype('int64')
+        iy = np.floor((z[:, 1] - y_min) * (self.bins / (y_max - y_min))).astype('int64')
+        keep = ((ix >= 0) & (ix < self.bins) & (iy >= 0) & (iy < self.bins) &
+                (labels >= 0) & (labels < self.n_classes))
+        flat = (labels[keep] * self.bins + iy[keep]) * self.bins + ix[keep]
+
+        counts = self.counts.reshape(-1)
+        if len(flat) > counts.size // 8:
+            counts += np.bincount(flat, minlength=counts.size)
+        else:
+            cells, n = np.unique(flat, return_counts=True)
+            counts[cells] += n
+
+    def image(self, colors=DENSITY_COLORS, background=(1., 1., 1.)):
+        '''
+        Composites the per-class histograms into one image: the color of each
+        pixel is the mix of the class colors weighted by their counts, and its
+        opacity grows with the log of the total count.
+        return: (bins, bins, 3) uint8 RGB array with y increasing upwards
+        '''
+        counts = self.counts.astype('float64')
+        total = counts.sum(0)
+        mix = np.tensordot(counts, colors[:self.n_classes], axes=(0, 0))
+        mix /= np.maximum(total, 1.)[:, :, None]
+
+        alpha = np.log1p(total) / max(np.log1p(total.max()), 1e-12)
+        img = (np.asarray(background)[None, None, :] * (1. - alpha[:, :, None]) +
+               mix * alpha[:, :, None])
+        return (img[::-1] * 255.).round().astype('uint8')
+
+
+def latent_density_image(z, labels=None, extent=None, bins=512, n_classes=10):
+    '''
+    Density image of the codes z colored by labels, see DensityAccumulator
+    '''
+    acc = DensityAccumulator(extent=extent, bins=bins, n_classes=n_classes)
+    acc.add(z, labels)
+    return acc.image()
+
+
+def plot_latent_density(acc, ax=None):
+    '''
+    Shows a DensityAccumulator with its latent-space axes
+    '''
+    plt, _ = _pyplot()
+    if ax is None:
+        ax = plt.subplot()
+    ax.imshow(acc.image(), extent=acc.extent, interpolation='nearest')
+    ax.set_aspect('auto')
+    return ax
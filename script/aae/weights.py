@@ -0,0 +1,124 @@
+'''
+Flat, memory-mappable weight file for the AAE networks.
+
+Layout of a .aaew file:
+    8 bytes    magic b'AAEW0001'
+    8 bytes    little-endian length of the JSON header
+    header     {"alignment": 64, "tensors": {"<net>.<param>": {"dtype", "shape", "offset"}}}
+    data       every tensor, contiguous, at a multiple of alignment
+
+Loading maps the file read-only and points the parameters straight at the
+mapping, so every process of a host loading the same file shares a single
+physical copy of the weights and nothing is deserialized.
+'''
+import json
+import os
+import struct
+import warnings
+
+import numpy as np
+import torch
+
+MAGIC = b'AAEW0001'
+ALIGNMENT = 64
+
+
+def _align(offset, alignment=ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def save_weights(nets, filename):
+    '''
+    Writes the state_dict of every network of the dict nets to filename
+    '''
+    tensors = []
+    for net_name in sorted(nets):
+        for key, tensor in nets[net_name].state_dict().items():
+            tensors.append(('{}.{}'.format(net_name, key), tensor.detach().cpu().contiguous().numpy()))
+
+    # The offsets depend on the header length, which depends on the offsets:
+    # lay the data out assuming a header size and grow it until it fits
+    header_size = 4096
+    while True:
+        offset = header_size
+        entries = {}
+        for name, array in tensors:
+            offset = _align(offset)
+            entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
+        header = json.dumps({'alignment': ALIGNMENT, 'tensors': entries}).encode('utf-8')
+        if len(MAGIC) + 8 + len(header) <= header_size:
+            break
+        header_size = _align(len(MAGIC) + 8 + len(header), 4096)
+
+    # Other processes may have filename mapped: write a new file and swap it
+    # in, so that their mappings keep the old inode instead of seeing it change
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, array in tensors:
+            f.seek(entries[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def read_weights(filename):
+    '''
+    Maps filename read-only
+    return: dict <net>.<param> -> tensor backed by the mapping
+    '''
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not an AAE weight file'.format(filename))
+        header_len = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_len).decode('utf-8'))
+
+    mapping = np.memmap(filename, dtype='uint8', mode='r')
+    tensors = {}
+    with warnings.catch_warnings():
+        # torch warns that the arrays are not writable, which is the point
+        warnings.simplefilter('ignore')
+        for name, entry in header['tensors'].items():
+            dtype = np.dtype(entry['dtype'])
+            count = int(np.prod(entry['shape'])) if entry['shape'] else 1
+            array = np.frombuffer(mapping, dtype=dtype, count=count, offset=entry['offset'])
+            tensors[name] = torch.from_numpy(array.reshape(entry['shape']))
+    return tensors
+
+
+def _set_tensor(module, key, tensor):
+    path = key.split('.')
+    for name in path[:-1]:
+        module = getattr(module, name)
+    if path[-1] in module._parameters:
+        module._parameters[path[-1]].data = tensor
+    else:
+        module._buffers[path[-1]] = tensor
+
+
+def load_weights(nets, filename, copy=False):
+    '''
+    Loads the networks of the dict nets from filename.
+    Without copy (or on a GPU) the parameters are read-only views of the
+    mapping, which suits inference only: updating them in place crashes.
+    '''
+    tensors = read_weights(filename)
+    for net_name, net in nets.items():
+        prefix = net_name + '.'
+        state = dict((k[len(prefix):], v) for k, v in tensors.items() if k.startswith(prefix))
+        if not state:
+            continue
+        missing = set(net.state_dict()) - set(state)
+        if missing:
+            raise KeyError('{} has no weights for {} of {}'.format(filename, sorted(missing), net_name))
+        device = next(net.parameters()).device
+        for key, tensor in state.items():
+            if copy or device.type != 'cpu':
+                tensor = tensor.to(device, copy=True)
+            _set_tensor(net, key, tensor)
+    return nets
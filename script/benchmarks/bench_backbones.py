@@ -0,0 +1,100 @@
+'''
+Compares the MLP and convolutional backbones of the semi-supervised AAE:
+parameters, training and inference throughput on synthetic images of
+several sizes, and optionally the validation accuracy on MNIST.
+
+    cd script && python benchmarks/bench_backbones.py [--sizes 28 64] [--epochs 5]
+
+Inference is timed eagerly and after torch.jit.optimize_for_inference,
+which freezes the encoder and fuses every conv+ReLU into one oneDNN
+convolution on CPU.
+'''
+import argparse
+import os
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+import torch  # noqa: E402
+
+from aae import semisupervised  # noqa: E402
+from aae.config import default_params  # noqa: E402
+from aae.generate import inference_mode  # noqa: E402
+
+
+def samples_per_sec(run, batch_size, steps):
+    run()
+    start = time.time()
+    for _ in range(steps):
+        run()
+    return steps * batch_size / (time.time() - start)
+
+
+def benchmark(params, steps):
+    nets = semisupervised.create_networks(params)
+    solvers = semisupervised.create_solvers(nets)
+    batch_size = params['train_batch_size']
+    X = torch.rand(batch_size, params['X_dim'])
+    target = torch.randint(-1, params['n_classes'], (batch_size,))
+    if params['cuda']:
+        X, target = X.cuda(), target.cuda()
+
+    train = samples_per_sec(lambda: semisupervised.train_step(nets, solvers, X, target, params),
+                            batch_size, steps)
+
+    Q = nets['Q'].eval()
+    with inference_mode():
+        eager = samples_per_sec(lambda: Q(X), batch_size, steps)
+    with torch.no_grad():
+        frozen_Q = torch.jit.optimize_for_inference(torch.jit.trace(Q, X))
+        frozen = samples_per_sec(lambda: frozen_Q(X), batch_size, steps)
+
+    n_params = sum(p.numel() for net in nets.values() for p in net.parameters())
+    return {'params': n_params, 'train': train, 'eager': eager, 'frozen': frozen}
+
+
+def accuracy(params, data_path, epochs):
+    from aae.data import load_data
+    from aae.utils import classification_accuracy
+
+    torch.manual_seed(10)
+    train_labeled_loader, train_unlabeled_loader, valid_loader = load_data(params, data_path)
+    nets = semisupervised.create_networks(params)
+    solvers = semisupervised.create_solvers(nets)
+    for _ in range(epochs):
+        semisupervised.train_epoch(nets, solvers, train_labeled_loader, train_unlabeled_loader,
+                                   valid_loader, params)
+    return classification_accuracy(nets['Q'], valid_loader, params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[28, 64, 128], metavar='S',
+                        help='side of the synthetic square images (default: 28 64 128)')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=20, metavar='N', help='timed batches (default: 20)')
+    parser.add_argument('--conv-width', type=int, default=32)
+    parser.add_argument('--data-path', type=str, default='../data/', metavar='DIR')
+    parser.add_argument('--epochs', type=int, default=0, metavar='N',
+                        help='also train N epochs on MNIST and report the validation accuracy')
+    args = parser.parse_args()
+
+    print('{:<6}{:>6}{:>12}{:>14}{:>14}{:>14}{:>10}'.format('net', 'size', 'params', 'train/s',
+                                                           'eager inf/s', 'frozen inf/s', 'val acc'))
+    for size in args.sizes:
+        for backbone in ('mlp', 'conv'):
+            params = default_params(train_batch_size=args.batch_size, valid_batch_size=args.batch_size,
+                                    X_dim=size * size, image_shape=(1, size, size),
+                                    backbone=backbone, conv_width=args.conv_width)
+            result = benchmark(params, args.steps)
+            acc = '-'
+            if args.epochs and size == 28:
+                acc = '{:.2f}'.format(accuracy(params, args.data_path, args.epochs))
+            print('{:<6}{:>6}{:>12}{:>14.0f}{:>14.0f}{:>14.0f}{:>10}'.format(
+                backbone, size, result['params'], result['train'], result['eager'], result['frozen'], acc))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Training throughput of the semi-supervised step with the sequential
+reconstruction and semi-supervised phases and with --joint-batches (one
+encoder forward over the labeled and unlabeled rows).
+
+    cd script && python benchmarks/bench_joint.py [--batch-size 100] [--steps 50]
+
+Both variants train fresh networks on the same synthetic batches, made of
+batch-size unlabeled and batch-size labeled samples like an epoch of the
+training loop.
+'''
+import argparse
+import os
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+import torch  # noqa: E402
+
+from aae import semisupervised  # noqa: E402
+from aae.config import default_params  # noqa: E402
+
+
+def samples_per_sec(params, batches):
+    torch.manual_seed(0)
+    nets = semisupervised.create_networks(params)
+    solvers = semisupervised.create_solvers(nets)
+    X, target = batches[0]
+    semisupervised.train_step(nets, solvers, X, target, params)
+    if params['cuda']:
+        torch.cuda.synchronize()
+    start = time.time()
+    for X, target in batches:
+        semisupervised.train_step(nets, solvers, X, target, params)
+    if params['cuda']:
+        torch.cuda.synchronize()
+    return sum(len(X) for X, _ in batches) / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=50, metavar='N', help='timed steps (default: 50)')
+    parser.add_argument('--hidden', type=int, default=1000, metavar='N')
+    args = parser.parse_args()
+
+    params = default_params(train_batch_size=args.batch_size, valid_batch_size=args.batch_size, N=args.hidden)
+    batches = []
+    for _ in range(args.steps):
+        X = torch.rand(2 * args.batch_size, params['X_dim'])
+        target = torch.cat((torch.full((args.batch_size,), -1, dtype=torch.long),
+                            torch.randint(0, params['n_classes'], (args.batch_size,))))
+        if params['cuda']:
+            X, target = X.cuda(), target.cuda()
+        batches.append((X, target))
+
+    sequential = samples_per_sec(dict(params, joint_batches=False), batches)
+    joint = samples_per_sec(dict(params, joint_batches=True), batches)
+    print('{:<12}{:>12}'.format('step', 'samples/s'))
+    print('{:<12}{:>12.0f}'.format('sequential', sequential))
+    print('{:<12}{:>12.0f}'.format('joint', joint))
+    print('speedup {:.2f}x'.format(joint / sequential))
+
+
+if __name__ == '__main__':
+    main()
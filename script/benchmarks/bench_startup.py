@@ -0,0 +1,57 @@
+'''
+Measures the import and startup time paid by every short-lived training,
+inference or scoring worker.
+
+    cd script && python benchmarks/bench_startup.py [--repeat 10]
+
+Each statement runs in a fresh interpreter; the median wall time is reported.
+'''
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = [
+    ('python', 'pass'),
+    ('import aae', 'import aae'),
+    ('import aae.cli', 'import aae.cli'),
+    ('aae --help', 'import sys; from aae.cli import main; sys.argv = ["aae", "--help"]; main()'),
+    ('import aae.networks', 'import aae.networks'),
+    ('import aae.semisupervised', 'import aae.semisupervised'),
+    ('import aae.viz', 'import aae.viz'),
+    ('import matplotlib.pyplot', 'import matplotlib.pyplot'),
+]
+
+
+def time_statement(statement, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        returncode = subprocess.call([sys.executable, '-c', statement], cwd=SCRIPT_DIR,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if returncode != 0:
+            return None
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time of the aae package')
+    parser.add_argument('--repeat', type=int, default=10, metavar='N',
+                        help='interpreter launches per statement (default: 10)')
+    args = parser.parse_args()
+
+    print('{:<28} {:>10}'.format('statement', 'median ms'))
+    for name, statement in STATEMENTS:
+        median = time_statement(statement, args.repeat)
+        if median is None:
+            print('{:<28} {:>10}'.format(name, 'failed'))
+        else:
+            print('{:<28} {:>10.1f}'.format(name, 1000. * median))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+End-to-end run of the consumers of load_data against a small sharded data
+directory of random digits: training, the classification accuracy, the
+asynchronous evaluation, scoring, export and the latent cache.
+
+    cd script && python benchmarks/check_sharded.py [--data-path DIR]
+
+Without --data-path the shards are written to a temporary directory.
+Exits with status 1 when a consumer fails or returns a wrong number of samples.
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+
+from aae import semisupervised  # noqa: E402
+from aae.config import default_params  # noqa: E402
+from aae.data import SPLITS, load_data, map_dataset  # noqa: E402
+from aae.evaluation import AsyncEvaluator  # noqa: E402
+from aae.export import export_records, load_columns  # noqa: E402
+from aae.latent_cache import LatentCache, create_latent_cached  # noqa: E402
+from aae.scoring import score_dataset  # noqa: E402
+from aae.shards import ShardedLoader, write_shards  # noqa: E402
+from aae.utils import classification_accuracy  # noqa: E402
+
+
+def write_random_splits(data_path, sizes, shard_size, seed=0):
+    rng = np.random.RandomState(seed)
+    for split, n in zip(SPLITS, sizes):
+        images = rng.randint(0, 256, (n, 28, 28)).astype('uint8')
+        labels = None if split == 'train_unlabeled' else rng.randint(0, 10, n)
+        write_shards([(images, labels)], os.path.join(data_path, split), shard_size)
+
+
+def check(name, ok, detail=''):
+    print('  {} {} {}'.format('ok  ' if ok else 'FAIL', name, detail))
+    return ok
+
+
+def run(data_path, batch_size):
+    params = default_params(train_batch_size=batch_size, valid_batch_size=batch_size, N=64,
+                            epochs=1, cuda=False, num_workers=0)
+    loaders = load_data(params, data_path)
+    passed = check('sharded loaders', all(isinstance(loader, ShardedLoader) for loader in loaders))
+    train_labeled_loader, train_unlabeled_loader, valid_loader = loaders
+    n_valid = len(map_dataset(valid_loader))
+
+    nets = semisupervised.create_networks(params)
+    solvers = semisupervised.create_solvers(nets)
+    metrics = semisupervised.train_epoch(nets, solvers, train_labeled_loader, train_unlabeled_loader,
+                                         valid_loader, params)
+    passed &= check('train_epoch', np.isfinite(metrics.summary(0)['recon_loss']))
+
+    acc = classification_accuracy(nets['Q'], valid_loader, params)
+    passed &= check('classification_accuracy', 0. <= acc <= 100., '{:.2f}'.format(acc))
+
+    evaluator = AsyncEvaluator(semisupervised, params, {'val': map_dataset(valid_loader)})
+    evaluator.submit(0, nets)
+    results = evaluator.close(timeout=120)
+    passed &= check('AsyncEvaluator', len(results) == 1 and 'val_acc' in results[0])
+
+    out_dir = tempfile.mkdtemp()
+    try:
+        scores = score_dataset(nets['Q'], nets['P'], map_dataset(valid_loader), os.path.join(out_dir, 'scores'),
+                               D_gauss=nets['D_gauss'], batch_size=batch_size, processes=1)
+        passed &= check('score_dataset', len(scores) == n_valid)
+
+        export_records(nets['Q'], nets['P'], map_dataset(valid_loader), os.path.join(out_dir, 'records'),
+                       batch_size=batch_size)
+        columns = load_columns(os.path.join(out_dir, 'records'), ['index', 'z'])
+        passed &= check('export_records', len(columns['index']) == n_valid)
+
+        z, labels = create_latent_cached(nets['Q'], valid_loader, LatentCache(os.path.join(out_dir, 'cache')))
+        passed &= check('create_latent_cached', len(z) == n_valid == len(labels))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-path', type=str, default=None, metavar='DIR',
+                        help='sharded data directory (default: random digits in a temporary directory)')
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    data_path = args.data_path
+    if data_path is None:
+        data_path = tempfile.mkdtemp()
+        write_random_splits(data_path, sizes=(300, 1000, 250), shard_size=200)
+    try:
+        passed = run(data_path, args.batch_size)
+    finally:
+        if args.data_path is None:
+            shutil.rmtree(data_path, ignore_errors=True)
+    print('PASS' if passed else 'FAIL')
+    if not passed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    torch.manual_seed(0)
+    main()
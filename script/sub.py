@@ -19,14 +19,14 @@ class subMNIST(MNIST):
         else:
             return 10000
 
-transform = transforms.Compose([transforms.ToTensor(),
-                                transforms.Normalize((0.5, 0.5, 0.5),
-                                                     (0.5, 0.5, 0.5))])
-trainset = subMNIST(root='../data', train=True,
-                    download=True, transform=transform)
-trainloader = torch.utils.data.DataLoader(trainset, batch_size=4,
-                                          shuffle=True, num_workers=2)
+if __name__ == '__main__':
+    transform = transforms.Compose([transforms.ToTensor(),
+                                    transforms.Normalize((0.5, 0.5, 0.5),
+                                                         (0.5, 0.5, 0.5))])
+    trainset = subMNIST(root='../data', train=True,
+                        download=True, transform=transform)
+    trainloader = torch.utils.data.DataLoader(trainset, batch_size=4,
+                                              shuffle=True, num_workers=2)
 
-
-print(len(trainset))
-print(len(trainloader))
+    print(len(trainset))
+    print(len(trainloader))
@@ -0,0 +1,104 @@
+import os
+import signal
+
+import numpy as np
+import pytest
+import torch
+
+from aae import basic, semisupervised, supervised
+from aae.checkpoint import CHECKPOINT_DIR, Checkpointer
+from aae.config import default_params
+from aae.data import SPLITS, load_data
+from aae.shards import write_shards
+from aae.utils import existing_dir, replace_dir
+
+MODULES = {'basic': basic, 'supervised': supervised, 'semi': semisupervised}
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    rng = np.random.RandomState(0)
+    for split, n in zip(SPLITS, (100, 200, 100)):
+        images = rng.randint(0, 256, (n, 28, 28)).astype('uint8')
+        labels = None if split == 'train_unlabeled' else rng.randint(0, 10, n)
+        write_shards([(images, labels)], str(tmp_path / 'data' / split), 70)
+    return str(tmp_path / 'data')
+
+
+def train(mode, data_path, save_dir, resume=False, checkpoint_every=None):
+    params = default_params(N=16, train_batch_size=20, valid_batch_size=20, epochs=3, cuda=False,
+                            num_workers=0, eval_every=100)
+    loaders = load_data(params, data_path)
+    # generate_model seeds torch only, the categorical prior samples come from numpy
+    np.random.seed(0)
+    MODULES[mode].generate_model(*loaders, params=params, save_dir=save_dir, resume=resume,
+                                 checkpoint_every=checkpoint_every)
+
+
+def saved_weights(save_dir):
+    return dict((name, torch.load(os.path.join(save_dir, name)))
+                for name in os.listdir(save_dir) if name.endswith('.pt'))
+
+
+def interrupt_at(monkeypatch, epoch, batch):
+    between_batches = Checkpointer._between_batches
+
+    def interrupting(self, batches):
+        if (self.epoch, batches) == (epoch, batch):
+            os.kill(os.getpid(), signal.SIGTERM)
+        return between_batches(self, batches)
+    monkeypatch.setattr(Checkpointer, '_between_batches', interrupting)
+
+
+@pytest.mark.parametrize('mode', sorted(MODULES))
+def test_resume_within_an_epoch(mode, data_path, tmp_path, monkeypatch):
+    reference = str(tmp_path / 'reference')
+    train(mode, data_path, reference)
+
+    resumed = str(tmp_path / 'resumed')
+    interrupt_at(monkeypatch, 1, 3)
+    with pytest.raises(KeyboardInterrupt):
+        train(mode, data_path, resumed)
+    assert os.path.isdir(os.path.join(resumed, CHECKPOINT_DIR))
+    monkeypatch.undo()
+    train(mode, data_path, resumed, resume=True)
+
+    expected, weights = saved_weights(reference), saved_weights(resumed)
+    assert sorted(weights) == sorted(expected)
+    for name, state in expected.items():
+        for key, tensor in state.items():
+            assert torch.equal(weights[name][key], tensor), '{} {}'.format(name, key)
+
+
+def test_periodic_checkpoints(data_path, tmp_path, monkeypatch):
+    saves = []
+    save = Checkpointer.save
+    monkeypatch.setattr(Checkpointer, 'save', lambda self, epoch, finished=False: (
+        saves.append((epoch, finished)), save(self, epoch, finished)))
+    train('basic', data_path, str(tmp_path / 'run'), checkpoint_every=4)
+    # 200 unlabeled samples: 10 batches of 20 per epoch
+    assert saves == [(0, False), (0, False), (1, True), (1, False), (1, False), (2, True),
+                     (2, False), (2, False), (3, True)]
+
+
+def test_resume_without_checkpoint(data_path, tmp_path):
+    train('basic', data_path, str(tmp_path / 'run'), resume=True)
+    assert os.path.isdir(str(tmp_path / 'run' / CHECKPOINT_DIR))
+
+
+def test_replace_dir(tmp_path):
+    path = str(tmp_path / 'best')
+    for version in range(3):
+        tmp = path + '.tmp'
+        os.makedirs(tmp)
+        with open(os.path.join(tmp, 'version'), 'w') as f:
+            f.write(str(version))
+        replace_dir(tmp, path)
+        assert sorted(os.listdir(str(tmp_path))) == ['best']
+    # A crash between the two renames leaves the previous directory aside
+    os.rename(path, path + '.old')
+    assert existing_dir(path) == path + '.old'
+    os.makedirs(path + '.tmp')
+    replace_dir(path + '.tmp', path)
+    assert existing_dir(path) == path and sorted(os.listdir(str(tmp_path))) == ['best']
+    assert existing_dir(str(tmp_path / 'none')) is None
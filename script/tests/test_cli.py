@@ -0,0 +1,40 @@
+import torch
+
+from aae.autotune import save_profile
+from aae.cli import _tuned_params, build_parser
+
+
+def write_profile(tmp_path):
+    path = str(tmp_path / 'profile.json')
+    threads = {'num_threads': torch.get_num_threads(), 'num_interop_threads': torch.get_num_interop_threads()}
+    save_profile({'mode': 'semi', 'num_workers': 0,
+                  'train': dict(threads, batch_size=500),
+                  'inference': dict(threads, batch_size=1000)}, path)
+    return path
+
+
+def test_inference_uses_the_given_profile(tmp_path):
+    path = write_profile(tmp_path)
+    args = build_parser().parse_args(['score', '--mode', 'semi', '--model-dir', 'm', '--out-dir', 'o',
+                                      '--profile', path])
+    assert _tuned_params(args, 'inference', cuda=False)['train_batch_size'] == 1000
+    args = build_parser().parse_args(['score', '--mode', 'semi', '--model-dir', 'm', '--out-dir', 'o',
+                                      '--profile', path, '--batch-size', '10'])
+    assert _tuned_params(args, 'inference', cuda=False)['train_batch_size'] == 10
+
+
+def test_training_uses_the_tuned_batch_size_on_request(tmp_path):
+    path = write_profile(tmp_path)
+    args = build_parser().parse_args(['semi', '--profile', path])
+    assert _tuned_params(args, 'train', cuda=False)['train_batch_size'] == 100
+    args = build_parser().parse_args(['semi', '--profile', path, '--tuned-batch-size'])
+    assert _tuned_params(args, 'train', cuda=False)['train_batch_size'] == 500
+    args = build_parser().parse_args(['online', '--source', 'dir:x', '--snapshot-dir', 's',
+                                      '--profile', path, '--tuned-batch-size'])
+    assert _tuned_params(args, 'train', cuda=False)['train_batch_size'] == 500
+
+
+def test_missing_profile(tmp_path):
+    args = build_parser().parse_args(['export', '--mode', 'semi', '--model-dir', 'm', '--out-dir', 'o',
+                                      '--profile', str(tmp_path / 'none.json')])
+    assert _tuned_params(args, 'inference', cuda=False)['train_batch_size'] == 100
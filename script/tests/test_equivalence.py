@@ -0,0 +1,33 @@
+from aae import semisupervised
+from aae.config import default_params
+from aae.equivalence import check_equivalence, fixed_batches, run_path
+
+
+def test_every_optimizer_steps_its_own_networks():
+    params = default_params(N=32, train_batch_size=20, cuda=False)
+    result = run_path('semi', 'reference', params, fixed_batches(params, 2))
+    nets = semisupervised.create_networks(params)
+    solvers = semisupervised.create_solvers(nets)
+    assert sorted(result['grads']) == sorted(solvers)
+    for key, grads in result['grads'].items():
+        params = [p for group in solvers[key].param_groups for p in group['params']]
+        assert len(grads) == len(params)
+        assert all(g is None or g.shape == p.shape for g, p in zip(grads, params)), key
+        assert any(g is not None for g in grads), key
+    # The decoder is only updated by P_decoder
+    for key, value in result['initial']['P'].items():
+        assert not value.equal(result['params']['P.' + key]), key
+
+
+def test_reference_matches_itself():
+    params = default_params(N=32, train_batch_size=20, cuda=False)
+    for mode in ('basic', 'supervised', 'semi'):
+        passed, _, _ = check_equivalence(mode, 'reference', params, steps=2, verbose=False)
+        assert passed, mode
+
+
+def test_conditioning_paths_match():
+    params = default_params(N=32, train_batch_size=20, cuda=False)
+    passed, _, _ = check_equivalence('supervised', 'embedding', params, steps=3, reference='onehot',
+                                     verbose=False)
+    assert passed
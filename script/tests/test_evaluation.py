@@ -0,0 +1,31 @@
+import os
+
+import torch
+from torch.utils.data import TensorDataset
+
+from aae import semisupervised
+from aae.config import default_params
+from aae.evaluation import AsyncEvaluator, EarlyStopping
+
+
+def test_async_evaluator_spawns_worker():
+    params = default_params(N=16, valid_batch_size=10, cuda=False)
+    nets = semisupervised.create_networks(params)
+    dataset = TensorDataset(torch.rand(30, 1, 28, 28), torch.randint(0, 10, (30,)))
+    evaluator = AsyncEvaluator(semisupervised, params, {'val': dataset})
+    assert evaluator.process._start_method == 'spawn'
+    assert evaluator.submit(0, nets)
+    results = evaluator.close(timeout=60)
+    assert [result['eval_epoch'] for result in results] == [0]
+    assert 0 <= results[0]['val_acc'] <= 100
+    assert set(results[0]['state']) == set(nets)
+
+
+def test_early_stopping_replaces_best(tmp_path):
+    stopping = EarlyStopping(patience=1, save_dir=str(tmp_path))
+    for epoch, value in enumerate([0.5, 0.7, 0.6]):
+        state = {'Q': {'w': torch.full((2,), float(epoch))}}
+        stopping.update({'val_acc': value, 'eval_epoch': epoch, 'state': state})
+    assert stopping.best_epoch == 1 and stopping.should_stop()
+    assert sorted(os.listdir(str(tmp_path))) == ['best']
+    assert torch.equal(torch.load(str(tmp_path / 'best' / 'Q.pt'))['w'], torch.ones(2))
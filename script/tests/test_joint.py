@@ -0,0 +1,25 @@
+import pytest
+
+from aae.config import default_params
+from aae.equivalence import compare, fixed_batches, run_path
+
+
+@pytest.mark.parametrize('labeled_fraction', [0., 1.])
+def test_joint_matches_reference_on_unmixed_batches(labeled_fraction):
+    # Without both kinds of rows in a batch, each optimizer steps with the
+    # gradient of the same loss at the same weights as the separate phases
+    params = default_params(N=32, train_batch_size=20, cuda=False)
+    batches = fixed_batches(params, 3, labeled_fraction=labeled_fraction)
+    reference = run_path('semi', 'reference', params, batches)
+    joint = run_path('semi', 'joint', params, batches, initial=reference['initial'])
+    failures = [name for name, (_, ok) in compare(reference, joint).items() if not ok]
+    assert not failures
+
+
+def test_joint_diverges_on_mixed_batches():
+    params = default_params(N=32, train_batch_size=20, cuda=False)
+    batches = fixed_batches(params, 3, labeled_fraction=0.5)
+    reference = run_path('semi', 'reference', params, batches)
+    joint = run_path('semi', 'joint', params, batches, initial=reference['initial'])
+    assert [loss.keys() for loss in joint['losses']] == [loss.keys() for loss in reference['losses']]
+    assert not all(ok for _, ok in compare(reference, joint).values())
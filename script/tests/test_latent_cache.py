@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import ConcatDataset, TensorDataset
+
+from aae.latent_cache import LatentCache
+
+
+class Encoder(torch.nn.Module):
+    '''
+    Linear encoder counting the samples it encodes
+    '''
+    def __init__(self):
+        super(Encoder, self).__init__()
+        self.linear = torch.nn.Linear(784, 2)
+        self.encoded = 0
+
+    def forward(self, X):
+        self.encoded += X.size(0)
+        return self.linear(X)
+
+
+def make_dataset(n, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    return TensorDataset(torch.rand(n, 1, 28, 28, generator=generator), torch.randint(0, 10, (n,), generator=generator))
+
+
+def entries(root):
+    return sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+
+
+def test_hit_does_not_encode(tmp_path):
+    cache = LatentCache(str(tmp_path), block_size=10)
+    Q, dataset = Encoder(), make_dataset(25)
+    first = cache.get(Q, dataset, name='val')
+    assert Q.encoded == 25
+    second = cache.get(Q, dataset, name='val')
+    assert Q.encoded == 25
+    np.testing.assert_array_equal(first.z, second.z)
+
+
+def test_appended_samples_encode_changed_blocks(tmp_path):
+    cache = LatentCache(str(tmp_path), block_size=10)
+    Q, dataset = Encoder(), make_dataset(25)
+    cache.get(Q, dataset, name='val')
+    grown = ConcatDataset([dataset, make_dataset(10, seed=1)])
+    entry = cache.get(Q, grown, name='val')
+    # The last, partial block is encoded again with the new samples
+    assert Q.encoded == 25 + 15
+    assert len(entry) == 35
+    fresh = LatentCache(str(tmp_path / 'fresh'), block_size=10).get(Q, grown, name='val')
+    np.testing.assert_allclose(entry.z, fresh.z, atol=1e-6)
+    np.testing.assert_array_equal(entry.labels, fresh.labels)
+
+
+def test_new_weights_invalidate_old_entry(tmp_path):
+    cache = LatentCache(str(tmp_path), block_size=10)
+    Q, dataset = Encoder(), make_dataset(25)
+    old = cache.get(Q, dataset, name='val')
+    cache.get(Q, make_dataset(25, seed=1), name='train')
+    with torch.no_grad():
+        Q.linear.bias.add_(1.)
+    new = cache.get(Q, dataset, name='val')
+    assert Q.encoded == 75
+    assert old.path != new.path and not os.path.exists(old.path)
+    # The entries of the other datasets stay
+    assert len(entries(str(tmp_path))) == 2
+    np.testing.assert_allclose(np.asarray(new.z), np.asarray(old.z) + 1., rtol=1e-5)
+
+
+def test_rewritten_source_file_is_fingerprinted_again(tmp_path):
+    cache = LatentCache(str(tmp_path / 'cache'), block_size=10)
+    Q = Encoder()
+    source = str(tmp_path / 'val.pt')
+
+    def load(seed):
+        dataset = make_dataset(25, seed)
+        torch.save(dataset.tensors, source)
+        dataset.source_file = source
+        return dataset
+
+    cache.get(Q, load(0), name='val')
+    cache.get(Q, load(0), name='val')
+    assert Q.encoded == 25
+    # Same size, different samples: only the file stat tells them apart
+    dataset = load(1)
+    os.utime(source, ns=(0, 0))
+    entry = cache.get(Q, dataset, name='val')
+    assert Q.encoded == 50
+    np.testing.assert_array_equal(entry.labels, make_dataset(25, 1).tensors[1].numpy())
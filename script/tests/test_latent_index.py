@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from aae.latent_index import BruteForceIndex, GridIndex
+
+
+def clouds(seed=0):
+    rng = np.random.RandomState(seed)
+    points = np.concatenate((rng.randn(2000, 2), rng.randn(500, 2) * 0.01 + 3.))
+    labels = rng.randint(0, 10, len(points))
+    # Near the data, in the dense cluster and far from everything
+    X = np.concatenate((rng.randn(300, 2), rng.randn(50, 2) * 0.01 + 3., rng.randn(20, 2) * 50.))
+    return points, labels, X
+
+
+@pytest.mark.parametrize('max_pairs', [1 << 22, 100])
+def test_grid_query_matches_brute_force(max_pairs):
+    points, labels, X = clouds()
+    grid = GridIndex(points, labels, chunk_size=64, max_pairs=max_pairs)
+    dist, idx = grid.query(X, k=5)
+    ref_dist, ref_idx = BruteForceIndex(points, labels).query(X, k=5)
+    np.testing.assert_allclose(dist, ref_dist, atol=1e-9)
+    # Same neighbours up to ties
+    np.testing.assert_allclose(np.sqrt(((points[idx] - X[:, None]) ** 2).sum(2)), ref_dist, atol=1e-9)
+    np.testing.assert_array_equal(grid.knn_classify(X, k=5)[0], BruteForceIndex(points, labels).knn_classify(X, k=5)[0])
+
+
+def test_grid_query_more_neighbours_than_points():
+    points = np.random.RandomState(0).rand(3, 2)
+    dist, idx = GridIndex(points).query(np.zeros((2, 2)), k=5)
+    assert (idx[:, 3:] == -1).all() and np.isinf(dist[:, 3:]).all()
+    assert sorted(idx[0, :3]) == [0, 1, 2]
+
+
+@pytest.mark.parametrize('radius', [0.05, 0.5, 100.])
+@pytest.mark.parametrize('max_pairs', [1 << 22, 100])
+def test_grid_query_radius_matches_brute_force(radius, max_pairs):
+    points, _, X = clouds()
+    indptr, indices, distances = GridIndex(points, chunk_size=64, max_pairs=max_pairs).query_radius(X, radius)
+    ref_indptr, ref_indices, _ = BruteForceIndex(points).query_radius(X, radius)
+    np.testing.assert_array_equal(indptr, ref_indptr)
+    for i in range(len(X)):
+        row = slice(indptr[i], indptr[i + 1])
+        assert sorted(indices[row]) == sorted(ref_indices[ref_indptr[i]:ref_indptr[i + 1]])
+        np.testing.assert_allclose(distances[row], np.sqrt(((points[indices[row]] - X[i]) ** 2).sum(1)))
+
+
+def test_grid_query_radius_without_queries():
+    indptr, indices, distances = GridIndex(np.random.RandomState(0).rand(10, 2)).query_radius(np.zeros((0, 2)), 1.)
+    assert list(indptr) == [0] and len(indices) == len(distances) == 0
@@ -0,0 +1,38 @@
+import csv
+
+from aae.metrics import CSVSink, MetricLogger
+
+
+def read_rows(filename):
+    with open(filename) as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames, list(reader)
+
+
+def test_csv_sink_widens_header(tmp_path):
+    filename = str(tmp_path / 'log.csv')
+    sink = CSVSink(filename)
+    sink.write({'epoch': 0, 'recon_loss': 0.5})
+    sink.write({'epoch': 1, 'recon_loss': 0.4, 'val_acc': 80.})
+    sink.write({'epoch': 2, 'recon_loss': 0.3})
+    sink.close()
+    fields, rows = read_rows(filename)
+    assert fields == ['epoch', 'recon_loss', 'val_acc']
+    assert [row['val_acc'] for row in rows] == ['', '80.0', '']
+    assert [row['recon_loss'] for row in rows] == ['0.5', '0.4', '0.3']
+
+
+def test_csv_sink_appends_to_existing_file(tmp_path):
+    filename = str(tmp_path / 'log.csv')
+    logger = MetricLogger(filename)
+    logger.write({'epoch': 0, 'recon_loss': 0.5})
+    logger.close()
+    # A resumed run keeps the header and widens it with the new keys
+    sink = CSVSink(filename)
+    sink.write({'epoch': 1, 'recon_loss': 0.4})
+    sink.write({'epoch': 2, 'recon_loss': 0.3, 'D_steps': 1})
+    sink.close()
+    fields, rows = read_rows(filename)
+    assert fields == ['epoch', 'recon_loss', 'D_steps']
+    assert [row['epoch'] for row in rows] == ['0', '1', '2']
+    assert [row['D_steps'] for row in rows] == ['', '', '1']
@@ -0,0 +1,36 @@
+import pytest
+import torch
+
+from aae.networks import P_net, check_labels
+from aae.style import StyleBank
+
+
+def test_conditional_matches_onehot_concatenation():
+    torch.manual_seed(0)
+    P = P_net(X_dim=16, N=8, z_dim=2, n_classes=3).eval()
+    z, labels = torch.randn(5, 2), torch.tensor([0, 2, 1, 1, 0])
+    onehot = torch.eye(3)[labels]
+    assert torch.allclose(P.conditional(z, labels), P(torch.cat((onehot, z), 1)), atol=1e-6)
+
+
+def test_conditional_asserts_on_labels_outside_the_classes():
+    P = P_net(X_dim=16, N=8, z_dim=2, n_classes=3)
+    for labels in ([-1, 0], [0, 3]):
+        with pytest.raises(RuntimeError):
+            P.conditional(torch.randn(2, 2), torch.tensor(labels))
+
+
+def test_check_labels():
+    check_labels(torch.tensor([0, 9]), 10)
+    check_labels(torch.zeros(0, dtype=torch.long), 10)
+    for labels in ([-1], [10]):
+        with pytest.raises(ValueError):
+            check_labels(torch.tensor(labels), 10)
+
+
+def test_style_bank_rejects_unlabeled_classes():
+    P = P_net(X_dim=16, N=8, z_dim=2, n_classes=3)
+    bank = StyleBank(None, P, {'n_classes': 3, 'z_dim': 2, 'cuda': False})
+    assert bank.decode(torch.randn(2, 2), torch.tensor([0, 2])).shape == (2, 16)
+    with pytest.raises(ValueError):
+        bank.decode(torch.randn(2, 2), torch.tensor([0, -1]))
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+import torch
+
+from aae import supervised
+from aae.config import default_params
+from aae.online import OnlineTrainer
+
+
+def failing_source(n_chunks):
+    for _ in range(n_chunks):
+        yield torch.rand(20, 784), torch.randint(0, 10, (20,))
+    raise IOError('source failed')
+
+
+def make_trainer(snapshot_dir):
+    params = default_params(N=16, train_batch_size=20, cuda=False)
+    nets = supervised.create_networks(params)
+    return OnlineTrainer(supervised, nets, supervised.create_solvers(nets), params, str(snapshot_dir),
+                         snapshot_every=100)
+
+
+def test_last_snapshot_after_source_error(tmp_path):
+    trainer = make_trainer(tmp_path)
+    with pytest.raises(IOError, match='source failed'):
+        trainer.run(failing_source(2))
+    assert trainer.step == 2
+    with open(os.path.join(str(tmp_path), 'latest')) as f:
+        assert f.read().strip() == 'step-0000000002'
+
+
+def test_snapshot_error_keeps_training_error(tmp_path, capsys):
+    # The snapshot directory is a file, so every snapshot write fails
+    snapshot_dir = tmp_path / 'snapshots'
+    snapshot_dir.write_text('')
+    trainer = make_trainer(snapshot_dir)
+    with pytest.raises(IOError, match='source failed'):
+        trainer.run(failing_source(2))
+    assert 'The last snapshot at step 2 failed' in capsys.readouterr().out
+
+
+def test_snapshot_error_after_training(tmp_path):
+    snapshot_dir = tmp_path / 'snapshots'
+    snapshot_dir.write_text('')
+    trainer = make_trainer(snapshot_dir)
+    with pytest.raises(OSError):
+        trainer.run(failing_source(2), max_steps=2)
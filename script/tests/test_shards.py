@@ -0,0 +1,109 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from aae.shards import ShardArray, ShardedDataset, read_manifest, sharded_loader, write_shards
+
+
+def write_digits(path, n=250, shard_size=60, labeled=True, seed=0):
+    rng = np.random.RandomState(seed)
+    images = rng.randint(0, 256, (n, 28, 28)).astype('uint8')
+    labels = rng.randint(0, 10, n) if labeled else None
+    # Uneven chunks, the shards are cut at shard_size anyway
+    chunks = [(images[:70], None if labels is None else labels[:70]),
+              (images[70:], None if labels is None else labels[70:])]
+    write_shards(chunks, path, shard_size)
+    return images, labels
+
+
+def batches(loader):
+    return [(X.clone(), target.clone()) for X, target in loader]
+
+
+def assert_same_batches(a, b):
+    assert len(a) == len(b)
+    for (X_a, t_a), (X_b, t_b) in zip(a, b):
+        assert torch.equal(X_a, X_b) and torch.equal(t_a, t_b)
+
+
+def test_write_shards(tmp_path):
+    path = str(tmp_path)
+    images, labels = write_digits(path)
+    manifest = read_manifest(path)
+    assert manifest['n_samples'] == 250 and manifest['sizes'] == [60, 60, 60, 60, 10]
+    assert not [f for f in os.listdir(path) if '.tmp' in f]
+    with open(os.path.join(path, 'manifest.json')) as f:
+        assert json.load(f) == manifest
+
+    samples = ShardArray(path)
+    assert len(samples) == 250
+    X, target = samples[123]
+    assert X.shape == (1, 28, 28) and target == labels[123]
+    assert torch.allclose(X * 0.3081 + 0.1307, torch.from_numpy(images[123] / 255.).float(), atol=1e-6)
+
+
+def test_unlabeled_shards(tmp_path):
+    write_digits(str(tmp_path), labeled=False)
+    assert {int(ShardArray(str(tmp_path))[i][1]) for i in range(250)} == {-1}
+
+
+def test_epochs_are_deterministic_and_shuffled(tmp_path):
+    path = str(tmp_path)
+    write_digits(path)
+    first, second = sharded_loader(path, 20, buffer_size=50), sharded_loader(path, 20, buffer_size=50)
+    epoch0 = batches(first)
+    assert_same_batches(epoch0, batches(second))
+    assert len(epoch0) == len(first) == 12
+    epoch1 = batches(first)
+    assert not all(torch.equal(t0, t1) for (_, t0), (_, t1) in zip(epoch0, epoch1))
+    # Every sample once, minus the partial last batch
+    seen = torch.cat([X for X, _ in epoch0]).view(240, -1)
+    assert len(torch.unique(seen, dim=0)) == 240
+
+
+@pytest.mark.parametrize('num_workers', [0, 2])
+def test_resume_within_an_epoch(tmp_path, num_workers):
+    path = str(tmp_path)
+    write_digits(path)
+    reference = sharded_loader(path, 20, buffer_size=50, num_workers=num_workers)
+    batches(reference)
+    expected = batches(reference)
+
+    loader = sharded_loader(path, 20, buffer_size=50, num_workers=num_workers)
+    batches(loader)
+    head = []
+    for batch in loader:
+        head.append(batch)
+        if len(head) == 5:
+            break
+    state = loader.state_dict()
+    assert state == {'epoch': 1, 'batches': 5}
+
+    resumed = sharded_loader(path, 20, buffer_size=50, num_workers=num_workers)
+    resumed.load_state_dict(state)
+    assert_same_batches(head + batches(resumed), expected)
+
+
+def test_state_of_a_pass_cut_short(tmp_path):
+    path = str(tmp_path)
+    write_digits(path)
+    loader = sharded_loader(path, 20)
+    for i, _ in zip(range(3), loader):
+        pass
+    assert loader.state_dict() == {'epoch': 0, 'batches': 3}
+    assert loader.state_dict(finished=True) == {'epoch': 1, 'batches': 0}
+
+    resumed = sharded_loader(path, 20)
+    resumed.load_state_dict(loader.state_dict(finished=True))
+    assert_same_batches(batches(resumed), batches(loader))
+
+
+def test_no_shuffle_reads_in_order(tmp_path):
+    path = str(tmp_path)
+    _, labels = write_digits(path)
+    dataset = ShardedDataset(path, 50, shuffle=False)
+    targets = torch.cat([target for _, target in dataset])
+    assert targets.tolist() == list(labels[:len(targets)])
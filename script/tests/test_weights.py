@@ -0,0 +1,76 @@
+import os
+
+import torch
+
+from aae import semisupervised
+from aae.config import default_params
+from aae.utils import WEIGHTS_FILE, load_networks, save_networks
+from aae.weights import load_weights, read_weights, save_weights
+
+
+def create_networks(seed):
+    torch.manual_seed(seed)
+    return semisupervised.create_networks(default_params(N=32, cuda=False))
+
+
+def assert_same_weights(nets, other):
+    for name, net in nets.items():
+        state = other[name].state_dict()
+        for key, tensor in net.state_dict().items():
+            assert torch.equal(tensor, state[key]), '{}.{}'.format(name, key)
+
+
+def test_round_trip(tmp_path):
+    nets = create_networks(0)
+    filename = str(tmp_path / 'nets.aaew')
+    save_weights(nets, filename)
+    loaded = load_weights(create_networks(1), filename)
+    assert_same_weights(nets, loaded)
+    for name, entry in read_weights(filename).items():
+        assert entry.data_ptr() % 64 == 0, name
+
+
+def test_copy_is_writable(tmp_path):
+    filename = str(tmp_path / 'nets.aaew')
+    save_weights(create_networks(0), filename)
+    nets = load_weights(create_networks(1), filename, copy=True)
+    with torch.no_grad():
+        for param in nets['Q'].parameters():
+            param.add_(1.)
+
+
+def test_overwrite_keeps_existing_mappings(tmp_path):
+    filename = str(tmp_path / 'nets.aaew')
+    old = create_networks(0)
+    save_weights(old, filename)
+    mapped = load_weights(create_networks(1), filename)
+    inode = os.stat(filename).st_ino
+
+    new = create_networks(2)
+    save_weights(new, filename)
+    assert os.stat(filename).st_ino != inode
+    assert not os.path.exists(filename + '.tmp')
+    assert_same_weights(old, mapped)
+    assert_same_weights(new, load_weights(create_networks(1), filename))
+
+
+def test_save_networks_without_mmap_removes_stale_file(tmp_path):
+    save_dir = str(tmp_path)
+    save_networks(create_networks(0), save_dir, mmap=True)
+    assert os.path.exists(os.path.join(save_dir, WEIGHTS_FILE))
+    nets = create_networks(2)
+    save_networks(nets, save_dir)
+    assert not os.path.exists(os.path.join(save_dir, WEIGHTS_FILE))
+    assert_same_weights(nets, load_networks(create_networks(1), save_dir, copy=False))
+
+
+def test_newer_pt_files_win(tmp_path):
+    save_dir = str(tmp_path)
+    save_networks(create_networks(0), save_dir, mmap=True)
+    weights_file = os.path.join(save_dir, WEIGHTS_FILE)
+    stat = os.stat(weights_file)
+    os.utime(weights_file, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 ** 9))
+    nets = create_networks(2)
+    for name, net in nets.items():
+        torch.save(net.state_dict(), os.path.join(save_dir, name + '.pt'))
+    assert_same_weights(nets, load_networks(create_networks(1), save_dir, copy=False))